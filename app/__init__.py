@@ -19,6 +19,21 @@ def create_app(config_name='default'):
     login_manager.login_message = 'يرجى تسجيل الدخول للوصول إلى هذه الصفحة.'
     login_manager.login_message_category = 'warning'
 
+    # Per-request SQL query counting and budgets
+    from app.services import query_stats
+    query_stats.init_app(app)
+
+    # Statistics cache backend (also registers its write invalidation listeners)
+    from app.services import stats_cache
+    stats_cache.init_app(app)
+
+    # Importing the rollups registers the listeners that keep report tables current
+    from app.services import rollups
+
+    # Live dashboard events (registers the listeners that publish changes)
+    from app.services import live_events
+    live_events.init_app(app)
+
     # Register blueprints
     from app.auth import bp as auth_bp
     app.register_blueprint(auth_bp, url_prefix='/auth')
@@ -38,10 +53,12 @@ def create_app(config_name='default'):
     app.register_blueprint(reports_bp, url_prefix='/reports')
 
 
+    # Importing the principal cache also registers its invalidation listener
+    from app.services.principal_cache import load_principal
+
     @login_manager.user_loader
     def load_user(user_id):
-        from app.models import User
-        return User.query.get(int(user_id))
+        return load_principal(int(user_id))
 
     # Add main routes (dashboard, etc.)
     from app import main
@@ -5,8 +5,12 @@ from flask_login import login_required, current_user
 from app.admin import bp
 from app.admin.forms import UserForm, ChangePasswordForm, RoleForm
 from app.models import User, Role, Permission
+from app.decorators import query_budget
+from app.services.pagination import keyset_paginate
+from app.services.query_stats import HISTOGRAM_BUCKETS, get_endpoint_stats, reset_endpoint_stats
 from app import db
 from functools import wraps
+from sqlalchemy.orm import joinedload
 
 def admin_required(f):
     """Decorator to require admin permissions"""
@@ -41,7 +45,9 @@ def dashboard():
     total_permissions = Permission.query.count()
     
     # Recent users
-    recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
+    recent_users = User.query.options(
+        joinedload(User.role)
+    ).order_by(User.created_at.desc()).limit(5).all()
     
     # Users by role
     roles_with_counts = db.session.query(
@@ -67,15 +73,15 @@ def dashboard():
 @bp.route('/users')
 @login_required
 @admin_required
+@query_budget(5)
 def users_list():
     """List all users"""
-    page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '').strip()
     role_filter = request.args.get('role', 0, type=int)
     status_filter = request.args.get('status', 'all')
     
-    # Base query
-    query = User.query
+    # Base query (role is shown on every row)
+    query = User.query.options(joinedload(User.role))
     
     # Apply search filter
     if search:
@@ -96,9 +102,10 @@ def users_list():
     elif status_filter == 'inactive':
         query = query.filter_by(is_active=False)
     
-    # Pagination
-    users = query.order_by(User.created_at.desc()).paginate(
-        page=page, per_page=20, error_out=False
+    # Pagination (newest first)
+    users = keyset_paginate(
+        query, (User.created_at, User.id), per_page=20,
+        after=request.args.get('after'), before=request.args.get('before')
     )
     
     # Get all roles for filter dropdown
@@ -364,8 +371,8 @@ def edit_role(role_id):
 
         selected_ids = form.get_selected_permissions()
 
-        # This line will now work because Permission is imported at the top
-        role.permissions = Permission.query.filter(Permission.id.in_(selected_ids)).all()
+        # Replacing the permission list also invalidates the compiled permission set
+        role.set_permissions(Permission.query.filter(Permission.id.in_(selected_ids)).all())
 
         try:
             db.session.commit()
@@ -452,4 +459,38 @@ def view_role(role_id):
         role=role,
         permissions_by_category=permissions_by_category,
         users=users
-    )
\ No newline at end of file
+    )
+
+
+# ============================================================================
+# SQL PERFORMANCE
+# ============================================================================
+
+@bp.route('/sql-stats')
+@login_required
+@admin_required
+def sql_stats():
+    """Per-endpoint query counts and timings of recent requests"""
+    if not current_user.can('admin.system_settings'):
+        flash('ليس لديك صلاحية لعرض إحصائيات الأداء.', 'danger')
+        return redirect(url_for('admin.dashboard'))
+
+    return render_template(
+        'admin/sql_stats.html',
+        endpoints=get_endpoint_stats(),
+        buckets=HISTOGRAM_BUCKETS
+    )
+
+
+@bp.route('/sql-stats/reset', methods=['POST'])
+@login_required
+@admin_required
+def reset_sql_stats():
+    """Clear the recorded request samples"""
+    if not current_user.can('admin.system_settings'):
+        flash('ليس لديك صلاحية لإعادة تعيين إحصائيات الأداء.', 'danger')
+        return redirect(url_for('admin.dashboard'))
+
+    reset_endpoint_stats()
+    flash('تم مسح إحصائيات الأداء.', 'success')
+    return redirect(url_for('admin.sql_stats'))
@@ -1,13 +1,22 @@
 from flask_wtf import FlaskForm
 from wtforms import SelectField, DateTimeLocalField, TextAreaField, SubmitField, HiddenField
 from wtforms.validators import DataRequired, Optional
-from app.models import Patient, User
+from app.models import User
+from app.patients.forms import PatientLookupField
 from app import db
 
+# Appointment lengths offered when booking (minutes, label)
+DURATION_CHOICES = [
+    (15, '15 دقيقة'),
+    (30, '30 دقيقة'),
+    (45, '45 دقيقة'),
+    (60, 'ساعة')
+]
+
+
 class AppointmentForm(FlaskForm):
-    patient_id = SelectField(
+    patient_id = PatientLookupField(
         'المريض',
-        coerce=int,
         validators=[DataRequired(message='يرجى اختيار المريض')]
     )
     
@@ -23,6 +32,13 @@ class AppointmentForm(FlaskForm):
         validators=[DataRequired(message='التاريخ والوقت مطلوبان')]
     )
     
+    duration_minutes = SelectField(
+        'مدة الموعد',
+        coerce=int,
+        choices=DURATION_CHOICES,
+        default=30
+    )
+    
     type = SelectField(
         'نوع الموعد',
         choices=[
@@ -42,12 +58,6 @@ class AppointmentForm(FlaskForm):
     def __init__(self, *args, **kwargs):
         super(AppointmentForm, self).__init__(*args, **kwargs)
         
-        # Populate patient choices
-        self.patient_id.choices = [(0, 'اختر المريض')] + [
-            (p.id, f'{p.full_name} - {p.file_number}')
-            for p in Patient.query.order_by(Patient.full_name).all()
-        ]
-        
         # Populate doctor choices (users with Doctor role)
         doctors = User.query.join(User.role).filter(
             db.or_(
@@ -77,6 +87,13 @@ class QuickAppointmentForm(FlaskForm):
         validators=[DataRequired(message='التاريخ والوقت مطلوبان')]
     )
     
+    duration_minutes = SelectField(
+        'مدة الموعد',
+        coerce=int,
+        choices=DURATION_CHOICES,
+        default=30
+    )
+    
     type = SelectField(
         'نوع الموعد',
         choices=[
@@ -1,46 +1,24 @@
-from flask import render_template, redirect, url_for, flash, request, jsonify
+from flask import render_template, redirect, url_for, flash, request, jsonify, current_app
 from flask_login import login_required, current_user
 from app.appointments import bp
-from app.appointments.forms import AppointmentForm, QuickAppointmentForm
+from app.appointments.forms import AppointmentForm, QuickAppointmentForm, DURATION_CHOICES
 from app.models import Appointment, Patient, User, AppointmentStatus
-from app.decorators import permission_required
+from app.decorators import permission_required, query_budget
 from app import db
-from datetime import datetime, timedelta
+from app.services.date_range import on_date_filter
+from app.services.pagination import keyset_paginate
+from app.services import scheduling
+from datetime import datetime, date
 from sqlalchemy import and_, Date
-
-def check_doctor_availability(doctor_id, date_time, exclude_appointment_id=None):
-    """
-    Check if doctor has conflicting appointments
-    Returns (is_available, conflicting_appointment)
-    """
-    # Check for appointments within 30 minutes window
-    time_window_start = date_time - timedelta(minutes=30)
-    time_window_end = date_time + timedelta(minutes=30)
-    
-    query = Appointment.query.filter(
-        Appointment.doctor_id == doctor_id,
-        Appointment.date_time.between(time_window_start, time_window_end),
-        Appointment.status.in_([
-            AppointmentStatus.pending,
-            AppointmentStatus.confirmed
-        ])
-    )
-    
-    # Exclude current appointment if editing
-    if exclude_appointment_id:
-        query = query.filter(Appointment.id != exclude_appointment_id)
-    
-    conflicting = query.first()
-    
-    return (conflicting is None, conflicting)
-
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload
 
 @bp.route('/')
 @login_required
 @permission_required('appointments', 'read')
+@query_budget(6)
 def list_appointments():
     """List all appointments with filters"""
-    page = request.args.get('page', 1, type=int)
     per_page = 20
     
     # Filter parameters
@@ -48,8 +26,11 @@ def list_appointments():
     doctor_filter = request.args.get('doctor_id', 0, type=int)
     date_filter = request.args.get('date', '')
     
-    # Base query
-    query = Appointment.query
+    # Base query (patient and doctor are shown on every row)
+    query = Appointment.query.options(
+        joinedload(Appointment.patient),
+        joinedload(Appointment.doctor)
+    )
     
     # Apply filters
     if status_filter != 'all':
@@ -61,13 +42,14 @@ def list_appointments():
     if date_filter:
         try:
             filter_date = datetime.strptime(date_filter, '%Y-%m-%d').date()
-            query = query.filter(db.func.cast(Appointment.date_time, Date) == filter_date)
+            query = query.filter(on_date_filter(Appointment.date_time, filter_date))
         except ValueError:
             pass
     
-    # Pagination
-    appointments = query.order_by(Appointment.date_time.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
+    # Pagination (newest first)
+    appointments = keyset_paginate(
+        query, (Appointment.date_time, Appointment.id), per_page=per_page,
+        after=request.args.get('after'), before=request.args.get('before')
     )
     
     # Get all doctors for filter dropdown
@@ -107,37 +89,28 @@ def book_appointment():
         ]
         
         if form.validate_on_submit():
-            # Check doctor availability
-            is_available, conflicting = check_doctor_availability(
-                form.doctor_id.data,
-                form.date_time.data
-            )
-            
-            if not is_available:
-                flash(
-                    f'الطبيب لديه موعد آخر في {conflicting.date_time.strftime("%Y-%m-%d %H:%M")}. '
-                    'يرجى اختيار وقت آخر.',
-                    'warning'
+            # Availability is checked and the appointment inserted under the
+            # doctor's booking lock, so concurrent bookings cannot overlap
+            try:
+                result = scheduling.book_appointment(
+                    patient_id=patient_id,
+                    doctor_id=form.doctor_id.data,
+                    date_time=form.date_time.data,
+                    duration_minutes=form.duration_minutes.data,
+                    appointment_type=form.type.data,
+                    notes=form.notes.data
                 )
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                flash('حدث خطأ أثناء الحجز. يرجى المحاولة مرة أخرى.', 'danger')
                 return render_template('appointments/book.html', form=form, patient=patient)
             
-            appointment = Appointment(
-                patient_id=patient_id,
-                doctor_id=form.doctor_id.data,
-                date_time=form.date_time.data,
-                type=form.type.data,
-                notes=form.notes.data,
-                status=AppointmentStatus.confirmed
-            )
+            if not result.ok:
+                flash(f'{result.message} يرجى اختيار وقت آخر.', 'warning')
+                return render_template('appointments/book.html', form=form, patient=patient)
             
-            try:
-                db.session.add(appointment)
-                db.session.commit()
-                flash('تم حجز الموعد بنجاح.', 'success')
-                return redirect(url_for('patients.view_patient', patient_id=patient_id))
-            except Exception as e:
-                db.session.rollback()
-                flash('حدث خطأ أثناء الحجز. يرجى المحاولة مرة أخرى.', 'danger')
+            flash('تم حجز الموعد بنجاح.', 'success')
+            return redirect(url_for('patients.view_patient', patient_id=patient_id))
         
         return render_template('appointments/book.html', form=form, patient=patient)
     
@@ -146,37 +119,28 @@ def book_appointment():
         form = AppointmentForm()
         
         if form.validate_on_submit():
-            # Check doctor availability
-            is_available, conflicting = check_doctor_availability(
-                form.doctor_id.data,
-                form.date_time.data
-            )
-            
-            if not is_available:
-                flash(
-                    f'الطبيب لديه موعد آخر في {conflicting.date_time.strftime("%Y-%m-%d %H:%M")}. '
-                    'يرجى اختيار وقت آخر.',
-                    'warning'
+            # Availability is checked and the appointment inserted under the
+            # doctor's booking lock, so concurrent bookings cannot overlap
+            try:
+                result = scheduling.book_appointment(
+                    patient_id=form.patient_id.data,
+                    doctor_id=form.doctor_id.data,
+                    date_time=form.date_time.data,
+                    duration_minutes=form.duration_minutes.data,
+                    appointment_type=form.type.data,
+                    notes=form.notes.data
                 )
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                flash('حدث خطأ أثناء الحجز. يرجى المحاولة مرة أخرى.', 'danger')
                 return render_template('appointments/book.html', form=form)
             
-            appointment = Appointment(
-                patient_id=form.patient_id.data,
-                doctor_id=form.doctor_id.data,
-                date_time=form.date_time.data,
-                type=form.type.data,
-                notes=form.notes.data,
-                status=AppointmentStatus.confirmed
-            )
+            if not result.ok:
+                flash(f'{result.message} يرجى اختيار وقت آخر.', 'warning')
+                return render_template('appointments/book.html', form=form)
             
-            try:
-                db.session.add(appointment)
-                db.session.commit()
-                flash('تم حجز الموعد بنجاح.', 'success')
-                return redirect(url_for('appointments.view_appointment', appointment_id=appointment.id))
-            except Exception as e:
-                db.session.rollback()
-                flash('حدث خطأ أثناء الحجز. يرجى المحاولة مرة أخرى.', 'danger')
+            flash('تم حجز الموعد بنجاح.', 'success')
+            return redirect(url_for('appointments.view_appointment', appointment_id=result.appointment_id))
         
         return render_template('appointments/book.html', form=form)
 
@@ -226,14 +190,131 @@ def check_availability():
     
     try:
         date_time = datetime.fromisoformat(date_time_str)
-        is_available, conflicting = check_doctor_availability(doctor_id, date_time)
+        duration = int(data.get('duration_minutes') or 0) or None
+        result = scheduling.check_booking(
+            int(doctor_id), date_time, duration, data.get('type', 'scheduled'), suggestions=3
+        )
         
-        if is_available:
+        if result.ok:
             return jsonify({'available': True})
         else:
-            return jsonify({
-                'available': False,
-                'message': f'الطبيب لديه موعد آخر في {conflicting.date_time.strftime("%Y-%m-%d %H:%M")}'
-            })
+            return jsonify({'available': False, **result.to_dict()})
     except Exception as e:
-        return jsonify({'available': False, 'message': 'حدث خطأ في التحقق'})
\ No newline at end of file
+        return jsonify({'available': False, 'message': 'حدث خطأ في التحقق'})
+
+
+@bp.route('/api/free-slots')
+@login_required
+@permission_required('appointments', 'read')
+def free_slots():
+    """
+    Next free slots of the given doctors (?doctor_id=, repeatable; all
+    active doctors when omitted), with ?duration=, ?count=, ?from= and
+    ?per_doctor=1 to list count slots for every doctor
+    """
+    doctors = scheduling.bookable_doctors()
+    
+    doctor_ids = request.args.getlist('doctor_id', type=int)
+    if doctor_ids:
+        doctors = doctors.filter(User.id.in_(doctor_ids))
+    names = {d.id: d.full_name_ar for d in doctors.all()}
+    
+    duration = min(max(request.args.get('duration', 0, type=int), 0), 8 * 60) or None
+    count = min(max(request.args.get('count', 5, type=int), 1), 50)
+    
+    not_before = datetime.now()
+    if request.args.get('from'):
+        try:
+            not_before = max(datetime.fromisoformat(request.args['from']), not_before)
+        except ValueError:
+            return jsonify({'error': 'صيغة التاريخ غير صحيحة'}), 400
+    
+    slots = scheduling.find_free_slots(
+        list(names), duration, count=count, not_before=not_before,
+        per_doctor=request.args.get('per_doctor') == '1'
+    )
+    
+    return jsonify({
+        'slots': [
+            {
+                'doctor_id': slot['doctor_id'],
+                'doctor_name': names[slot['doctor_id']],
+                'start': slot['start'].strftime('%Y-%m-%dT%H:%M'),
+                'end': slot['end'].strftime('%Y-%m-%dT%H:%M'),
+            }
+            for slot in slots
+        ]
+    })
+
+
+def _parse_until(value):
+    """End of a series: a date-only value (e.g. '2026-11-30') keeps that whole day"""
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        return datetime.fromisoformat(value)
+
+
+@bp.route('/api/series', methods=['POST'])
+@login_required
+@permission_required('appointments', 'write')
+def book_series():
+    """
+    Book a recurring series (follow-ups, dialysis, physiotherapy) in one
+    request. JSON: patient_id, doctor_id, duration_minutes, type, notes,
+    all_or_nothing, and either starts (list of date-times) or start with
+    frequency ('daily'/'weekly'), interval and count or until (at most
+    SERIES_MAX_OCCURRENCES either way). duration_minutes is one of the
+    booking form's durations. Returns the outcome of every occurrence.
+    """
+    data = request.get_json(silent=True) or {}
+    
+    try:
+        patient_id = int(data['patient_id'])
+        doctor_id = int(data['doctor_id'])
+        if data.get('starts'):
+            starts = [datetime.fromisoformat(start) for start in data['starts']]
+            max_occurrences = current_app.config.get('SERIES_MAX_OCCURRENCES', 52)
+            if len(starts) > max_occurrences:
+                raise ValueError(f'At most {max_occurrences} occurrences')
+        else:
+            starts = scheduling.expand_recurrence(
+                datetime.fromisoformat(data['start']),
+                frequency=data.get('frequency', 'weekly'),
+                interval=int(data.get('interval', 1)),
+                count=int(data['count']) if data.get('count') else None,
+                until=_parse_until(data['until']) if data.get('until') else None
+            )
+        duration = int(data.get('duration_minutes') or 0) or None
+        if duration is not None and duration not in dict(DURATION_CHOICES):
+            raise ValueError(f'Unsupported duration: {duration}')
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'بيانات غير كاملة أو غير صحيحة'}), 400
+    
+    if data.get('type', 'scheduled') not in ('scheduled', 'walk-in'):
+        return jsonify({'error': 'نوع الموعد غير صحيح'}), 400
+    if db.session.get(Patient, patient_id) is None or \
+            scheduling.bookable_doctors().filter(User.id == doctor_id).first() is None:
+        return jsonify({'error': 'المريض أو الطبيب غير موجود'}), 404
+    
+    try:
+        results = scheduling.book_series(
+            patient_id, doctor_id, starts, duration,
+            appointment_type=data.get('type', 'scheduled'),
+            notes=data.get('notes'),
+            all_or_nothing=bool(data.get('all_or_nothing'))
+        )
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return jsonify({'error': 'حدث خطأ أثناء الحجز. يرجى المحاولة مرة أخرى.'}), 500
+    
+    occurrences = [
+        {'start': start.strftime('%Y-%m-%dT%H:%M'), **result.to_dict()}
+        for start, result in zip(starts, results)
+    ]
+    booked = sum(1 for result in results if result.ok)
+    return jsonify({
+        'booked': booked,
+        'refused': len(results) - booked,
+        'occurrences': occurrences
+    }), 201 if booked else 409
@@ -2,7 +2,8 @@ from flask_wtf import FlaskForm
 from wtforms import StringField, DecimalField, SelectField, FieldList, FormField, \
     HiddenField, BooleanField, SubmitField, IntegerField
 from wtforms.validators import DataRequired, NumberRange, Optional, Length
-from app.models import Patient, Service, InvoiceStatus
+from app.models import Service, InvoiceStatus
+from app.patients.forms import PatientLookupField
 
 class ServiceForm(FlaskForm):
     name_ar = StringField(
@@ -49,9 +50,8 @@ class InvoiceItemForm(FlaskForm):
 
 
 class CreateInvoiceForm(FlaskForm):
-    patient_id = SelectField(
+    patient_id = PatientLookupField(
         'المريض',
-        coerce=int,
         validators=[DataRequired(message='يرجى اختيار المريض')]
     )
     
@@ -68,13 +68,6 @@ class CreateInvoiceForm(FlaskForm):
     def __init__(self, *args, **kwargs):
         super(CreateInvoiceForm, self).__init__(*args, **kwargs)
         
-        # Populate patient choices
-        patients = Patient.query.order_by(Patient.full_name).all()
-        self.patient_id.choices = [(0, 'اختر المريض')] + [
-            (p.id, f'{p.full_name} - {p.file_number}')
-            for p in patients
-        ]
-        
         # Populate service choices for all item forms
         services = Service.query.filter_by(is_active=True).order_by(Service.name_ar).all()
         service_choices = [(0, 'اختر الخدمة')] + [
@@ -1,15 +1,19 @@
 
 
-from flask import render_template, redirect, url_for, flash, request, make_response
+from flask import render_template, redirect, url_for, flash, request, make_response, jsonify
 from flask_login import login_required, current_user
 from app.billing import bp
 from app.billing.forms import ServiceForm, CreateInvoiceForm, PaymentForm
-from app.models import Service, Invoice, InvoiceItem, Patient, InvoiceStatus
-from app.decorators import role_required, permission_required
+from app.models import Service, Invoice, Patient, InvoiceStatus
+from app.decorators import role_required, permission_required, query_budget
+from app.services import invoicing
+from app.services.pagination import keyset_paginate
+from app.services.patient_search import search_filter as patient_search_filter
+from app.services.stats_service import StatsService
 from app import db
 from datetime import datetime
-from decimal import Decimal
-from sqlalchemy import func, desc, cast, String
+from sqlalchemy import cast, String
+from sqlalchemy.orm import joinedload
 
 # ============================================================================
 # SERVICE MANAGEMENT
@@ -107,14 +111,14 @@ def toggle_service(service_id):
 @bp.route('/invoices')
 @login_required
 @permission_required('billing', 'read')
+@query_budget(6)
 def invoices_list():
     """List all invoices with filters"""
-    page = request.args.get('page', 1, type=int)
     status_filter = request.args.get('status', 'all')
     search_query = request.args.get('search', '').strip()
     
-    # Base query
-    query = Invoice.query
+    # Base query (patient is shown on every row)
+    query = Invoice.query.options(joinedload(Invoice.patient))
     
     # Apply status filter
     if status_filter != 'all':
@@ -124,41 +128,30 @@ def invoices_list():
     if search_query:
         query = query.join(Patient).filter(
             db.or_(
-                Patient.full_name.ilike(f'%{search_query}%'),
-                Patient.file_number.ilike(f'%{search_query}%'),
+                patient_search_filter(search_query),
                 cast(Invoice.id, String).ilike(f'%{search_query}%')
             )
         )
     
-    # Pagination
-    invoices = query.order_by(desc(Invoice.created_at)).paginate(
-        page=page, per_page=20, error_out=False
+    # Pagination (newest first)
+    invoices = keyset_paginate(
+        query, (Invoice.created_at, Invoice.id), per_page=20,
+        after=request.args.get('after'), before=request.args.get('before')
     )
     
-    # Statistics
-    total_unpaid = Invoice.query.filter_by(status=InvoiceStatus.unpaid).count()
-    total_paid = Invoice.query.filter_by(status=InvoiceStatus.paid).count()
-    total_insurance = Invoice.query.filter_by(status=InvoiceStatus.insurance_pending).count()
-    
-    # Revenue statistics
-    total_revenue = db.session.query(func.sum(Invoice.total_amount)).filter_by(
-        status=InvoiceStatus.paid
-    ).scalar() or Decimal('0')
-    
-    pending_amount = db.session.query(func.sum(Invoice.total_amount)).filter_by(
-        status=InvoiceStatus.unpaid
-    ).scalar() or Decimal('0')
+    # Statistics (counts and amounts per status, one cached query)
+    summary = StatsService.get_invoice_summary()
     
     return render_template(
         'billing/invoices_list.html',
         invoices=invoices,
         status_filter=status_filter,
         search_query=search_query,
-        total_unpaid=total_unpaid,
-        total_paid=total_paid,
-        total_insurance=total_insurance,
-        total_revenue=total_revenue,
-        pending_amount=pending_amount
+        total_unpaid=summary['unpaid']['count'],
+        total_paid=summary['paid']['count'],
+        total_insurance=summary['insurance_pending']['count'],
+        total_revenue=summary['paid']['amount'],
+        pending_amount=summary['unpaid']['amount']
     )
 
 
@@ -172,53 +165,18 @@ def create_invoice():
     if form.validate_on_submit():
         patient_id = form.patient_id.data
         
-        # Validate at least one service
-        valid_items = [item for item in form.services.data if item['service_id'] > 0]
-        if not valid_items:
-            flash('يجب إضافة خدمة واحدة على الأقل.', 'warning')
-            return render_template('billing/create_invoice.html', form=form)
-        
-        # Calculate total
-        total_amount = Decimal('0')
-        invoice_items = []
-        
-        for item_data in valid_items:
-            service = Service.query.get(item_data['service_id'])
-            if service:
-                quantity = item_data['quantity']
-                item_cost = service.cost_sdg * quantity
-                total_amount += item_cost
-                
-                invoice_items.append({
-                    'service_name': service.name_ar,
-                    'cost': service.cost_sdg,
-                    'quantity': quantity
-                })
-        
-        # Create invoice
-        invoice = Invoice(
-            patient_id=patient_id,
-            total_amount=total_amount,
-            status=InvoiceStatus.unpaid
-        )
+        lines = [
+            {'service_id': item['service_id'], 'quantity': item['quantity']}
+            for item in form.services.data if item['service_id'] > 0
+        ]
         
         try:
-            db.session.add(invoice)
-            db.session.flush()  # Get invoice ID
-            
-            # Create invoice items
-            for item_data in invoice_items:
-                invoice_item = InvoiceItem(
-                    invoice_id=invoice.id,
-                    service_name=item_data['service_name'],
-                    cost=item_data['cost'],
-                    quantity=item_data['quantity']
-                )
-                db.session.add(invoice_item)
-            
-            db.session.commit()
-            flash(f'تم إنشاء الفاتورة #{invoice.id} بنجاح. المبلغ الإجمالي: {float(total_amount):.2f} ج.س', 'success')
+            invoice, items = invoicing.create_invoice(patient_id, lines)
+            flash(f'تم إنشاء الفاتورة #{invoice.id} بنجاح. المبلغ الإجمالي: {float(invoice.total_amount):.2f} ج.س', 'success')
             return redirect(url_for('billing.invoice_detail', invoice_id=invoice.id))
+        except ValueError as e:
+            db.session.rollback()
+            flash(str(e), 'warning')
         except Exception as e:
             db.session.rollback()
             flash('حدث خطأ أثناء إنشاء الفاتورة. يرجى المحاولة مرة أخرى.', 'danger')
@@ -230,6 +188,41 @@ def create_invoice():
     return render_template('billing/create_invoice.html', form=form, services_data=services_data)
 
 
+
+@bp.route('/api/invoices', methods=['POST'])
+@login_required
+@permission_required('billing', 'write')
+def api_create_invoice():
+    """
+    Create an invoice from JSON: patient_id and items, a list of
+    {service_id, quantity}. Returns the invoice with its items and totals
+    (amounts as strings).
+    """
+    data = request.get_json(silent=True) or {}
+    
+    try:
+        patient_id = int(data['patient_id'])
+        lines = [
+            {'service_id': int(item['service_id']), 'quantity': int(item.get('quantity', 1))}
+            for item in data['items']
+        ]
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return jsonify({'error': 'بيانات غير كاملة أو غير صحيحة'}), 400
+    
+    if db.session.get(Patient, patient_id) is None:
+        return jsonify({'error': 'المريض غير موجود'}), 404
+    
+    try:
+        invoice, items = invoicing.create_invoice(patient_id, lines)
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'حدث خطأ أثناء إنشاء الفاتورة. يرجى المحاولة مرة أخرى.'}), 500
+    
+    return jsonify(invoicing.invoice_to_dict(invoice, items)), 201
+
 @bp.route('/invoices/<int:invoice_id>')
 @login_required
 @permission_required('billing', 'read')
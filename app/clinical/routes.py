@@ -3,7 +3,8 @@ from flask_login import login_required, current_user
 from app.clinical import bp
 from app.clinical.forms import MedicalVisitForm
 from app.models import Appointment, MedicalVisit, Patient, AppointmentStatus
-from app.decorators import role_required
+from app.decorators import role_required, query_budget
+from app.services.doctor_dashboard import get_doctor_dashboard
 from app import db
 from datetime import datetime, date
 from sqlalchemy import func, desc
@@ -11,60 +12,18 @@ from sqlalchemy import func, desc
 @bp.route('/doctor/dashboard')
 @login_required
 @role_required('Doctor', 'Super Admin')
+@query_budget(3)
 def doctor_dashboard():
     """Doctor's personalized dashboard showing their appointments"""
-    
-    today = date.today()
-    
-    # Get doctor's appointments for today
-    if current_user.role.name == 'Super Admin':
-        # Super Admin can see all appointments
-        todays_appointments = Appointment.query.filter(
-            func.date(Appointment.date_time) == today
-        ).order_by(Appointment.date_time).all()
-        
-        pending_appointments = Appointment.query.filter(
-            Appointment.status.in_([AppointmentStatus.pending, AppointmentStatus.confirmed])
-        ).count()
-    else:
-        # Regular doctors see only their appointments
-        todays_appointments = Appointment.query.filter(
-            Appointment.doctor_id == current_user.id,
-            func.date(Appointment.date_time) == today
-        ).order_by(Appointment.date_time).all()
-        
-        pending_appointments = Appointment.query.filter(
-            Appointment.doctor_id == current_user.id,
-            Appointment.status.in_([AppointmentStatus.pending, AppointmentStatus.confirmed])
-        ).count()
-    
-    # Upcoming appointments (next 7 days, excluding today)
-    upcoming_appointments = Appointment.query.filter(
-        Appointment.doctor_id == current_user.id,
-        Appointment.date_time > datetime.now(),
-        func.date(Appointment.date_time) > today,
-        Appointment.status.in_([AppointmentStatus.pending, AppointmentStatus.confirmed])
-    ).order_by(Appointment.date_time).limit(10).all()
-    
-    # Recent completed visits
-    recent_visits = MedicalVisit.query.filter(
-        MedicalVisit.doctor_id == current_user.id
-    ).order_by(desc(MedicalVisit.created_at)).limit(5).all()
-    
-    # Statistics
-    completed_today = sum(1 for appt in todays_appointments if appt.status == AppointmentStatus.completed)
-    total_today = len(todays_appointments)
-    
-    return render_template(
-        'clinical/doctor_dashboard.html',
-        todays_appointments=todays_appointments,
-        upcoming_appointments=upcoming_appointments,
-        recent_visits=recent_visits,
-        pending_appointments=pending_appointments,
-        completed_today=completed_today,
-        total_today=total_today
+
+    # Super Admin sees today's appointments of all doctors
+    data = get_doctor_dashboard(
+        current_user.id,
+        all_doctors=current_user.role.name == 'Super Admin'
     )
 
+    return render_template('clinical/doctor_dashboard.html', **data)
+
 
 @bp.route('/doctor/visit/<int:appointment_id>', methods=['GET', 'POST'])
 @login_required
@@ -1,5 +1,7 @@
+import hashlib
+from datetime import date
 from functools import wraps
-from flask import flash, redirect, url_for
+from flask import flash, redirect, url_for, request, current_app, make_response
 from flask_login import current_user
 
 def role_required(*role_names):
@@ -43,4 +45,49 @@ def permission_required(resource, action):
             
             return f(*args, **kwargs)
         return decorated_function
-    return decorator
\ No newline at end of file
+    return decorator
+
+
+def query_budget(max_queries):
+    """
+    Declare the maximum number of SQL queries a view may issue per request.
+    Place it directly above the view function. Exceeding the budget logs a
+    warning, or raises when QUERY_BUDGET_ENFORCED is set (testing).
+    """
+    def decorator(f):
+        f.query_budget = max_queries
+        return f
+    return decorator
+
+
+def conditional_json(version, max_age=None):
+    """
+    Answer conditional GETs for a JSON view.
+
+    version() returns a cheap token describing the data the view reads
+    (see app.services.data_version). It is combined with the view, its
+    arguments and today's date into an ETag; a request whose If-None-Match
+    matches gets a 304 before the view runs. max_age (seconds, defaults to
+    JSON_CACHE_MAX_AGE) is how long browsers may reuse the response
+    without revalidating.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            token = repr((f.__module__, f.__name__, kwargs, request.query_string, date.today(), version()))
+            etag = hashlib.sha1(token.encode('utf-8')).hexdigest()
+
+            if request.if_none_match.contains_weak(etag):
+                response = make_response('', 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+
+            response.set_etag(etag, weak=True)
+            response.cache_control.private = True
+            response.cache_control.max_age = (
+                current_app.config.get('JSON_CACHE_MAX_AGE', 0) if max_age is None else max_age
+            )
+            response.cache_control.must_revalidate = True
+            return response
+        return decorated_function
+    return decorator
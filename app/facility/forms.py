@@ -1,13 +1,13 @@
 from flask_wtf import FlaskForm
 from wtforms import SelectField, TextAreaField, DateTimeLocalField, SubmitField, HiddenField
 from wtforms.validators import DataRequired, Optional
-from app.models import Patient, Bed, BedStatus
+from app.models import Bed, BedStatus
+from app.patients.forms import PatientLookupField
 from datetime import datetime
 
 class AdmitPatientForm(FlaskForm):
-    patient_id = SelectField(
+    patient_id = PatientLookupField(
         'المريض',
-        coerce=int,
         validators=[DataRequired(message='يرجى اختيار المريض')]
     )
     
@@ -35,21 +35,8 @@ class AdmitPatientForm(FlaskForm):
     def __init__(self, *args, **kwargs):
         super(AdmitPatientForm, self).__init__(*args, **kwargs)
         
-        # Get patients without active admissions
-        from sqlalchemy import and_
-        from app.models import Admission, AdmissionStatus
-        
-        active_patient_ids = [adm.patient_id for adm in 
-            Admission.query.filter_by(status=AdmissionStatus.active).all()]
-        
-        available_patients = Patient.query.filter(
-            ~Patient.id.in_(active_patient_ids)
-        ).order_by(Patient.full_name).all()
-        
-        self.patient_id.choices = [(0, 'اختر المريض')] + [
-            (p.id, f'{p.full_name} - {p.file_number}')
-            for p in available_patients
-        ]
+        # Patients are looked up on demand; patients with an active
+        # admission are rejected by the admit_patient route.
         
         # Get available beds only
         available_beds = Bed.query.filter_by(status=BedStatus.available).order_by(
@@ -3,14 +3,17 @@ from flask_login import login_required, current_user
 from app.facility import bp
 from app.facility.forms import AdmitPatientForm, DischargePatientForm, BedStatusForm
 from app.models import Bed, Admission, Patient, BedStatus, AdmissionStatus
-from app.decorators import role_required, permission_required
+from app.decorators import role_required, permission_required, query_budget
+from app.services.pagination import keyset_paginate
 from app import db
 from datetime import datetime
 from sqlalchemy import func, and_
+from sqlalchemy.orm import joinedload
 
 @bp.route('/beds')
 @login_required
 @role_required('Nurse', 'Super Admin', 'Reception')
+@query_budget(5)
 def beds_list():
     """View all beds with their current status"""
     
@@ -30,7 +33,9 @@ def beds_list():
     maintenance_beds = sum(1 for b in all_beds if b.status == BedStatus.maintenance)
     
     # Get current admissions for occupied beds
-    active_admissions = Admission.query.filter_by(status=AdmissionStatus.active).all()
+    active_admissions = Admission.query.options(
+        joinedload(Admission.patient)
+    ).filter_by(status=AdmissionStatus.active).all()
     admission_map = {adm.bed_id: adm for adm in active_admissions}
     
     return render_template(
@@ -110,14 +115,17 @@ def change_bed_status(bed_id):
 @bp.route('/admissions')
 @login_required
 @role_required('Nurse', 'Super Admin', 'Doctor', 'Reception')
+@query_budget(7)
 def admissions_list():
     """View all admissions with filters"""
     
-    page = request.args.get('page', 1, type=int)
     status_filter = request.args.get('status', 'active')
     
-    # Base query
-    query = Admission.query
+    # Base query (bed and patient are shown on every row)
+    query = Admission.query.options(
+        joinedload(Admission.bed),
+        joinedload(Admission.patient)
+    )
     
     # Apply status filter
     if status_filter == 'active':
@@ -125,9 +133,10 @@ def admissions_list():
     elif status_filter == 'discharged':
         query = query.filter_by(status=AdmissionStatus.discharged)
     
-    # Pagination
-    admissions = query.order_by(Admission.admission_date.desc()).paginate(
-        page=page, per_page=20, error_out=False
+    # Pagination (newest first)
+    admissions = keyset_paginate(
+        query, (Admission.admission_date, Admission.id), per_page=20,
+        after=request.args.get('after'), before=request.args.get('before')
     )
     
     # Statistics
@@ -1,60 +1,28 @@
-from flask import Blueprint, render_template, redirect, url_for
+import json
+import queue
+import time
+from flask import Blueprint, render_template, redirect, url_for, request, current_app, abort, Response
 from flask_login import login_required, current_user
-from app.models import Patient, Appointment, User, AppointmentStatus
+from app.models import Patient, Appointment
 from datetime import datetime, timedelta
-from sqlalchemy import func, Date
+from app.services.date_range import on_date_filter
+from app.services import live_events
+from app.services.stats_service import StatsService
+from app.decorators import query_budget
+from sqlalchemy.orm import joinedload
 bp = Blueprint('main', __name__)
 @bp.route('/')
 @login_required
+@query_budget(5)
 def dashboard():
-    # Get today's date
-    today = datetime.now().date()
-
-    # Statistics
-    total_patients = Patient.query.count()
-
-    today_appointments = Appointment.query.filter(
-        func.cast(Appointment.date_time, Date) == today
-    ).count()
-
-    pending_appointments = Appointment.query.filter(
-        Appointment.status == AppointmentStatus.pending
-    ).count()
-
-    # Recent patients (last 5)
-    recent_patients = Patient.query.order_by(
-        Patient.created_at.desc()
-    ).limit(5).all()
-
-    # Today's appointments
-    todays_appointments = Appointment.query.filter(
-        func.cast(Appointment.date_time, Date) == today
-    ).order_by(Appointment.date_time).all()
-
-    # Doctor-specific view
-    if current_user.role.name == 'Doctor':
-        todays_appointments = [
-            appt for appt in todays_appointments
-            if appt.doctor_id == current_user.id
-        ]
-
-    # Redirect doctors to their specialized dashboard
+    # Doctors have their own dashboard; decide before loading anything
     if current_user.role.name == 'Doctor':
         return redirect(url_for('clinical.doctor_dashboard'))
 
-    # Get today's date
     today = datetime.now().date()
 
-    # Statistics
-    total_patients = Patient.query.count()
-
-    today_appointments = Appointment.query.filter(
-        func.cast(Appointment.date_time, Date) == today
-    ).count()
-
-    pending_appointments = Appointment.query.filter(
-        Appointment.status == AppointmentStatus.pending
-    ).count()
+    # Statistics (one query, briefly cached)
+    counters = StatsService.get_home_counters()
 
     # Recent patients (last 5)
     recent_patients = Patient.query.order_by(
@@ -62,15 +30,76 @@ def dashboard():
     ).limit(5).all()
 
     # Today's appointments
-    todays_appointments = Appointment.query.filter(
-        func.cast(Appointment.date_time, Date) == today
+    todays_appointments = Appointment.query.options(
+        joinedload(Appointment.patient),
+        joinedload(Appointment.doctor)
+    ).filter(
+        on_date_filter(Appointment.date_time, today)
     ).order_by(Appointment.date_time).all()
 
     return render_template(
         'dashboard.html',
-        total_patients=total_patients,
-        today_appointments=today_appointments,
-        pending_appointments=pending_appointments,
+        total_patients=counters['total_patients'],
+        today_appointments=counters['today_appointments'],
+        pending_appointments=counters['pending_appointments'],
         recent_patients=recent_patients,
         todays_appointments=todays_appointments
     )
+
+
+@bp.route('/events')
+@login_required
+def live_events_stream():
+    """
+    Server-sent events with the appointment, bed, invoice and patient
+    changes the dashboards apply to their counters.
+
+    Pages pass the cursor they were rendered at (?since=), and browsers send
+    Last-Event-ID when reconnecting, so no change in between is missed; on
+    PostgreSQL the cursor may come from any worker process. A 'resync' event
+    tells the page it has to reload instead (the cursor cannot be placed).
+    Each stream ends after LIVE_EVENTS_STREAM_SECONDS and the browser
+    reconnects. Disabled unless LIVE_EVENTS_ENABLED, see config.
+    """
+    if not live_events.is_enabled():
+        abort(404)
+
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    hidden = live_events.hidden_types(current_user)
+    heartbeat = current_app.config.get('LIVE_EVENTS_HEARTBEAT', 15)
+    duration = current_app.config.get('LIVE_EVENTS_STREAM_SECONDS', 300)
+    subscription, backlog = live_events.subscribe(since)
+
+    def message(event_id, payload):
+        return f'id: {event_id}\nevent: {payload["type"]}\ndata: {json.dumps(payload)}\n\n'
+
+    # Runs after the request context is gone: no database access in here
+    def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            if backlog is None:
+                yield 'event: resync\ndata: {}\n\n'
+                return
+            for event_id, payload in backlog:
+                if payload['type'] not in hidden:
+                    yield message(event_id, payload)
+
+            deadline = time.monotonic() + duration
+            while time.monotonic() < deadline:
+                if subscription.overflowed:
+                    yield 'event: resync\ndata: {}\n\n'
+                    return
+                try:
+                    event_id, payload = subscription.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if payload['type'] not in hidden:
+                    yield message(event_id, payload)
+        finally:
+            live_events.unsubscribe(subscription)
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
@@ -109,7 +109,7 @@ def seed_permissions():
         role = Role.query.filter_by(name=role_name).first()
         if role:
             # Clear existing permissions
-            role.permissions = []
+            role.set_permissions([])
 
             # Assign new permissions
             for slug in permission_slugs:
@@ -129,6 +129,8 @@ def seed_db():
     click.echo('🌱 Starting database seeding...')
 
     # Create all tables
+    from app.services.indexes import ensure_extensions
+    ensure_extensions()
     db.create_all()
     click.echo('✓ Tables created')
 
@@ -211,7 +213,9 @@ def init_db():
     '''Initialize the database (drop and recreate all tables)'''
     click.echo('⚠️  This will DROP all existing tables!')
     if click.confirm('Are you sure?'):
+        from app.services.indexes import ensure_extensions
         db.drop_all()
+        ensure_extensions()
         db.create_all()
         click.echo('✓ Database initialized')
         click.echo('Run "flask seed-db" to populate with initial data')
@@ -293,5 +297,299 @@ def test_stats():
     click.echo('✅ Statistics service is working correctly!')
 
 
+@app.cli.command()
+@click.option('--rows', default=1000000, help='Synthetic appointments to seed (rolled back afterwards)')
+def benchmark_date_filters(rows):
+    '''Compare query plans of DATE-cast and half-open range date filters'''
+    from datetime import date
+    from sqlalchemy import func, Date, text
+    from app.models import Appointment, Patient
+    from app.services.date_range import on_date_filter
+    from app.services.indexes import explain
+
+    patient = Patient.query.first()
+    doctor = User.query.first()
+    if not patient or not doctor:
+        click.echo('✖ At least one patient and one user are required to seed appointments')
+        return
+
+    click.echo(f'🌱 Seeding {rows} synthetic appointments (inside a transaction)...')
+    db.session.execute(text("""
+        INSERT INTO appointments (patient_id, doctor_id, date_time, duration_minutes, status, type, created_at)
+        SELECT :patient_id, :doctor_id, now() - (g * interval '1 minute'), 30, 'completed', 'scheduled', now()
+        FROM generate_series(1, :rows) AS g
+    """), {'patient_id': patient.id, 'doctor_id': doctor.id, 'rows': rows})
+    db.session.execute(text('ANALYZE appointments'))
+
+    today = date.today()
+    variants = [
+        ('CAST(date_time AS DATE) = today', func.cast(Appointment.date_time, Date) == today),
+        ('date_time >= today AND date_time < tomorrow', on_date_filter(Appointment.date_time, today)),
+    ]
+
+    try:
+        for label, criterion in variants:
+            statement = db.select(func.count(Appointment.id)).where(criterion)
+            click.echo('=' * 60)
+            click.echo(label)
+            click.echo('=' * 60)
+            for line in explain(statement):
+                click.echo(line)
+            click.echo('')
+    finally:
+        db.session.rollback()
+        click.echo('✓ Synthetic rows rolled back')
+
+
+
+@app.cli.command()
+@click.option('--username', default='admin', help='User the dashboard is loaded as')
+@click.option('--loads', default=20, help='Number of dashboard loads')
+def benchmark_dashboard(username, loads):
+    '''Count SQL queries and time per main dashboard load'''
+    import time
+    from sqlalchemy import event
+    from app.services import stats_cache
+
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        click.echo(f'✖ User {username} not found')
+        return
+    db.session.remove()
+
+    queries = []
+    def count_query(*args):
+        queries.append(1)
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+
+    stats_cache.clear()
+    event.listen(db.engine, 'before_cursor_execute', count_query)
+    try:
+        results = []
+        for _ in range(loads):
+            queries.clear()
+            started = time.perf_counter()
+            response = client.get('/')
+            results.append((len(queries), (time.perf_counter() - started) * 1000))
+            if response.status_code not in (200, 302):
+                raise click.ClickException(f'Dashboard returned {response.status_code}')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count_query)
+
+    cold_queries, cold_ms = results[0]
+    warm = results[1:] or results
+    click.echo(f'Dashboard as {username} ({response.status_code}), {loads} loads')
+    click.echo(f'  first load: {cold_queries} queries, {cold_ms:.1f} ms')
+    click.echo(f'  later loads: {sum(q for q, _ in warm) / len(warm):.1f} queries, '
+               f'{sum(ms for _, ms in warm) / len(warm):.1f} ms on average')
+
+    budget = app.view_functions['main.dashboard'].query_budget
+    if max(q for q, _ in results) > budget:
+        raise click.ClickException(f'Dashboard exceeded its budget of {budget} queries')
+    click.echo(f'\n✅ Within the budget of {budget} queries per load')
+
+
+@app.cli.command()
+@click.option('--bookings', default=400, help='Booking attempts')
+@click.option('--threads', default=8, help='Concurrent booking threads (keep below the pool size)')
+@click.option('--doctors', default=3, help='Doctors the attempts are spread over')
+@click.option('--keep', is_flag=True, help='Keep the booked appointments')
+def benchmark_booking(bookings, threads, doctors, keep):
+    '''Fire concurrent bookings and verify that none overlap'''
+    import random
+    import threading
+    import time
+    import uuid
+    from collections import Counter
+    from datetime import date, datetime, timedelta
+    from sqlalchemy import text
+    from app.models import Appointment, Patient
+    from app.services import scheduling
+
+    doctor_ids = [d.id for d in User.query.join(User.role).filter(
+        db.text("roles.name IN ('Doctor', 'Super Admin')")
+    ).filter(User.is_active == True).order_by(User.id).limit(doctors)]
+    patient = Patient.query.order_by(Patient.id).first()
+    if not doctor_ids or not patient:
+        click.echo('✖ At least one doctor and one patient are required')
+        return
+    patient_id = patient.id
+    db.session.remove()
+
+    # One day a year ahead, 15-minute starts over 8 hours: attempts collide often
+    day = datetime.combine(date.today() + timedelta(days=365), datetime.min.time()) + timedelta(hours=8)
+    marker = f'benchmark:{uuid.uuid4().hex[:8]}'
+    attempts = [
+        (random.choice(doctor_ids), day + timedelta(minutes=15 * random.randrange(32)), random.choice((15, 30, 45, 60)))
+        for _ in range(bookings)
+    ]
+
+    outcomes = Counter()
+    outcomes_lock = threading.Lock()
+
+    def worker(chunk):
+        with app.app_context():
+            for doctor_id, start, duration in chunk:
+                try:
+                    # Walk-ins skip the working hours check, so attempts only contend on overlaps
+                    result = scheduling.book_appointment(
+                        patient_id, doctor_id, start, duration,
+                        appointment_type='walk-in', notes=marker, suggestions=0
+                    )
+                    outcome = 'booked' if result.ok else result.reason
+                    if not result.ok:
+                        # Release the doctor's lock before the next attempt
+                        db.session.rollback()
+                except Exception:
+                    db.session.rollback()
+                    outcome = 'error'
+                with outcomes_lock:
+                    outcomes[outcome] += 1
+            db.session.remove()
+
+    click.echo(f'📅 {bookings} bookings over {len(doctor_ids)} doctors with {threads} threads...')
+    workers = [threading.Thread(target=worker, args=(attempts[i::threads],)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    overlaps = db.session.execute(text("""
+        SELECT count(*)
+        FROM appointments a
+        JOIN appointments b ON b.doctor_id = a.doctor_id AND b.id > a.id
+        WHERE (a.notes = :marker OR b.notes = :marker)
+          AND a.status IN ('pending', 'confirmed') AND b.status IN ('pending', 'confirmed')
+          AND tsrange(a.date_time, a.date_time + a.duration_minutes * interval '1 minute')
+              && tsrange(b.date_time, b.date_time + b.duration_minutes * interval '1 minute')
+    """), {'marker': marker}).scalar()
+
+    click.echo(f'  booked: {outcomes["booked"]}, refused (overlap): {outcomes[scheduling.CONFLICT_OVERLAP]}, '
+               f'errors: {outcomes["error"]}')
+    click.echo(f'  {elapsed:.2f} s, {bookings / elapsed:.0f} attempts/s')
+    click.echo(f'  overlapping open appointments: {overlaps}')
+
+    if not keep:
+        # Through the session, so the rollups and dashboard caches follow
+        for appointment in Appointment.query.filter(Appointment.notes == marker):
+            db.session.delete(appointment)
+        db.session.commit()
+        click.echo('✓ Benchmark appointments removed')
+
+    if overlaps or outcomes['error']:
+        raise click.ClickException('Concurrent bookings produced overlaps or errors')
+    click.echo('\n✅ No overlapping bookings')
+
+@app.cli.command()
+def ensure_indexes():
+    '''Create missing composite and partial indexes declared on the models'''
+    from app.services.indexes import ensure_indexes as create_missing_indexes
+
+    for name in create_missing_indexes():
+        click.echo(f'✓ {name}')
+    click.echo('\n✅ Indexes are in place')
+
+
+@app.cli.command()
+@click.option('--verbose', is_flag=True, help='Print the full plan of every query')
+def check_index_usage(verbose):
+    '''Verify that every hot query can be answered from the index meant for it'''
+    from app.services.indexes import check_index_usage as explain_hot_queries
+
+    failures = 0
+    for label, uses_index, plan in explain_hot_queries():
+        click.echo(f"{'✓' if uses_index else '✖'} {label}")
+        if verbose or not uses_index:
+            for line in plan:
+                click.echo(f'    {line}')
+        if not uses_index:
+            failures += 1
+
+    if failures:
+        raise click.ClickException(f'{failures} hot queries do not use their index')
+    click.echo('\n✅ All hot queries use their index')
+
+
+@app.cli.command()
+@click.option('--batch-size', default=1000, help='Patients updated per flush')
+def rebuild_patient_search(batch_size):
+    '''Recompute the normalized search name of every patient'''
+    from app.services.patient_search import rebuild_search_names
+
+    updated = rebuild_search_names(batch_size)
+    click.echo(f'✅ Updated search names for {updated} patients')
+
+
+@app.cli.command()
+@click.option('--start', type=click.DateTime(formats=['%Y-%m-%d']), help='First day (default: oldest data)')
+@click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']), help='Last day (default: newest data)')
+@click.option('--chunk-days', default=31, help='Days rebuilt per transaction')
+def backfill_rollups(start, end, chunk_days):
+    '''Rebuild the daily report rollup tables from the raw data'''
+    from app.services import rollups
+
+    start = start.date() if start else None
+    end = end.date() if end else None
+
+    click.echo('📊 Rebuilding daily rollups...')
+    written = rollups.backfill(
+        start, end, chunk_days=chunk_days,
+        on_chunk=lambda first, last: click.echo(f'✓ {first} → {last}')
+    )
+
+    for fact, rows in written.items():
+        click.echo(f'  {fact}: {rows} rows')
+    click.echo('\n✅ Rollups are up to date')
+
+
+@app.cli.command()
+@click.argument('username')
+@click.option('--day', 'days', type=click.IntRange(0, 6), multiple=True,
+              help='Weekday to set, 0 = Monday ... 6 = Sunday (repeatable)')
+@click.option('--start', type=click.DateTime(formats=['%H:%M']), help='Shift start (HH:MM)')
+@click.option('--end', type=click.DateTime(formats=['%H:%M']), help='Shift end (HH:MM)')
+@click.option('--clear', is_flag=True, help='Remove all shifts (back to DEFAULT_WORKING_HOURS, unrestricted if unset)')
+def set_working_hours(username, days, start, end, clear):
+    '''Set a doctor's weekly working hours'''
+    from app.models import DoctorWorkingHours
+    from app.services.scheduling import working_hours
+
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        click.echo(f'✖ User "{username}" not found')
+        return
+
+    if clear:
+        DoctorWorkingHours.query.filter_by(doctor_id=user.id).delete()
+    elif days:
+        if not start or not end or start >= end:
+            click.echo('✖ --start and --end are required, and start must be before end')
+            return
+        # The given days are replaced by one shift each
+        DoctorWorkingHours.query.filter(
+            DoctorWorkingHours.doctor_id == user.id,
+            DoctorWorkingHours.weekday.in_(days)
+        ).delete(synchronize_session=False)
+        for day in days:
+            db.session.add(DoctorWorkingHours(
+                doctor_id=user.id, weekday=day, start_time=start.time(), end_time=end.time()
+            ))
+    db.session.commit()
+
+    hours = working_hours(user.id)
+    if hours is None:
+        click.echo(f'🕒 {user.full_name_ar} has no working hours: bookings are not restricted')
+        return
+    click.echo(f'🕒 Working hours of {user.full_name_ar}:')
+    for day, shifts in sorted(hours.items()):
+        ranges = ', '.join(f'{s:%H:%M}-{e:%H:%M}' for s, e in shifts)
+        click.echo(f'  {day}: {ranges}')
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -1,8 +1,11 @@
 from app import db
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
-from sqlalchemy.dialects.postgresql import JSON
+from datetime import datetime, timedelta
+from sqlalchemy import func, literal_column, text
+from sqlalchemy.dialects.postgresql import JSON, ExcludeConstraint
+from sqlalchemy.orm import validates
+from app.services.text_normalization import normalize_arabic
 import enum
 
 # ============================================================================
@@ -29,11 +32,24 @@ class AdmissionStatus(enum.Enum):
     active = 'active'
     discharged = 'discharged'
 
+class JobStatus(enum.Enum):
+    queued = 'queued'
+    running = 'running'
+    succeeded = 'succeeded'
+    failed = 'failed'
+
 
 # ============================================================================
 # AUTHORIZATION MODELS (NEW)
 # ============================================================================
 
+# Compiled permission sets, cached per role across requests.
+# Maps role_id -> (permissions_version, frozenset of permission slugs).
+# A role's permissions_version is bumped whenever its permissions change, so a
+# stale entry (even one compiled by another worker process) is never served.
+_compiled_permissions = {}
+
+
 # Many-to-many association table for roles and permissions
 roles_permissions = db.Table('roles_permissions',
                              db.Column('role_id', db.Integer, db.ForeignKey('roles.id'), primary_key=True),
@@ -69,25 +85,59 @@ class Role(db.Model):
     name = db.Column(db.String(50), unique=True, nullable=False)
     description = db.Column(db.String(255))  # What this role does
     is_system_role = db.Column(db.Boolean, default=False)  # Cannot be deleted
+    permissions_version = db.Column(db.Integer, default=0, server_default='0', nullable=False)  # Bumped on every permission change
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Relationships
     users = db.relationship('User', backref='role', lazy='dynamic')
     permissions = db.relationship('Permission', secondary=roles_permissions, back_populates='roles')
 
+    def permission_slugs(self):
+        """
+        Return the role's permissions compiled into a frozenset of slugs.
+        The set is built once per permissions_version and reused across requests,
+        so permission checks do not touch the lazily loaded permissions list.
+        """
+        version = self.permissions_version
+        if not isinstance(version, int):
+            # New role, or a version bump not flushed yet: do not cache
+            return frozenset(perm.slug for perm in self.permissions)
+        cached = _compiled_permissions.get(self.id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        slugs = frozenset(perm.slug for perm in self.permissions)
+        if self.id is not None:
+            _compiled_permissions[self.id] = (version, slugs)
+        return slugs
+
+    def invalidate_permissions(self):
+        """Bump the version stamp and drop the compiled permission set"""
+        if self.id is not None:
+            # Incremented in SQL, so concurrent edits of the role all count
+            self.permissions_version = Role.permissions_version + 1
+        _compiled_permissions.pop(self.id, None)
+
     def has_permission(self, permission_slug):
         """Check if this role has a specific permission"""
-        return any(perm.slug == permission_slug for perm in self.permissions)
+        return permission_slug in self.permission_slugs()
 
     def grant_permission(self, permission):
         """Grant a permission to this role"""
         if permission not in self.permissions:
             self.permissions.append(permission)
+            self.invalidate_permissions()
 
     def revoke_permission(self, permission):
         """Revoke a permission from this role"""
         if permission in self.permissions:
             self.permissions.remove(permission)
+            self.invalidate_permissions()
+
+    def set_permissions(self, permissions):
+        """Replace all permissions of this role"""
+        self.permissions = list(permissions)
+        self.invalidate_permissions()
 
     def __repr__(self):
         return f'<Role {self.name}>'
@@ -125,17 +175,21 @@ class User(UserMixin, db.Model):
             if current_user.can('patients.create'):
                 # allow action
         """
+        return permission_slug in self.permission_slugs()
+
+    def permission_slugs(self):
+        """Compiled permission set of the user's role (empty if no role)"""
         if not self.role:
-            return False
-        return self.role.has_permission(permission_slug)
+            return frozenset()
+        return self.role.permission_slugs()
 
     def has_any_permission(self, *permission_slugs):
         """Check if user has ANY of the provided permissions"""
-        return any(self.can(slug) for slug in permission_slugs)
+        return not self.permission_slugs().isdisjoint(permission_slugs)
 
     def has_all_permissions(self, *permission_slugs):
         """Check if user has ALL of the provided permissions"""
-        return all(self.can(slug) for slug in permission_slugs)
+        return self.permission_slugs().issuperset(permission_slugs)
 
     # Keep backward compatibility with old method
     def has_permission(self, resource, action):
@@ -158,6 +212,7 @@ class Patient(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     file_number = db.Column(db.String(20), unique=True, nullable=False, index=True)
     full_name = db.Column(db.String(200), nullable=False)  # Arabic name
+    search_name = db.Column(db.String(200))  # full_name normalized by normalize_arabic()
     phone = db.Column(db.String(20))
     gender = db.Column(db.String(1))  # M/F
     dob = db.Column(db.Date)
@@ -170,6 +225,23 @@ class Patient(db.Model):
     admissions = db.relationship('Admission', backref='patient', lazy='dynamic', cascade='all, delete-orphan')
     invoices = db.relationship('Invoice', backref='patient', lazy='dynamic', cascade='all, delete-orphan')
     
+    __table_args__ = (
+        # Trigram indexes for substring/similarity search (requires pg_trgm)
+        db.Index('ix_patients_search_name_trgm', 'search_name',
+                 postgresql_using='gin', postgresql_ops={'search_name': 'gin_trgm_ops'}),
+        db.Index('ix_patients_phone_trgm', 'phone',
+                 postgresql_using='gin', postgresql_ops={'phone': 'gin_trgm_ops'}),
+        db.Index('ix_patients_file_number_trgm', 'file_number',
+                 postgresql_using='gin', postgresql_ops={'file_number': 'gin_trgm_ops'}),
+        # Patient list, newest first (keyset pagination)
+        db.Index('ix_patients_created_at_id', 'created_at', 'id'),
+    )
+    
+    @validates('full_name')
+    def _sync_search_name(self, key, value):
+        self.search_name = normalize_arabic(value)
+        return value
+    
     def __repr__(self):
         return f'<Patient {self.file_number}: {self.full_name}>'
 
@@ -184,6 +256,7 @@ class Appointment(db.Model):
     patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
     doctor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     date_time = db.Column(db.DateTime, nullable=False, index=True)
+    duration_minutes = db.Column(db.Integer, default=30, server_default='30', nullable=False)
     status = db.Column(db.Enum(AppointmentStatus), default=AppointmentStatus.pending, nullable=False)
     type = db.Column(db.String(20), default='scheduled')  # walk-in, scheduled
     notes = db.Column(db.Text)
@@ -192,6 +265,24 @@ class Appointment(db.Model):
     # Relationships
     medical_visit = db.relationship('MedicalVisit', backref='appointment', uselist=False, cascade='all, delete-orphan')
     
+    __table_args__ = (
+        # Doctor availability checks and the doctor dashboard
+        db.Index('ix_appointments_doctor_date_time', 'doctor_id', 'date_time'),
+        # Open appointments of a doctor never overlap; the GiST index behind
+        # the constraint also answers overlap searches (requires btree_gist)
+        ExcludeConstraint(
+            (doctor_id, '='),
+            (func.tsrange(date_time, date_time + duration_minutes * literal_column("interval '1 minute'")), '&&'),
+            name='ex_appointments_doctor_overlap',
+            using='gist',
+            where=text("status IN ('pending', 'confirmed')")
+        ),
+    )
+
+    @property
+    def end_time(self):
+        return self.date_time + timedelta(minutes=self.duration_minutes or 0)
+    
     def __repr__(self):
         return f'<Appointment {self.id}: Patient {self.patient_id} on {self.date_time}>'
 
@@ -207,11 +298,41 @@ class MedicalVisit(db.Model):
     prescription_text = db.Column(db.Text)  # Arabic text
     vitals = db.Column(JSON)  # {"temp": 37.5, "bp": "120/80", "weight": 70}
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Recent visits of a doctor (doctor dashboard)
+        db.Index('ix_medical_visits_doctor_created_at', 'doctor_id', 'created_at'),
+    )
     
     def __repr__(self):
         return f'<MedicalVisit {self.id} for Appointment {self.appointment_id}>'
 
 
+class DoctorWorkingHours(db.Model):
+    """
+    A shift in a doctor's weekly schedule; a day may have several. Doctors
+    without any rows work the clinic's DEFAULT_WORKING_HOURS.
+    """
+    __tablename__ = 'doctor_working_hours'
+
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    weekday = db.Column(db.SmallInteger, nullable=False)  # 0 = Monday ... 6 = Sunday
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time, nullable=False)
+
+    doctor = db.relationship('User', backref=db.backref('working_hours', cascade='all, delete-orphan'))
+
+    __table_args__ = (
+        db.CheckConstraint('weekday BETWEEN 0 AND 6', name='ck_working_hours_weekday'),
+        db.CheckConstraint('start_time < end_time', name='ck_working_hours_order'),
+        db.Index('ix_doctor_working_hours_doctor_weekday', 'doctor_id', 'weekday'),
+    )
+
+    def __repr__(self):
+        return f'<DoctorWorkingHours {self.doctor_id} day {self.weekday} {self.start_time}-{self.end_time}>'
+
+
 # ============================================================================
 # FACILITY (ROOMS & BEDS)
 # ============================================================================
@@ -245,6 +366,14 @@ class Admission(db.Model):
     status = db.Column(db.Enum(AdmissionStatus), default=AdmissionStatus.active, nullable=False)
     notes = db.Column(db.Text)
     
+    __table_args__ = (
+        # Admissions list filtered by status, newest first
+        db.Index('ix_admissions_status_admission_date', 'status', 'admission_date'),
+        # "Does this patient already have an active admission?"
+        db.Index('ix_admissions_active_patient', 'patient_id',
+                 postgresql_where=db.text("status = 'active'")),
+    )
+    
     def __repr__(self):
         return f'<Admission {self.id}: Patient {self.patient_id} in Bed {self.bed_id}>'
 
@@ -277,6 +406,13 @@ class Invoice(db.Model):
     # Relationships
     items = db.relationship('InvoiceItem', backref='invoice', lazy='dynamic', cascade='all, delete-orphan')
     
+    __table_args__ = (
+        # Revenue statistics (paid invoices by payment date)
+        db.Index('ix_invoices_status_paid_at', 'status', 'paid_at'),
+        # Invoice list, newest first (keyset pagination)
+        db.Index('ix_invoices_created_at_id', 'created_at', 'id'),
+    )
+    
     def __repr__(self):
         return f'<Invoice {self.id}: {self.total_amount} SDG>'
 
@@ -285,10 +421,136 @@ class InvoiceItem(db.Model):
     __tablename__ = 'invoice_items'
     
     id = db.Column(db.Integer, primary_key=True)
-    invoice_id = db.Column(db.Integer, db.ForeignKey('invoices.id'), nullable=False)
+    invoice_id = db.Column(db.Integer, db.ForeignKey('invoices.id'), nullable=False, index=True)
     service_name = db.Column(db.String(200), nullable=False)  # Arabic
     cost = db.Column(db.Numeric(10, 2), nullable=False)
     quantity = db.Column(db.Integer, default=1)
     
     def __repr__(self):
-        return f'<InvoiceItem {self.service_name}: {self.cost} SDG>'
\ No newline at end of file
+        return f'<InvoiceItem {self.service_name}: {self.cost} SDG>'
+
+
+# ============================================================================
+# REPORTING ROLLUPS (maintained by app.services.rollups)
+# ============================================================================
+class DailyRevenue(db.Model):
+    """Invoices per day and status; paid invoices count on paid_at, others on created_at"""
+    __tablename__ = 'daily_revenue'
+    
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.Enum(InvoiceStatus), primary_key=True)
+    invoice_count = db.Column(db.Integer, nullable=False, default=0)
+    total_amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<DailyRevenue {self.day} {self.status.value}: {self.total_amount}>'
+
+
+class DailyAppointments(db.Model):
+    """Appointments per day, doctor and status"""
+    __tablename__ = 'daily_appointments'
+    
+    day = db.Column(db.Date, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    status = db.Column(db.Enum(AppointmentStatus), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<DailyAppointments {self.day} doctor {self.doctor_id} {self.status.value}: {self.count}>'
+
+
+class DailyActivity(db.Model):
+    """Registrations, admissions and discharges per day"""
+    __tablename__ = 'daily_activity'
+    
+    day = db.Column(db.Date, primary_key=True)
+    new_patients = db.Column(db.Integer, nullable=False, default=0)
+    admissions = db.Column(db.Integer, nullable=False, default=0)
+    discharges = db.Column(db.Integer, nullable=False, default=0)
+    discharged_stay_days = db.Column(db.Integer, nullable=False, default=0)  # Sum of whole days stayed
+    
+    def __repr__(self):
+        return f'<DailyActivity {self.day}>'
+
+
+class DailyServiceUsage(db.Model):
+    """Invoice items per invoice creation day and service"""
+    __tablename__ = 'daily_service_usage'
+    
+    day = db.Column(db.Date, primary_key=True)
+    service_name = db.Column(db.String(200), primary_key=True)
+    usage_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<DailyServiceUsage {self.day} {self.service_name}: {self.usage_count}>'
+
+
+# ============================================================================
+# STATISTICS CACHE (maintained by app.services.stats_cache)
+# ============================================================================
+class CacheTagVersion(db.Model):
+    """Invalidation counter of a statistics cache tag, shared by every worker process"""
+    __tablename__ = 'cache_tag_versions'
+    
+    tag = db.Column(db.String(100), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<CacheTagVersion {self.tag}: {self.version}>'
+
+
+# ============================================================================
+# BACKGROUND JOBS (executed by the worker, see app.services.jobs)
+# ============================================================================
+class ReportJob(db.Model):
+    __tablename__ = 'report_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # Handler name, e.g. 'dashboard', 'export'
+    params = db.Column(JSON, nullable=False, default=dict)
+    params_key = db.Column(db.String(500), nullable=False)  # Canonical JSON of params, for reuse
+    status = db.Column(db.Enum(JobStatus), default=JobStatus.queued, nullable=False)
+    requested_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    error = db.Column(db.Text)
+    result_path = db.Column(db.String(500))  # File under JOB_RESULTS_FOLDER
+    result_filename = db.Column(db.String(200))  # Name offered on download
+    result_mimetype = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # Refreshed by the worker while the job runs
+    finished_at = db.Column(db.DateTime)
+    
+    # Relationships
+    requester = db.relationship('User', backref=db.backref('report_jobs', lazy='dynamic'))
+    
+    __table_args__ = (
+        # Worker claims the oldest queued job
+        db.Index('ix_report_jobs_status_id', 'status', 'id'),
+        # Reuse of an identical recent job
+        db.Index('ix_report_jobs_kind_params', 'kind', 'params_key'),
+        # At most one open job per kind and parameters (concurrent enqueues)
+        db.Index('ux_report_jobs_open_kind_params', 'kind', 'params_key', unique=True,
+                 postgresql_where=db.text("status IN ('queued', 'running')")),
+    )
+    
+    @property
+    def is_finished(self):
+        return self.status in (JobStatus.succeeded, JobStatus.failed)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'params': self.params,
+            'status': self.status.value,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+    
+    def __repr__(self):
+        return f'<ReportJob {self.id} {self.kind}: {self.status.value}>'
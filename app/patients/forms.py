@@ -1,6 +1,41 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, SelectField, DateField, TextAreaField, SubmitField
-from wtforms.validators import DataRequired, Optional, Length, Regexp
+from wtforms.validators import DataRequired, Optional, Length, Regexp, ValidationError
+from wtforms.utils import unset_value
+from app import db
+from app.models import Patient
+from app.services.patient_search import patient_label
+
+
+class PatientLookupField(SelectField):
+    """
+    Patient picker backed by the /patients/api/search typeahead.
+
+    Only the currently selected patient is rendered as an option, the rest
+    are fetched by the widget on demand, so building and rendering the form
+    costs the same no matter how many patients exist. Validation loads just
+    the submitted id.
+    """
+
+    def __init__(self, label=None, validators=None, placeholder='اختر المريض', **kwargs):
+        kwargs.setdefault('coerce', int)
+        kwargs['choices'] = []
+        kwargs['validate_choice'] = False
+        super(PatientLookupField, self).__init__(label, validators, **kwargs)
+        self.placeholder = placeholder
+        self.patient = None
+
+    def process(self, formdata, data=unset_value, extra_filters=None):
+        super(PatientLookupField, self).process(formdata, data, extra_filters)
+
+        self.patient = db.session.get(Patient, self.data) if self.data else None
+        self.choices = [(0, self.placeholder)]
+        if self.patient:
+            self.choices.append((self.patient.id, patient_label(self.patient)))
+
+    def pre_validate(self, form):
+        if self.data and self.patient is None:
+            raise ValidationError('المريض غير موجود')
 
 class PatientForm(FlaskForm):
     full_name = StringField(
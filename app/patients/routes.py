@@ -1,12 +1,15 @@
 
-from flask import render_template, redirect, url_for, flash, request
+from flask import render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required
 from app.patients import bp
 from app.patients.forms import PatientForm, PatientSearchForm
-from app.models import Patient
+from app.models import Patient, Appointment
 from app.decorators import permission_required
+from app.services.pagination import keyset_paginate
+from app.services.patient_search import search_filter, search_rank, typeahead
 from app import db
 from datetime import datetime
+from sqlalchemy.orm import joinedload
 import random
 import string
 
@@ -30,27 +33,21 @@ def generate_file_number():
 def list_patients():
     """List all patients with search functionality"""
     search_form = PatientSearchForm()
-    page = request.args.get('page', 1, type=int)
     per_page = 15
     
-    # Base query
-    query = Patient.query
-    
-    # Search functionality
+    # Search functionality (ranked by similarity) or newest first
     search_query = request.args.get('search_query', '').strip()
     if search_query:
-        search_pattern = f'%{search_query}%'
-        query = query.filter(
-            db.or_(
-                Patient.full_name.ilike(search_pattern),
-                Patient.phone.ilike(search_pattern),
-                Patient.file_number.ilike(search_pattern)
-            )
-        )
+        query = Patient.query.filter(search_filter(search_query))
+        keys = (search_rank(search_query), Patient.id)
+    else:
+        query = Patient.query
+        keys = (Patient.created_at, Patient.id)
     
     # Pagination
-    patients = query.order_by(Patient.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
+    patients = keyset_paginate(
+        query, keys, per_page=per_page,
+        after=request.args.get('after'), before=request.args.get('before')
     )
     
     return render_template(
@@ -102,7 +99,9 @@ def view_patient(patient_id):
     patient = Patient.query.get_or_404(patient_id)
     
     # Get recent appointments
-    recent_appointments = patient.appointments.order_by(
+    recent_appointments = patient.appointments.options(
+        joinedload(Appointment.doctor)
+    ).order_by(
         db.desc('date_time')
     ).limit(10).all()
     
@@ -179,3 +178,24 @@ def delete_patient(patient_id):
         db.session.rollback()
         flash('حدث خطأ أثناء الحذف. يرجى المحاولة مرة أخرى.', 'danger')
         return redirect(url_for('patients.view_patient', patient_id=patient.id))
+
+
+@bp.route('/api/search')
+@login_required
+@permission_required('patients', 'read')
+def api_search():
+    """
+    Paginated patient lookup for typeahead widgets.
+    Query args: q (search text), page, limit, available_for_admission=1
+    """
+    search_query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    available_for_admission = request.args.get('available_for_admission', type=int) == 1
+    
+    return jsonify(typeahead(
+        search_query,
+        limit=limit,
+        page=page,
+        available_for_admission=available_for_admission
+    ))
\ No newline at end of file
@@ -1,11 +1,19 @@
 # app/reports/routes.py - Enhanced with better date filtering
 
-from flask import render_template, request, jsonify
-from flask_login import login_required
+from flask import (
+    render_template, request, jsonify, Response, stream_with_context, abort,
+    current_app, redirect, url_for, flash, send_file
+)
+from flask_login import login_required, current_user
 from app.reports import bp
 from app.reports.forms import DateRangeFilterForm
 from app.services.stats_service import StatsService
-from app.decorators import permission_required
+from app.services.export import DATASET_NAMES, export_rows, csv_stream, xlsx_stream
+from app.services import jobs
+from app.services.data_version import invoices_version, patients_version
+from app import db
+from app.models import ReportJob, JobStatus
+from app.decorators import permission_required, conditional_json
 from datetime import datetime, timedelta, date
 from calendar import monthrange
 
@@ -64,6 +72,26 @@ def calculate_date_range(preset):
         return start, today
 
 
+def get_requested_date_range():
+    """Date range from the start_date/end_date or preset_range request parameters"""
+    preset_range = request.values.get('preset_range', 'this_month')
+    start_date_str = request.values.get('start_date')
+    end_date_str = request.values.get('end_date')
+
+    if start_date_str and end_date_str:
+        # Custom dates provided
+        try:
+            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+            return start_date, end_date, 'custom'
+        except ValueError:
+            # Invalid dates, use preset
+            pass
+
+    start_date, end_date = calculate_date_range(preset_range)
+    return start_date, end_date, preset_range
+
+
 @bp.route('/')
 @bp.route('/dashboard')
 @login_required
@@ -73,33 +101,14 @@ def dashboard():
 
     form = DateRangeFilterForm()
 
-    # Get filter parameters from request
-    preset_range = request.args.get('preset_range', 'this_month')
-    start_date_str = request.args.get('start_date')
-    end_date_str = request.args.get('end_date')
-
     # Determine date range
-    if start_date_str and end_date_str:
-        # Custom dates provided
-        try:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-            preset_range = 'custom'
-        except ValueError:
-            # Invalid dates, use preset
-            start_date, end_date = calculate_date_range(preset_range)
-    else:
-        # Use preset
-        start_date, end_date = calculate_date_range(preset_range)
+    start_date, end_date, preset_range = get_requested_date_range()
 
     # Update form with current values
     form.start_date.data = start_date
     form.end_date.data = end_date
     form.preset_range.data = preset_range
 
-    # Get filtered statistics
-    stats = StatsService.get_dashboard_stats(start_date, end_date)
-
     # Format period description for display
     if preset_range == 'today':
         period_desc = 'اليوم'
@@ -122,6 +131,22 @@ def dashboard():
     else:
         period_desc = f'من {start_date.strftime("%Y-%m-%d")} إلى {end_date.strftime("%Y-%m-%d")}'
 
+    # Get filtered statistics; long ranges are computed by the background worker
+    async_days = current_app.config.get('REPORT_ASYNC_DAYS', 0)
+    if async_days and (end_date - start_date).days + 1 > async_days:
+        job = jobs.find_or_enqueue(
+            'dashboard',
+            {'start_date': start_date.isoformat(), 'end_date': end_date.isoformat()},
+            current_user.id,
+            retry=request.args.get('retry') == '1'
+        )
+        if job.status != JobStatus.succeeded:
+            retry_url = url_for('reports.dashboard', **dict(request.args.to_dict(), retry='1'))
+            return render_template('reports/job_pending.html', job=job, period_desc=period_desc, retry_url=retry_url)
+        stats = jobs.load_json_result(job)
+    else:
+        stats = StatsService.get_dashboard_stats(start_date, end_date)
+
     return render_template(
         'reports/dashboard.html',
         form=form,
@@ -133,10 +158,12 @@ def dashboard():
     )
 
 
-# API endpoints remain the same but could be enhanced if needed
+# Chart data APIs answer conditional GETs, so auto-refreshing charts only
+# recompute and download the series when the underlying data changed
 @bp.route('/api/revenue-data')
 @login_required
 @permission_required('reports', 'read')
+@conditional_json(invoices_version)
 def api_revenue_data():
     """API endpoint for revenue chart data (always 12 months)"""
     revenue_data = StatsService.get_revenue_by_month(12)
@@ -151,6 +178,7 @@ def api_revenue_data():
 @bp.route('/api/patients-data')
 @login_required
 @permission_required('reports', 'read')
+@conditional_json(patients_version)
 def api_patients_data():
     """API endpoint for patient registration chart data (always 12 months)"""
     patient_data = StatsService.get_patients_by_month(12)
@@ -158,4 +186,133 @@ def api_patients_data():
     return jsonify({
         'labels': [item['month_name'] for item in patient_data],
         'data': [item['count'] for item in patient_data]
-    })
\ No newline at end of file
+    })
+
+
+# ============================================================================
+# EXPORTS
+# ============================================================================
+
+@bp.route('/export/<dataset>')
+@login_required
+@permission_required('reports', 'export')
+def export(dataset):
+    """Stream a dataset for the requested date range as CSV or XLSX"""
+    if dataset not in DATASET_NAMES:
+        abort(404)
+
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'xlsx'):
+        abort(400)
+
+    start_date, end_date, _ = get_requested_date_range()
+    title, headers, rows = export_rows(dataset, start_date, end_date)
+    filename = f'{dataset}_{start_date.isoformat()}_{end_date.isoformat()}.{export_format}'
+
+    if export_format == 'xlsx':
+        body = xlsx_stream(headers, rows, sheet_name=title)
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    else:
+        body = csv_stream(headers, rows)
+        mimetype = 'text/csv'
+
+    # Rows are read lazily while the response is sent, inside the request context
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
+# ============================================================================
+# BACKGROUND JOBS
+# ============================================================================
+
+def _get_own_job(job_id):
+    """
+    Job requested by the current user, or 404. Dashboard jobs are shared
+    between everyone who asked for the same period, so any reader may poll them.
+    """
+    job = db.session.get(ReportJob, job_id)
+    if job is None or (job.kind != 'dashboard' and job.requested_by != current_user.id):
+        abort(404)
+    return job
+
+
+@bp.route('/jobs')
+@login_required
+@permission_required('reports', 'read')
+def jobs_list():
+    """Background jobs requested by the current user"""
+    user_jobs = ReportJob.query.filter_by(
+        requested_by=current_user.id
+    ).order_by(ReportJob.id.desc()).limit(50).all()
+
+    start_date, end_date, _ = get_requested_date_range()
+
+    return render_template(
+        'reports/jobs.html',
+        jobs=user_jobs,
+        datasets=DATASET_NAMES,
+        start_date=start_date,
+        end_date=end_date
+    )
+
+
+@bp.route('/jobs', methods=['POST'])
+@login_required
+@permission_required('reports', 'export')
+def create_export_job():
+    """Queue an export to be generated by the background worker"""
+    dataset = request.form.get('dataset')
+    export_format = request.form.get('format', 'csv')
+    if dataset not in DATASET_NAMES or export_format not in ('csv', 'xlsx'):
+        abort(400)
+
+    start_date, end_date, _ = get_requested_date_range()
+
+    try:
+        jobs.enqueue('export', {
+            'dataset': dataset,
+            'format': export_format,
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat()
+        }, current_user.id)
+        flash('تمت إضافة طلب التصدير إلى قائمة المهام.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'حدث خطأ أثناء إضافة المهمة: {str(e)}', 'danger')
+
+    return redirect(url_for('reports.jobs_list'))
+
+
+@bp.route('/jobs/<int:job_id>')
+@login_required
+@permission_required('reports', 'read')
+def job_status(job_id):
+    """Job status for polling"""
+    job = _get_own_job(job_id)
+    data = job.to_dict()
+    if job.status == JobStatus.succeeded:
+        data['download_url'] = url_for('reports.download_job', job_id=job.id)
+    return jsonify(data)
+
+
+@bp.route('/jobs/<int:job_id>/download')
+@login_required
+@permission_required('reports', 'read')
+def download_job(job_id):
+    """Download the file produced by a finished job"""
+    job = _get_own_job(job_id)
+    if job.status != JobStatus.succeeded or not job.result_path:
+        abort(404)
+
+    return send_file(
+        job.result_path,
+        mimetype=job.result_mimetype,
+        as_attachment=True,
+        download_name=job.result_filename
+    )
@@ -0,0 +1,23 @@
+# app/services/data_version.py
+
+from app.services import stats_cache
+
+
+# Versions come from the statistics cache tags (see stats_cache): every
+# commit that writes the tagged tables bumps them, in every worker process,
+# so computing a version costs no scan of the data. Another process sees a
+# write within STATS_CACHE_VERSION_REFRESH_SECONDS.
+
+def tag_version(*tags):
+    """Token that changes whenever data behind any of the given cache tags is written"""
+    return (tags, stats_cache.tag_versions(*tags))
+
+
+def invoices_version():
+    """Version of the invoices behind the revenue statistics"""
+    return tag_version('invoices')
+
+
+def patients_version():
+    """Version of the patients behind the registration statistics"""
+    return tag_version('patients')
@@ -0,0 +1,35 @@
+# app/services/date_range.py
+
+from datetime import datetime, timedelta, time
+from sqlalchemy import and_
+
+
+def day_start(day):
+    """Midnight at the start of the given date"""
+    return datetime.combine(day, time.min)
+
+
+def date_range_bounds(start_date, end_date):
+    """
+    Convert an inclusive date range into half-open timestamp bounds.
+    Returns (start, end) where start <= value < end covers every moment
+    from start_date 00:00 up to the end of end_date.
+    """
+    return day_start(start_date), day_start(end_date + timedelta(days=1))
+
+
+def date_range_filter(column, start_date, end_date):
+    """
+    Sargable filter for a timestamp column over an inclusive date range.
+
+    Compares the bare column against timestamp bounds
+    (column >= start AND column < end + 1 day) instead of casting the
+    column to DATE, so PostgreSQL can use an index on it.
+    """
+    start, end = date_range_bounds(start_date, end_date)
+    return and_(column >= start, column < end)
+
+
+def on_date_filter(column, day):
+    """Sargable filter for a timestamp column falling on a single date"""
+    return date_range_filter(column, day, day)
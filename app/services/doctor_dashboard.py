@@ -0,0 +1,193 @@
+# app/services/doctor_dashboard.py
+
+from datetime import date, timedelta
+from sqlalchemy import event, func, inspect, literal, null, select, union_all
+from sqlalchemy.orm import Session
+from app import db
+from app.models import Appointment, AppointmentStatus, MedicalVisit, Patient
+from app.services.date_range import day_start, on_date_filter
+from app.services.stats_cache import cached_stats, invalidate_on_commit
+
+
+UPCOMING_LIMIT = 10
+RECENT_VISITS_LIMIT = 5
+
+OPEN_STATUSES = (AppointmentStatus.pending, AppointmentStatus.confirmed)
+
+# Patient attributes embedded in the cached dashboard
+PATIENT_FIELDS = ('full_name', 'file_number', 'gender', 'dob')
+
+
+def doctor_tag(doctor_id):
+    """Cache tag of everything shown on one doctor's dashboard"""
+    return f'doctor:{doctor_id}'
+
+
+def _dashboard_tags(doctor_id, all_doctors=False):
+    # The all-doctors view (Super Admin) depends on every appointment
+    return ('appointments', 'patients') if all_doctors else (doctor_tag(doctor_id),)
+
+
+def _dashboard_query(doctor_id, all_doctors):
+    """
+    One UNION ALL statement with a branch per dashboard section. Every
+    branch returns the same columns; those a section does not use are NULL.
+    """
+    today = date.today()
+
+    def appointment_columns(section):
+        return [
+            literal(section).label('section'),
+            Appointment.id.label('appointment_id'),
+            Appointment.date_time,
+            Appointment.status,
+            Appointment.type,
+            Appointment.notes,
+            Patient.full_name,
+            Patient.file_number,
+            Patient.gender,
+            Patient.dob,
+        ]
+
+    visit_columns = [null(), null(), null()]
+    count_column = null()
+
+    doctor_filter = [] if all_doctors else [Appointment.doctor_id == doctor_id]
+
+    todays = select(
+        *appointment_columns('today'),
+        MedicalVisit.id.label('visit_id'),
+        MedicalVisit.created_at.label('visit_created_at'),
+        MedicalVisit.diagnosis,
+        count_column.label('total')
+    ).join(
+        Patient, Appointment.patient_id == Patient.id
+    ).outerjoin(
+        MedicalVisit, MedicalVisit.appointment_id == Appointment.id
+    ).where(
+        *doctor_filter,
+        on_date_filter(Appointment.date_time, today)
+    )
+
+    pending = select(
+        literal('pending'), *[null()] * 9, *visit_columns,
+        func.count(Appointment.id)
+    ).where(
+        *doctor_filter,
+        Appointment.status.in_(OPEN_STATUSES)
+    )
+
+    upcoming = select(
+        *appointment_columns('upcoming'), *visit_columns, count_column
+    ).join(
+        Patient, Appointment.patient_id == Patient.id
+    ).where(
+        Appointment.doctor_id == doctor_id,
+        Appointment.date_time >= day_start(today + timedelta(days=1)),
+        Appointment.status.in_(OPEN_STATUSES)
+    ).order_by(Appointment.date_time).limit(UPCOMING_LIMIT)
+
+    recent = select(
+        *appointment_columns('recent'),
+        MedicalVisit.id, MedicalVisit.created_at, MedicalVisit.diagnosis,
+        count_column
+    ).select_from(MedicalVisit).join(
+        Appointment, MedicalVisit.appointment_id == Appointment.id
+    ).join(
+        Patient, Appointment.patient_id == Patient.id
+    ).where(
+        MedicalVisit.doctor_id == doctor_id
+    ).order_by(MedicalVisit.created_at.desc()).limit(RECENT_VISITS_LIMIT)
+
+    return union_all(todays, pending, upcoming, recent)
+
+
+def _appointment(row):
+    """Row shaped like an Appointment, so templates read it the same way"""
+    return {
+        'id': row.appointment_id,
+        'date_time': row.date_time,
+        'status': row.status,
+        'type': row.type,
+        'notes': row.notes,
+        'patient': {
+            'full_name': row.full_name,
+            'file_number': row.file_number,
+            'gender': row.gender,
+            'dob': row.dob,
+        },
+        'medical_visit': {'id': row.visit_id} if row.visit_id else None,
+    }
+
+
+@cached_stats(timeout_minutes=2, tags=_dashboard_tags)
+def get_doctor_dashboard(doctor_id, all_doctors=False):
+    """
+    Everything the doctor dashboard shows, from one query.
+
+    Args:
+        doctor_id (int): Doctor whose upcoming appointments and visits are listed
+        all_doctors (bool): Count and list today's appointments of every
+            doctor (Super Admin view)
+
+    Appointments and visits are plain dicts shaped like the models. The
+    result is cached per doctor and dropped when one of that doctor's
+    appointments or visits, or the details of one of their patients, are
+    written.
+    """
+    sections = {'today': [], 'pending': [], 'upcoming': [], 'recent': []}
+    for row in db.session.execute(_dashboard_query(doctor_id, all_doctors)):
+        sections[row.section].append(row)
+
+    todays_appointments = [
+        _appointment(row) for row in sorted(sections['today'], key=lambda row: row.date_time)
+    ]
+    recent_visits = [
+        {
+            'id': row.visit_id,
+            'created_at': row.visit_created_at,
+            'diagnosis': row.diagnosis,
+            'appointment': _appointment(row),
+        }
+        for row in sections['recent']
+    ]
+
+    return {
+        'todays_appointments': todays_appointments,
+        'upcoming_appointments': [_appointment(row) for row in sections['upcoming']],
+        'recent_visits': recent_visits,
+        'pending_appointments': sections['pending'][0].total if sections['pending'] else 0,
+        'completed_today': sum(
+            1 for appt in todays_appointments if appt['status'] == AppointmentStatus.completed
+        ),
+        'total_today': len(todays_appointments),
+    }
+
+
+# ============================================================================
+# INVALIDATION ON WRITES
+# ============================================================================
+
+@event.listens_for(Session, 'after_flush')
+def _collect_doctor_tags(session, flush_context):
+    doctor_ids = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, (Appointment, MedicalVisit)):
+            # Old and new doctor when the appointment was reassigned
+            values = inspect(obj).attrs.doctor_id.history.sum()
+            if not values and obj not in session.deleted:
+                values = [obj.doctor_id]
+            doctor_ids.update(value for value in values if value is not None)
+
+    # Edited patients appear on the dashboards of the doctors they see
+    patient_ids = {
+        obj.id for obj in (*session.dirty, *session.deleted)
+        if isinstance(obj, Patient) and (obj in session.deleted or any(
+            inspect(obj).attrs[field].history.has_changes() for field in PATIENT_FIELDS
+        ))
+    }
+    if patient_ids:
+        doctor_ids.update(session.execute(
+            select(Appointment.doctor_id).where(Appointment.patient_id.in_(patient_ids)).distinct()
+        ).scalars())
+    invalidate_on_commit(session, *(doctor_tag(doctor_id) for doctor_id in doctor_ids))
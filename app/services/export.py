@@ -0,0 +1,293 @@
+# app/services/export.py
+
+import csv
+import enum
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape, quoteattr
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+from app import db
+from app.services.date_range import date_range_filter
+from app.models import Invoice, InvoiceItem, Patient, Appointment, User, Admission, Bed
+
+
+# Rows fetched per round trip from the server-side cursor
+FETCH_SIZE = 1000
+
+# Bytes buffered before a chunk is sent to the client
+CHUNK_SIZE = 64 * 1024
+
+# Leading characters that make spreadsheet programs evaluate a CSV field as
+# a formula; text starting with one is prefixed with an apostrophe. XLSX
+# string cells are never evaluated and are written verbatim.
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+# ============================================================================
+# DATASETS
+# ============================================================================
+#
+# Each dataset is (title, [(column header, SQL expression)], date column,
+# base entity, [(joined entity, ON clause)]).
+# Only plain columns are selected, never ORM entities, so nothing is kept
+# in the identity map while rows stream.
+
+def _datasets():
+    doctor = aliased(User)
+    return {
+        'invoices': ('الفواتير', [
+            ('رقم الفاتورة', Invoice.id),
+            ('رقم الملف', Patient.file_number),
+            ('اسم المريض', Patient.full_name),
+            ('الحالة', Invoice.status),
+            ('المبلغ', Invoice.total_amount),
+            ('تاريخ الإنشاء', Invoice.created_at),
+            ('تاريخ الدفع', Invoice.paid_at),
+        ], Invoice.created_at, Invoice, [(Patient, Invoice.patient_id == Patient.id)]),
+
+        'invoice_items': ('بنود الفواتير', [
+            ('رقم الفاتورة', Invoice.id),
+            ('تاريخ الفاتورة', Invoice.created_at),
+            ('رقم الملف', Patient.file_number),
+            ('الخدمة', InvoiceItem.service_name),
+            ('السعر', InvoiceItem.cost),
+            ('الكمية', InvoiceItem.quantity),
+            ('الإجمالي', InvoiceItem.cost * InvoiceItem.quantity),
+        ], Invoice.created_at, InvoiceItem, [
+            (Invoice, InvoiceItem.invoice_id == Invoice.id),
+            (Patient, Invoice.patient_id == Patient.id),
+        ]),
+
+        'appointments': ('المواعيد', [
+            ('رقم الموعد', Appointment.id),
+            ('التاريخ والوقت', Appointment.date_time),
+            ('رقم الملف', Patient.file_number),
+            ('اسم المريض', Patient.full_name),
+            ('الطبيب', doctor.full_name_ar),
+            ('الحالة', Appointment.status),
+            ('النوع', Appointment.type),
+        ], Appointment.date_time, Appointment, [
+            (Patient, Appointment.patient_id == Patient.id),
+            (doctor, Appointment.doctor_id == doctor.id),
+        ]),
+
+        'admissions': ('الإدخالات', [
+            ('رقم الإدخال', Admission.id),
+            ('رقم الملف', Patient.file_number),
+            ('اسم المريض', Patient.full_name),
+            ('الغرفة', Bed.room_number),
+            ('السرير', Bed.bed_label),
+            ('تاريخ الدخول', Admission.admission_date),
+            ('تاريخ الخروج', Admission.discharge_date),
+            ('الحالة', Admission.status),
+        ], Admission.admission_date, Admission, [
+            (Patient, Admission.patient_id == Patient.id),
+            (Bed, Admission.bed_id == Bed.id),
+        ]),
+    }
+
+
+DATASET_NAMES = ('invoices', 'invoice_items', 'appointments', 'admissions')
+
+
+def export_rows(dataset, start_date, end_date):
+    """
+    Return (title, headers, row iterator) for a dataset in a date range.
+
+    Rows come from a server-side cursor (yield_per), so memory use does not
+    grow with the number of rows. Iterate inside the request/app context.
+    """
+    title, columns, date_column, base, joins = _datasets()[dataset]
+    statement = select(*[expression for _, expression in columns]).select_from(base)
+    for target, on in joins:
+        statement = statement.join(target, on)
+    statement = statement.where(
+        date_range_filter(date_column, start_date, end_date)
+    ).order_by(date_column, columns[0][1])
+
+    def rows():
+        result = db.session.execute(statement.execution_options(yield_per=FETCH_SIZE))
+        try:
+            for row in result:
+                yield row
+        finally:
+            result.close()
+
+    return title, [header for header, _ in columns], rows()
+
+
+def _plain(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M')
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def _csv_field(value):
+    value = _plain(value)
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        # Patient names and notes are user input (CSV/formula injection)
+        return "'" + value
+    return value
+
+
+# ============================================================================
+# CSV
+# ============================================================================
+
+class _LineBuffer:
+    """File-like target for csv.writer that hands back what was written"""
+
+    def write(self, value):
+        return value
+
+
+def csv_stream(headers, rows):
+    """
+    Generate a UTF-8 CSV (with BOM, so Excel shows Arabic correctly) as
+    byte chunks. The header goes out immediately.
+    """
+    writer = csv.writer(_LineBuffer())
+    yield ('\ufeff' + writer.writerow(headers)).encode('utf-8')
+
+    chunk = []
+    size = 0
+    for row in rows:
+        line = writer.writerow([_csv_field(value) for value in row])
+        chunk.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield ''.join(chunk).encode('utf-8')
+            chunk = []
+            size = 0
+    if chunk:
+        yield ''.join(chunk).encode('utf-8')
+
+
+# ============================================================================
+# XLSX
+# ============================================================================
+#
+# A minimal SpreadsheetML package written through zipfile in streaming mode:
+# the sheet XML is compressed row by row and every compressed chunk is sent
+# as soon as it is produced, so the workbook never exists in memory.
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+
+def _workbook_xml(sheet_name):
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<sheets><sheet name={quoteattr(sheet_name[:31])} sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    )
+
+
+def _cell(value):
+    value = _plain(value)
+    if value is None:
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c><v>{value}</v></c>'
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(str(value))}</t></is></c>'
+
+
+def _xml_row(values):
+    return '<row>' + ''.join(_cell(value) for value in values) + '</row>'
+
+
+class _ChunkBuffer:
+    """Write-only, unseekable target that collects bytes until drained"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def xlsx_stream(headers, rows, sheet_name='Sheet1'):
+    """Generate an XLSX workbook with a single sheet as byte chunks"""
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as package:
+        package.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        package.writestr('_rels/.rels', _ROOT_RELS)
+        package.writestr('xl/workbook.xml', _workbook_xml(sheet_name))
+        package.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        yield buffer.drain()
+
+        with package.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                '<sheetViews><sheetView rightToLeft="1" workbookViewId="0"/></sheetViews>'
+                '<sheetData>' + _xml_row(headers)
+            ).encode('utf-8'))
+
+            chunk = []
+            size = 0
+            for row in rows:
+                xml = _xml_row(row)
+                chunk.append(xml)
+                size += len(xml)
+                if size >= CHUNK_SIZE:
+                    sheet.write(''.join(chunk).encode('utf-8'))
+                    chunk = []
+                    size = 0
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            sheet.write((''.join(chunk) + '</sheetData></worksheet>').encode('utf-8'))
+
+    yield buffer.drain()
@@ -0,0 +1,160 @@
+# app/services/indexes.py
+
+import re
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, text
+from app import db
+from app.models import (
+    Appointment, AppointmentStatus, Invoice, InvoiceItem, InvoiceStatus,
+    Admission, AdmissionStatus, Patient, MedicalVisit
+)
+from app.services.date_range import date_range_filter, on_date_filter
+from app.services.patient_search import search_filter as patient_search_filter
+
+
+# PostgreSQL extensions required by the declared indexes
+EXTENSIONS = ['pg_trgm', 'btree_gist']
+
+
+def ensure_extensions():
+    """Install the PostgreSQL extensions the schema depends on"""
+    with db.engine.begin() as connection:
+        for extension in EXTENSIONS:
+            connection.execute(text(f'CREATE EXTENSION IF NOT EXISTS {extension}'))
+
+
+def ensure_indexes():
+    """
+    Create every index declared on the models if it does not exist yet.
+    Safe to run repeatedly; returns the names of the indexes checked.
+    """
+    ensure_extensions()
+    engine = db.engine
+    names = []
+    for table in db.metadata.sorted_tables:
+        for index in sorted(table.indexes, key=lambda ix: ix.name):
+            index.create(bind=engine, checkfirst=True)
+            names.append(index.name)
+    return names
+
+
+def explain(statement, analyze=True):
+    """Run EXPLAIN for a SQLAlchemy statement and return the plan lines"""
+    connection = db.session.connection()
+    # Render parameters inline (enums, IN lists, timestamps); the 'named'
+    # paramstyle keeps literal % characters (LIKE, pg_trgm) unescaped.
+    dialect = type(connection.dialect)(paramstyle='named')
+    sql = statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True})
+    prefix = 'EXPLAIN ANALYZE' if analyze else 'EXPLAIN'
+    result = connection.exec_driver_sql(f'{prefix} {sql}')
+    return [row[0] for row in result]
+
+
+def hot_queries():
+    """
+    The query shapes used by the route modules, keyed by a short label, each
+    with the names of the indexes meant to answer it (any one will do).
+    """
+    today = date.today()
+    now = datetime.now()
+    month_start = date(today.year, today.month, 1)
+
+    return {
+        'doctor availability (doctor_id, date_time)': (
+            db.select(Appointment.id).where(
+                Appointment.doctor_id == 1,
+                Appointment.date_time.between(now - timedelta(minutes=30), now + timedelta(minutes=30)),
+                Appointment.status.in_([AppointmentStatus.pending, AppointmentStatus.confirmed])
+            ),
+            ('ix_appointments_doctor_date_time', 'ex_appointments_doctor_overlap')
+        ),
+        'doctor dashboard (doctor_id, date_time)': (
+            db.select(Appointment.id).where(
+                Appointment.doctor_id == 1,
+                on_date_filter(Appointment.date_time, today)
+            ),
+            ('ix_appointments_doctor_date_time',)
+        ),
+        'recent visits (doctor_id, created_at)': (
+            db.select(MedicalVisit.id).where(
+                MedicalVisit.doctor_id == 1
+            ).order_by(MedicalVisit.created_at.desc()).limit(5),
+            ('ix_medical_visits_doctor_created_at',)
+        ),
+        'revenue (status, paid_at)': (
+            db.select(func.sum(Invoice.total_amount)).where(
+                Invoice.status == InvoiceStatus.paid,
+                date_range_filter(Invoice.paid_at, month_start, today)
+            ),
+            ('ix_invoices_status_paid_at',)
+        ),
+        'active admission of patient': (
+            db.select(Admission.id).where(
+                Admission.patient_id == 1,
+                Admission.status == AdmissionStatus.active
+            ),
+            ('ix_admissions_active_patient',)
+        ),
+        'admissions list (status, admission_date)': (
+            db.select(Admission.id).where(
+                Admission.status == AdmissionStatus.discharged
+            ).order_by(Admission.admission_date.desc()).limit(20),
+            ('ix_admissions_status_admission_date',)
+        ),
+        'invoice items of invoice': (
+            db.select(InvoiceItem.id).where(
+                InvoiceItem.invoice_id == 1
+            ),
+            ('ix_invoice_items_invoice_id',)
+        ),
+        'patient search (pg_trgm)': (
+            db.select(Patient.id).where(
+                patient_search_filter('محمد')
+            ),
+            ('ix_patients_search_name_trgm',)
+        ),
+        'appointments list page (date_time)': (
+            db.select(Appointment.id).where(
+                Appointment.date_time <= now,
+                db.tuple_(Appointment.date_time, Appointment.id) < (now, 1000)
+            ).order_by(Appointment.date_time.desc(), Appointment.id.desc()).limit(21),
+            ('ix_appointments_date_time',)
+        ),
+        'invoices list page (created_at, id)': (
+            db.select(Invoice.id).where(
+                Invoice.created_at <= now,
+                db.tuple_(Invoice.created_at, Invoice.id) < (now, 1000)
+            ).order_by(Invoice.created_at.desc(), Invoice.id.desc()).limit(21),
+            ('ix_invoices_created_at_id',)
+        ),
+        'patients list page (created_at, id)': (
+            db.select(Patient.id).where(
+                Patient.created_at <= now,
+                db.tuple_(Patient.created_at, Patient.id) < (now, 1000)
+            ).order_by(Patient.created_at.desc(), Patient.id.desc()).limit(16),
+            ('ix_patients_created_at_id',)
+        ),
+    }
+
+
+def check_index_usage():
+    """
+    Explain every hot query with sequential scans disabled and report
+    whether the planner answers it from one of its expected indexes; any
+    other index (e.g. the primary key) does not count.
+
+    Returns a list of (label, uses_index, plan_lines). Sequential scans are
+    only disabled inside a transaction that is rolled back afterwards, so
+    small development tables do not hide a missing index.
+    """
+    results = []
+    try:
+        db.session.execute(text('SET LOCAL enable_seqscan = off'))
+        for label, (statement, index_names) in hot_queries().items():
+            plan = explain(statement, analyze=False)
+            pattern = re.compile(rf"\b(?:using|on) (?:{'|'.join(map(re.escape, index_names))})\b")
+            uses_index = any(pattern.search(line) for line in plan)
+            results.append((label, uses_index, plan))
+    finally:
+        db.session.rollback()
+    return results
@@ -0,0 +1,105 @@
+# app/services/invoicing.py
+
+from decimal import Decimal
+from app import db
+from app.models import Invoice, InvoiceItem, InvoiceStatus, Service
+
+
+# Same limit as the invoice form
+MAX_ITEM_QUANTITY = 100
+
+CENTS = Decimal('0.01')
+
+
+def price_items(lines):
+    """
+    Invoice items and total for lines of {'service_id', 'quantity'}.
+
+    All referenced services are fetched with one IN query. Raises
+    ValueError (with an Arabic message) for an empty invoice, a quantity
+    out of range or an unknown or inactive service.
+    Returns (list of item dicts, Decimal total).
+    """
+    lines = [
+        (line['service_id'], line.get('quantity', 1))
+        for line in lines if line['service_id'] > 0
+    ]
+    if not lines:
+        raise ValueError('يجب إضافة خدمة واحدة على الأقل.')
+    if any(not 1 <= quantity <= MAX_ITEM_QUANTITY for _, quantity in lines):
+        raise ValueError(f'الكمية يجب أن تكون بين 1 و {MAX_ITEM_QUANTITY}')
+
+    services = {
+        service.id: service
+        for service in Service.query.filter(
+            Service.id.in_({service_id for service_id, _ in lines}),
+            Service.is_active == True
+        )
+    }
+    missing = sorted({service_id for service_id, _ in lines} - services.keys())
+    if missing:
+        raise ValueError(f'خدمات غير موجودة أو غير نشطة: {", ".join(map(str, missing))}')
+
+    items = []
+    total_amount = Decimal('0')
+    for service_id, quantity in lines:
+        service = services[service_id]
+        line_total = service.cost_sdg * quantity
+        total_amount += line_total
+        items.append({
+            'service_name': service.name_ar,
+            'cost': service.cost_sdg,
+            'quantity': quantity,
+            'line_total': line_total,
+        })
+    return items, total_amount.quantize(CENTS)
+
+
+def create_invoice(patient_id, lines, status=InvoiceStatus.unpaid):
+    """
+    Create and commit an invoice for lines of {'service_id', 'quantity'}.
+
+    The invoice and its items are written in one flush: an INSERT for the
+    invoice, then one multi-row INSERT for all items (flushed through the
+    ORM so the cache, rollup and live event listeners see them).
+    Raises ValueError as price_items does. Returns (invoice, items).
+    """
+    items, total_amount = price_items(lines)
+
+    invoice = Invoice(
+        patient_id=patient_id,
+        total_amount=total_amount,
+        status=status
+    )
+    db.session.add(invoice)
+    db.session.add_all([
+        InvoiceItem(
+            invoice=invoice,
+            service_name=item['service_name'],
+            cost=item['cost'],
+            quantity=item['quantity']
+        )
+        for item in items
+    ])
+    db.session.commit()
+    return invoice, items
+
+
+def invoice_to_dict(invoice, items):
+    """JSON shape of an invoice created by create_invoice (amounts as strings)"""
+    return {
+        'id': invoice.id,
+        'patient_id': invoice.patient_id,
+        'status': invoice.status.value,
+        'total_amount': str(invoice.total_amount),
+        'created_at': invoice.created_at.isoformat() if invoice.created_at else None,
+        'items': [
+            {
+                'service_name': item['service_name'],
+                'cost': str(item['cost']),
+                'quantity': item['quantity'],
+                'line_total': str(item['line_total']),
+            }
+            for item in items
+        ],
+    }
@@ -0,0 +1,306 @@
+# app/services/jobs.py
+
+import json
+import os
+import threading
+import time
+import traceback
+from datetime import date, datetime, timedelta
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import ReportJob, JobStatus
+
+
+# kind -> handler(job, output_dir) returning (path, download filename, mimetype)
+JOB_HANDLERS = {}
+
+# Kinds whose jobs serve everyone asking with the same parameters; jobs of
+# other kinds belong to the user who requested them
+SHARED_KINDS = ('dashboard',)
+
+OPEN_STATUSES = (JobStatus.queued, JobStatus.running)
+
+
+def job_handler(kind):
+    """Register the function that executes jobs of the given kind"""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def _params_key(kind, params, user_id):
+    """
+    Canonical key of a job's parameters. Only one open job may exist per
+    kind and key, so the key of a per-user kind includes the requester.
+    """
+    if kind not in SHARED_KINDS:
+        params = {'params': params, 'requested_by': user_id}
+    return json.dumps(params, sort_keys=True, ensure_ascii=False)
+
+
+def _open_job(kind, params_key):
+    return ReportJob.query.filter(
+        ReportJob.kind == kind,
+        ReportJob.params_key == params_key,
+        ReportJob.status.in_(OPEN_STATUSES)
+    ).first()
+
+
+# ============================================================================
+# ENQUEUE / LOOKUP (web side)
+# ============================================================================
+
+def enqueue(kind, params, user_id):
+    """
+    Queue a job and return it. If an identical job is already open (queued
+    or running), that job is returned instead.
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    params_key = _params_key(kind, params, user_id)
+    job = ReportJob(
+        kind=kind,
+        params=params,
+        params_key=params_key,
+        requested_by=user_id
+    )
+    try:
+        # Savepoint: a concurrent request may have queued the same job
+        with db.session.begin_nested():
+            db.session.add(job)
+    except IntegrityError:
+        job = _open_job(kind, params_key)
+        if job is None:
+            raise
+    db.session.commit()
+    return job
+
+
+def find_or_enqueue(kind, params, user_id, max_age=None, retry=False):
+    """
+    Return a pending or recently finished job for the same kind and
+    parameters, queueing a new one if there is none. Results finished more
+    than max_age seconds ago (JOB_RESULT_MAX_AGE) are not reused. A recent
+    failure is returned as is rather than retried on every request; pass
+    retry=True (the user asked to try again) to queue a new job instead.
+    """
+    if max_age is None:
+        max_age = current_app.config.get('JOB_RESULT_MAX_AGE', 600)
+    fresh_after = datetime.utcnow() - timedelta(seconds=max_age)
+    finished = [JobStatus.succeeded] if retry else [JobStatus.succeeded, JobStatus.failed]
+
+    job = ReportJob.query.filter(
+        ReportJob.kind == kind,
+        ReportJob.params_key == _params_key(kind, params, user_id),
+        db.or_(
+            ReportJob.status.in_(OPEN_STATUSES),
+            db.and_(ReportJob.status.in_(finished), ReportJob.finished_at >= fresh_after)
+        )
+    ).order_by(ReportJob.id.desc()).first()
+
+    return job or enqueue(kind, params, user_id)
+
+
+def load_json_result(job):
+    """Parsed result of a succeeded job that produced JSON"""
+    with open(job.result_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+# ============================================================================
+# WORKER
+# ============================================================================
+
+def claim_next():
+    """
+    Mark the oldest queued job as running and return it, or None.
+    FOR UPDATE SKIP LOCKED lets several workers poll the same table.
+    """
+    job = ReportJob.query.filter(
+        ReportJob.status == JobStatus.queued
+    ).order_by(ReportJob.id).with_for_update(skip_locked=True).first()
+
+    if job is None:
+        db.session.rollback()
+        return None
+
+    job.status = JobStatus.running
+    job.started_at = job.heartbeat_at = datetime.utcnow()
+    job.attempts += 1
+    db.session.commit()
+    return job
+
+
+def _heartbeat(engine, job_id, interval, stop):
+    """Refresh heartbeat_at of a running job until stop is set"""
+    while not stop.wait(interval):
+        try:
+            with engine.begin() as conn:
+                conn.execute(
+                    db.update(ReportJob)
+                    .where(ReportJob.id == job_id, ReportJob.status == JobStatus.running)
+                    .values(heartbeat_at=datetime.utcnow())
+                )
+        except Exception:
+            # A missed beat only matters after JOB_STALE_AFTER; keep trying
+            pass
+
+
+def run_job(job):
+    """
+    Execute a claimed job and record its outcome. While the handler runs, a
+    thread refreshes the job's heartbeat_at on its own connection, so
+    requeue_stale leaves long jobs alone.
+    """
+    output_dir = current_app.config['JOB_RESULTS_FOLDER']
+    os.makedirs(output_dir, exist_ok=True)
+
+    stop = threading.Event()
+    heartbeat = threading.Thread(
+        target=_heartbeat,
+        args=(db.engine, job.id, current_app.config.get('JOB_HEARTBEAT_SECONDS', 60), stop),
+        daemon=True
+    )
+    heartbeat.start()
+    try:
+        path, filename, mimetype = JOB_HANDLERS[job.kind](job, output_dir)
+    except Exception:
+        db.session.rollback()
+        job.status = JobStatus.failed
+        job.error = traceback.format_exc()[-4000:]
+        current_app.logger.exception(f'Job {job.id} ({job.kind}) failed')
+    else:
+        job.status = JobStatus.succeeded
+        job.result_path = path
+        job.result_filename = filename
+        job.result_mimetype = mimetype
+        job.error = None
+    finally:
+        stop.set()
+        heartbeat.join()
+
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    return job
+
+
+def requeue_stale(timeout):
+    """
+    Put back running jobs whose worker has not sent a heartbeat for timeout
+    seconds (it died); jobs that already used JOB_MAX_ATTEMPTS are marked
+    failed. Jobs still running, however long, keep their heartbeat fresh.
+    """
+    max_attempts = current_app.config.get('JOB_MAX_ATTEMPTS', 3)
+    stale = ReportJob.query.filter(
+        ReportJob.status == JobStatus.running,
+        db.func.coalesce(ReportJob.heartbeat_at, ReportJob.started_at)
+        < datetime.utcnow() - timedelta(seconds=timeout)
+    ).with_for_update(skip_locked=True).all()
+
+    for job in stale:
+        if job.attempts >= max_attempts:
+            job.status = JobStatus.failed
+            job.error = 'Worker stopped while running the job'
+            job.finished_at = datetime.utcnow()
+        else:
+            job.status = JobStatus.queued
+    db.session.commit()
+    return len(stale)
+
+
+def purge_finished(days):
+    """Delete finished jobs older than the given number of days, with their files"""
+    old = ReportJob.query.filter(
+        ReportJob.status.in_([JobStatus.succeeded, JobStatus.failed]),
+        ReportJob.finished_at < datetime.utcnow() - timedelta(days=days)
+    ).all()
+
+    for job in old:
+        if job.result_path and os.path.exists(job.result_path):
+            os.remove(job.result_path)
+        db.session.delete(job)
+    db.session.commit()
+    return len(old)
+
+
+def run_worker(poll_interval=2.0, once=False, log=print):
+    """
+    Process queued jobs until interrupted. With once=True, stop as soon as
+    the queue is empty.
+    """
+    config = current_app.config
+    housekeeping_at = 0
+
+    while True:
+        if time.monotonic() >= housekeeping_at:
+            requeued = requeue_stale(config.get('JOB_STALE_AFTER', 600))
+            purged = purge_finished(config.get('JOB_RESULT_RETENTION_DAYS', 7))
+            if requeued or purged:
+                log(f'Requeued {requeued} stale jobs, purged {purged} old jobs')
+            housekeeping_at = time.monotonic() + 300
+
+        job = claim_next()
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+
+        log(f'Running job {job.id} ({job.kind})')
+        started = time.monotonic()
+        run_job(job)
+        log(f'Job {job.id} {job.status.value} in {time.monotonic() - started:.1f}s')
+        # Do not keep identity map contents between jobs
+        db.session.remove()
+
+
+# ============================================================================
+# HANDLERS
+# ============================================================================
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+@job_handler('dashboard')
+def _run_dashboard(job, output_dir):
+    """Reports dashboard statistics for a date range, stored as JSON"""
+    from app.services.stats_service import StatsService
+
+    start_date = date.fromisoformat(job.params['start_date'])
+    end_date = date.fromisoformat(job.params['end_date'])
+    stats = StatsService.get_dashboard_stats(start_date, end_date)
+
+    path = os.path.join(output_dir, f'job_{job.id}.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(stats, f, ensure_ascii=False, default=_json_default)
+    return path, f'dashboard_{start_date}_{end_date}.json', 'application/json'
+
+
+@job_handler('export')
+def _run_export(job, output_dir):
+    """Dataset export (see app.services.export) written to a file"""
+    from app.services.export import export_rows, csv_stream, xlsx_stream
+
+    dataset = job.params['dataset']
+    export_format = job.params['format']
+    start_date = date.fromisoformat(job.params['start_date'])
+    end_date = date.fromisoformat(job.params['end_date'])
+
+    title, headers, rows = export_rows(dataset, start_date, end_date)
+    if export_format == 'xlsx':
+        chunks = xlsx_stream(headers, rows, sheet_name=title)
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    else:
+        chunks = csv_stream(headers, rows)
+        mimetype = 'text/csv'
+
+    path = os.path.join(output_dir, f'job_{job.id}.{export_format}')
+    with open(path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+    return path, f'{dataset}_{start_date}_{end_date}.{export_format}', mimetype
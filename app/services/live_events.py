@@ -0,0 +1,361 @@
+# app/services/live_events.py
+
+import enum
+import itertools
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+from collections import deque
+from datetime import date, datetime
+from decimal import Decimal
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+from app.models import Appointment, Bed, Invoice, Patient
+
+
+logger = logging.getLogger(__name__)
+
+# Attributes sent for each tracked model. Events carry the row id and the
+# values before ('old') and after ('new') the change; old is None for a new
+# row and new is None for a deleted one. Only ids and statuses are sent, no
+# patient details.
+TRACKED = {
+    Appointment: ('appointment', ('doctor_id', 'date_time', 'status')),
+    Bed: ('bed', ('status', 'room_number', 'bed_label')),
+    Invoice: ('invoice', ('status', 'total_amount')),
+    Patient: ('patient', ()),
+}
+
+# Event types each permission is required for; others go to every user
+EVENT_PERMISSIONS = {
+    'invoice': 'billing.read',
+}
+
+
+# ============================================================================
+# IN-PROCESS BUS
+# ============================================================================
+
+class Subscription:
+    """Queue of events for one stream; flagged instead of blocking when full"""
+
+    def __init__(self, max_size):
+        self.queue = queue.Queue(max_size)
+        self.overflowed = False
+
+    def put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        return self.queue.get(timeout=timeout)
+
+
+class EventBus:
+    """
+    Fans events out to the subscribed streams of this process and keeps the
+    most recent ones, so a stream can resume from a cursor (the id of the
+    last event it saw) without missing anything.
+
+    On PostgreSQL events arrive with ids assigned by the writing transaction
+    and every process receives them in the same (commit) order, so a cursor
+    issued by another worker is resumed from its position in this buffer.
+    Otherwise ids are '<process token>-<sequence>'. A cursor that is not in
+    the buffer (it fell out, or another process saw events this one did
+    not) cannot be resumed: the stream asks the page to resync.
+    """
+
+    def __init__(self, buffer_size=256):
+        self._token = f'{os.getpid():x}{int(time.time()):x}'
+        self._sequence = itertools.count(1)
+        self._recent = deque(maxlen=buffer_size)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        # Cursor of a page rendered before this process saw any event
+        self._start_id = f'{self._token}-0'
+        self._last_id = self._start_id
+        self._dropped = False
+
+    def publish(self, payload, event_id=None):
+        with self._lock:
+            if event_id is None:
+                event_id = f'{self._token}-{next(self._sequence)}'
+            item = (event_id, payload)
+            self._dropped = self._dropped or len(self._recent) == self._recent.maxlen
+            self._recent.append(item)
+            self._last_id = event_id
+            for subscription in self._subscribers:
+                subscription.put(item)
+
+    def cursor(self):
+        """Id of the latest event"""
+        with self._lock:
+            return self._last_id
+
+    def subscribe(self, since=None, max_size=256):
+        """
+        Return (subscription, backlog). backlog lists the buffered events
+        after since, or is None when since cannot be resumed.
+        """
+        subscription = Subscription(max_size)
+        with self._lock:
+            backlog = [] if since is None else self._events_after(since)
+            self._subscribers.add(subscription)
+        return subscription, backlog
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def _events_after(self, since):
+        if since == self._start_id:
+            return None if self._dropped else list(self._recent)
+        for position, (event_id, _) in enumerate(self._recent):
+            if event_id == since:
+                return list(self._recent)[position + 1:]
+        # Another process's cursor, and this one has seen nothing since it
+        # started: whatever it receives from now on is newer
+        if not self._recent and not self._dropped:
+            return []
+        return None
+
+
+_bus = EventBus()
+_config = {
+    'enabled': True,
+    'channel': 'hospital_events',
+    'queue_size': 256,
+}
+
+
+def _cooperative_server():
+    """True when sockets are patched by gevent or eventlet (async workers)"""
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched('socket'):
+            return True
+    except ImportError:
+        pass
+    try:
+        from eventlet import patcher
+        return patcher.is_monkey_patched('socket')
+    except ImportError:
+        return False
+
+
+def init_app(app):
+    """Configure the bus from LIVE_EVENTS_* settings"""
+    global _bus
+    _config['enabled'] = app.config.get('LIVE_EVENTS_ENABLED', False)
+    _config['channel'] = app.config.get('LIVE_EVENTS_CHANNEL', 'hospital_events')
+    _config['queue_size'] = app.config.get('LIVE_EVENTS_BUFFER', 256)
+    _bus = EventBus(_config['queue_size'])
+
+    if _config['enabled'] and not (app.debug or app.testing or _cooperative_server()):
+        logger.warning(
+            'LIVE_EVENTS_ENABLED: every open /events stream holds a worker; '
+            'serve the app with gevent or eventlet workers (gunicorn -k gevent)'
+        )
+
+    @app.context_processor
+    def inject_live_cursor():
+        return {'live_events_cursor': cursor, 'live_events_enabled': is_enabled}
+
+
+def get_bus():
+    return _bus
+
+
+def cursor():
+    """Cursor for a page being rendered: its stream resumes from here"""
+    _ensure_listener()
+    return _bus.cursor()
+
+
+def is_enabled():
+    return _config['enabled']
+
+
+def subscribe(since=None):
+    _ensure_listener()
+    return _bus.subscribe(since, _config['queue_size'])
+
+
+def unsubscribe(subscription):
+    _bus.unsubscribe(subscription)
+
+
+def hidden_types(user):
+    """Event types the user is not allowed to receive"""
+    if user.role and user.role.name == 'Super Admin':
+        return set()
+    return {kind for kind, slug in EVENT_PERMISSIONS.items() if not user.can(slug)}
+
+
+# ============================================================================
+# POSTGRESQL LISTEN/NOTIFY
+# ============================================================================
+#
+# On PostgreSQL, events are sent with pg_notify inside the writing
+# transaction, so they are delivered (to every process) only if it commits.
+# Each process runs one listener thread on a dedicated connection and feeds
+# the notifications to its bus. Other databases publish to the bus of the
+# writing process after commit.
+
+_listener = {'thread': None, 'engine': None}
+_listener_lock = threading.Lock()
+
+
+def _uses_notify(bind):
+    return bind.dialect.name == 'postgresql'
+
+
+def _ensure_listener():
+    from app import db
+
+    if not _config['enabled'] or not _uses_notify(db.engine):
+        return
+    with _listener_lock:
+        thread = _listener['thread']
+        if thread is not None and thread.is_alive():
+            return
+        _listener['engine'] = db.engine
+        thread = threading.Thread(target=_listen, name='live-events', daemon=True)
+        _listener['thread'] = thread
+        thread.start()
+
+
+def _listen():
+    channel = _config['channel']
+    while True:
+        connection = None
+        try:
+            # Detached from the pool, so the listener never holds a pooled slot
+            connection = _listener['engine'].raw_connection()
+            dbapi_connection = connection.driver_connection
+            connection.detach()
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as db_cursor:
+                db_cursor.execute(f'LISTEN "{channel}"')
+
+            while True:
+                if select.select([dbapi_connection], [], [], 30) == ([], [], []):
+                    continue
+                dbapi_connection.poll()
+                while dbapi_connection.notifies:
+                    notification = dbapi_connection.notifies.pop(0)
+                    event_id, payload = json.loads(notification.payload)
+                    _bus.publish(payload, event_id)
+        except Exception:
+            logger.exception('Live events listener failed; reconnecting')
+            time.sleep(5)
+        finally:
+            if connection is not None:
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+
+
+# ============================================================================
+# CHANGE TRACKING
+# ============================================================================
+
+def _plain(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _load_old_value(target, value, oldvalue, initiator):
+    pass
+
+
+# active_history makes SQLAlchemy load the previous value when an attribute
+# of an expired instance is assigned, so 'old' is always known
+for _model, (_, _attributes) in TRACKED.items():
+    for _attribute in _attributes:
+        event.listen(getattr(_model, _attribute), 'set', _load_old_value, active_history=True)
+
+
+def _snapshot(state, attributes, before):
+    values = {}
+    for attribute in attributes:
+        history = state.attrs[attribute].history
+        changed = history.deleted if before else history.added
+        current = changed or history.unchanged
+        values[attribute] = _plain(current[0]) if current else None
+    return values
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_events(session, flush_context):
+    if not _config['enabled']:
+        return
+    written = [(obj, 'new') for obj in session.new]
+    written += [(obj, 'dirty') for obj in session.dirty]
+    written += [(obj, 'deleted') for obj in session.deleted]
+
+    events = []
+    for obj, change in written:
+        tracked = TRACKED.get(type(obj))
+        if tracked is None:
+            continue
+        kind, attributes = tracked
+        state = inspect(obj)
+        if change == 'dirty' and not any(
+            state.attrs[attribute].history.has_changes() for attribute in attributes
+        ):
+            continue
+        events.append({
+            'type': kind,
+            'id': obj.id,
+            'old': None if change == 'new' else _snapshot(state, attributes, before=True),
+            'new': None if change == 'deleted' else _snapshot(state, attributes, before=False),
+        })
+
+    if events:
+        session.info.setdefault('live_events', []).extend(events)
+
+
+@event.listens_for(Session, 'before_commit')
+def _notify_events(session):
+    if not _config['enabled']:
+        return
+    session.flush()
+    events = session.info.get('live_events')
+    if not events or not _uses_notify(session.get_bind()):
+        return
+    session.info.pop('live_events')
+    # Ids every process agrees on: the writing transaction and the position
+    transaction_id = session.execute(text('SELECT txid_current()')).scalar()
+    for position, payload in enumerate(events):
+        session.execute(
+            text('SELECT pg_notify(:channel, :payload)'),
+            {
+                'channel': _config['channel'],
+                'payload': json.dumps([f'{transaction_id}-{position}', payload])
+            }
+        )
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_events(session):
+    # Only reached with events when the database has no LISTEN/NOTIFY
+    for payload in session.info.pop('live_events', ()):
+        _bus.publish(payload)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_events(session):
+    session.info.pop('live_events', None)
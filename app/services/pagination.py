@@ -0,0 +1,213 @@
+# app/services/pagination.py
+
+import base64
+import binascii
+import json
+import re
+from datetime import date, datetime
+from decimal import Decimal
+from flask import current_app
+from sqlalchemy import and_, or_, text, tuple_
+from app import db
+
+
+# ============================================================================
+# CURSORS
+# ============================================================================
+#
+# A cursor holds the sort key of the row a page starts after (or ends
+# before), as URL-safe base64 JSON. Dates are tagged so they decode back to
+# the same type. A cursor that does not decode is ignored (first page).
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'n': str(value)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+        if 'n' in value:
+            return Decimal(value['n'])
+    return value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_encode_value(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Sort key stored in a cursor, or None when it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = [_decode_value(value) for value in json.loads(raw)]
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        return None
+    return values if len(values) == size else None
+
+
+# ============================================================================
+# COUNTS
+# ============================================================================
+
+_PLAN_ROWS = re.compile(r'rows=(\d+)')
+
+
+def _estimated_count(query):
+    """
+    Row count from PostgreSQL statistics: pg_class.reltuples for a whole
+    table, the planner's estimate for a filtered query. None when unknown.
+    """
+    from app.services.indexes import explain
+
+    statement = query.enable_eagerloads(False).order_by(None).statement
+    tables = statement.get_final_froms()
+    if statement.whereclause is None and len(tables) == 1 and hasattr(tables[0], 'fullname'):
+        estimate = db.session.execute(
+            text('SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)'),
+            {'table': tables[0].fullname}
+        ).scalar()
+        # -1: never analyzed
+        return estimate if estimate is not None and estimate >= 0 else None
+
+    match = _PLAN_ROWS.search(explain(statement, analyze=False)[0])
+    return int(match.group(1)) if match else None
+
+
+def count_rows(query, mode='estimate'):
+    """
+    Rows matched by query, as (total, is_estimate).
+
+    mode 'exact' runs COUNT(*); 'estimate' uses PostgreSQL statistics and
+    only counts exactly when the estimate is below
+    PAGINATION_EXACT_COUNT_BELOW (counting a small set is cheap and the
+    statistics of small tables are coarse).
+    """
+    if mode == 'estimate' and db.session.get_bind().dialect.name == 'postgresql':
+        estimate = _estimated_count(query)
+        if estimate is not None and estimate >= current_app.config.get('PAGINATION_EXACT_COUNT_BELOW', 1000):
+            return estimate, True
+    return query.enable_eagerloads(False).order_by(None).count(), False
+
+
+# ============================================================================
+# KEYSET PAGINATION
+# ============================================================================
+#
+# Pages are found by seeking past the sort key of the previous page's edge
+# row (WHERE (date_time, id) < (:date_time, :id)) instead of OFFSET, so
+# page 1000 costs the same as page 1 and no COUNT(*) is needed to page.
+# The last key must be unique (the primary key). The first key may be
+# NULL: PostgreSQL sorts NULL above every value, which the seek condition
+# follows.
+
+class KeysetPage:
+    """One page of a keyset-paginated query"""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None, total_is_estimate=False):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+        self.total_is_estimate = total_is_estimate
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def _nullable(key):
+    return bool(getattr(getattr(key, 'expression', key), 'nullable', False))
+
+
+def _seek(keys, values, downward):
+    """Condition selecting the rows after values when scanning keys down (or up)"""
+    def beyond(columns, bounds):
+        if len(columns) == 1:
+            return columns[0] < bounds[0] if downward else columns[0] > bounds[0]
+        row, bound = tuple_(*columns), tuple_(*bounds)
+        return row < bound if downward else row > bound
+
+    first, rest = keys[0], keys[1:]
+    if values[0] is None:
+        # Within the NULL group, then (scanning down) every non-NULL row
+        within = and_(first.is_(None), beyond(rest, values[1:]))
+        return or_(within, first.isnot(None)) if downward else within
+
+    condition = beyond(keys, values)
+    if rest:
+        # The bound on the first key alone lets an index on that column serve
+        condition = and_(first <= values[0] if downward else first >= values[0], condition)
+    if not downward and _nullable(first):
+        condition = or_(condition, first.is_(None))
+    return condition
+
+
+def keyset_paginate(query, keys, per_page=20, after=None, before=None, descending=True, count='estimate'):
+    """
+    Page of an ORM query ordered by keys, e.g. (Appointment.date_time,
+    Appointment.id).
+
+    Args:
+        query: Filtered query, without ORDER BY (keys define the order)
+        keys (tuple): Sort columns or expressions; the last one unique
+        per_page (int): Rows per page
+        after (str): Cursor of the page to follow (next_cursor)
+        before (str): Cursor of the page to precede (prev_cursor)
+        descending (bool): Sort direction of every key
+        count (str): 'estimate', 'exact' or None for no total
+
+    Returns a KeysetPage whose next_cursor and prev_cursor are None at
+    either end.
+    """
+    keys = tuple(keys)
+    after_values = decode_cursor(after, len(keys))
+    before_values = None if after_values else decode_cursor(before, len(keys))
+    backward = before_values is not None
+    values = before_values if backward else after_values
+
+    # Scanning backward reads the preceding rows in reverse order
+    downward = descending != backward
+    ordered = query.add_columns(*(key.label(f'_keyset_{i}') for i, key in enumerate(keys)))
+    if values is not None:
+        ordered = ordered.filter(_seek(keys, values, downward))
+    ordered = ordered.order_by(*(key.desc() if downward else key.asc() for key in keys))
+
+    rows = ordered.limit(per_page + 1).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backward:
+        rows.reverse()
+
+    items = [row[0] for row in rows]
+    next_cursor = prev_cursor = None
+    if rows:
+        first_key, last_key = rows[0][1:], rows[-1][1:]
+        if more or backward:
+            next_cursor = encode_cursor(last_key)
+        if (more and backward) or after_values is not None:
+            prev_cursor = encode_cursor(first_key)
+
+    total, total_is_estimate = None, False
+    if count and next_cursor is None and prev_cursor is None:
+        # Everything fits on this page
+        total = len(items)
+    elif count:
+        total, total_is_estimate = count_rows(query, count)
+    return KeysetPage(items, per_page, next_cursor, prev_cursor, total, total_is_estimate)
@@ -0,0 +1,53 @@
+# app/services/parallel.py
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from app.services.query_stats import bind_counter, current_counter
+
+
+# Shared executors keyed by size. One process-wide pool (rather than one per
+# request) caps the connections all concurrent requests can take together.
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def _get_executor(max_workers):
+    with _executors_lock:
+        executor = _executors.get(max_workers)
+        if executor is None:
+            executor = _executors[max_workers] = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix='stats'
+            )
+        return executor
+
+
+def run_parallel(tasks, max_workers=None):
+    """
+    Run independent read-only callables concurrently and collect the results.
+
+    Args:
+        tasks (dict): Result key -> (callable, args tuple)
+        max_workers (int): Concurrency cap; defaults to STATS_MAX_WORKERS
+
+    Every task runs in its own application context, so it gets its own
+    session and pooled connection (returned when the context ends), and its
+    queries count towards the calling request. With a cap of 1 or less the
+    tasks run one after another on the caller's session.
+    """
+    if max_workers is None:
+        max_workers = current_app.config.get('STATS_MAX_WORKERS', 1)
+
+    if max_workers <= 1 or len(tasks) <= 1:
+        return {key: func(*args) for key, (func, args) in tasks.items()}
+
+    app = current_app._get_current_object()
+    counter = current_counter()
+
+    def call(func, args):
+        with app.app_context(), bind_counter(counter):
+            return func(*args)
+
+    executor = _get_executor(max_workers)
+    futures = {key: executor.submit(call, func, args) for key, (func, args) in tasks.items()}
+    return {key: future.result() for key, future in futures.items()}
@@ -0,0 +1,124 @@
+# app/services/patient_search.py
+
+from sqlalchemy import exists, func, or_
+from app import db
+from app.models import Patient, Admission, AdmissionStatus
+from app.services.text_normalization import normalize_arabic
+
+
+def search_filter(search_query):
+    """
+    Criterion matching patients by name, phone or file number.
+
+    Names are compared in normalized form, so alef/yaa/taa-marbuta variants
+    and diacritics do not matter. Substring matches and trigram-similar names
+    (the pg_trgm % operator) both qualify; all branches can use the GIN
+    trigram indexes declared on Patient.
+    """
+    normalized = normalize_arabic(search_query)
+    raw = search_query.strip()
+
+    return or_(
+        Patient.search_name.icontains(normalized, autoescape=True),
+        Patient.search_name.op('%')(normalized),
+        Patient.phone.icontains(raw, autoescape=True),
+        Patient.file_number.icontains(raw, autoescape=True)
+    )
+
+
+def search_rank(search_query):
+    """Similarity score (0..1) of the best matching field, for ordering"""
+    normalized = normalize_arabic(search_query)
+    raw = search_query.strip()
+
+    return func.greatest(
+        func.similarity(Patient.search_name, normalized),
+        func.similarity(func.coalesce(Patient.phone, ''), raw),
+        func.similarity(Patient.file_number, raw)
+    )
+
+
+def search_patients(search_query):
+    """Query of patients matching the search, best matches first"""
+    return Patient.query.filter(
+        search_filter(search_query)
+    ).order_by(
+        search_rank(search_query).desc(),
+        Patient.id.desc()
+    )
+
+
+def typeahead(search_query, limit=10, page=1, available_for_admission=False):
+    """
+    One page of matches for autocomplete widgets, as plain dicts.
+
+    Only the columns shown in the dropdown are selected. Without a search
+    query the most recently registered patients are returned. Returns
+    {'results': [...], 'more': bool} so widgets can request the next page.
+    """
+    query = db.session.query(
+        Patient.id,
+        Patient.file_number,
+        Patient.full_name,
+        Patient.phone
+    )
+
+    if available_for_admission:
+        # Uses the partial index on active admissions
+        query = query.filter(~exists().where(
+            Admission.patient_id == Patient.id,
+            Admission.status == AdmissionStatus.active
+        ))
+
+    if search_query:
+        query = query.filter(
+            search_filter(search_query)
+        ).order_by(
+            search_rank(search_query).desc(),
+            Patient.id.desc()
+        )
+    else:
+        query = query.order_by(Patient.id.desc())
+
+    # Fetch one extra row to know whether another page exists
+    rows = query.offset((page - 1) * limit).limit(limit + 1).all()
+
+    return {
+        'results': [{
+            'id': r.id,
+            'file_number': r.file_number,
+            'full_name': r.full_name,
+            'phone': r.phone,
+            'label': patient_label(r)
+        } for r in rows[:limit]],
+        'more': len(rows) > limit
+    }
+
+
+def rebuild_search_names(batch_size=1000, missing_only=False):
+    """
+    Recompute Patient.search_name from full_name (after normalize_arabic
+    changes, or for rows written before the column existed). With
+    missing_only, only patients without a search name are visited.
+    Commits and returns the number of patients updated.
+    """
+    query = Patient.query
+    if missing_only:
+        query = query.filter(Patient.search_name.is_(None))
+
+    updated = 0
+    for patient in query.order_by(Patient.id).yield_per(batch_size):
+        search_name = normalize_arabic(patient.full_name)
+        if patient.search_name != search_name:
+            patient.search_name = search_name
+            updated += 1
+            if updated % batch_size == 0:
+                db.session.flush()
+
+    db.session.commit()
+    return updated
+
+
+def patient_label(patient):
+    """Display label used by patient pickers"""
+    return f'{patient.full_name} - {patient.file_number}'
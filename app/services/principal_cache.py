@@ -0,0 +1,81 @@
+# app/services/principal_cache.py
+
+import threading
+import time
+from flask import current_app
+from sqlalchemy.orm import joinedload
+from app import db
+from app.models import User, Role
+from app.services import stats_cache
+
+# Process-local cache of authenticated principals:
+# user_id -> (generation, expires_at, detached User with role + permissions loaded)
+_principals = {}
+_lock = threading.Lock()
+
+# Cache tag written by every committed User or Role change (see
+# stats_cache.TAGS_BY_TABLE). Its version is shared by all worker processes,
+# so a principal cached before the change is ignored everywhere.
+PRINCIPALS_TAG = 'principals'
+
+
+def _generation():
+    return stats_cache.tag_versions(PRINCIPALS_TAG)
+
+
+def bump_generation():
+    """Invalidate every cached principal, in every worker process"""
+    with _lock:
+        _principals.clear()
+    stats_cache.invalidate(PRINCIPALS_TAG)
+
+
+def _query_principal(user_id):
+    """Load user, role and role permissions in a single joined query"""
+    return User.query.options(
+        joinedload(User.role).joinedload(Role.permissions)
+    ).filter(User.id == user_id).first()
+
+
+def load_principal(user_id):
+    """
+    Load the user for Flask-Login.
+
+    When PRINCIPAL_CACHE_TTL (seconds) is set, the loaded user is kept detached
+    in a process-local cache and merged into the request session without SQL.
+    Entries expire after the TTL or once a change to any user or role is
+    committed: at once in the committing process, and in other worker
+    processes as soon as they refresh the shared cache tag versions (every
+    STATS_CACHE_VERSION_REFRESH_SECONDS, immediately with redis).
+    """
+    ttl = current_app.config.get('PRINCIPAL_CACHE_TTL', 0)
+    if not ttl:
+        return _query_principal(user_id)
+
+    now = time.monotonic()
+    # Read before loading, so a change committed meanwhile makes the new
+    # entry stale instead of hiding behind it
+    generation = _generation()
+    with _lock:
+        entry = _principals.get(user_id)
+
+    if entry is not None and entry[0] == generation and entry[1] > now:
+        return db.session.merge(entry[2], load=False)
+
+    user = _query_principal(user_id)
+    if user is None:
+        return None
+
+    # Keep a detached copy; the request works on its own session-bound instance
+    role = user.role
+    permissions = list(role.permissions) if role else []
+    db.session.expunge(user)
+    if role is not None:
+        db.session.expunge(role)
+        for perm in permissions:
+            db.session.expunge(perm)
+
+    with _lock:
+        _principals[user_id] = (generation, now + ttl, user)
+
+    return db.session.merge(user, load=False)
@@ -0,0 +1,230 @@
+# app/services/query_stats.py
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Upper bounds (ms) of the request duration histogram buckets; the last
+# bucket collects everything slower.
+HISTOGRAM_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500)
+
+# Rolling per-endpoint samples: endpoint -> deque of
+# (query_count, db_ms, total_ms, slowest_ms, slowest_statement)
+_samples = {}
+_samples_lock = threading.Lock()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in test mode when a view issues more queries than its budget"""
+
+
+class QueryCounter:
+    """
+    SQL statements and time of one request. Shared with the worker threads
+    the request fans out to (see bind_counter), hence the lock.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.slowest_time = 0.0
+        self.slowest = None
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add_query(self):
+        with self._lock:
+            self.count += 1
+
+    def add_time(self, elapsed, statement):
+        with self._lock:
+            self.time += elapsed
+            if elapsed > self.slowest_time:
+                self.slowest_time = elapsed
+                self.slowest = statement
+
+
+# Counter bound to a worker thread running on behalf of a request
+_bound = threading.local()
+
+
+def current_counter():
+    """Counter of the request this thread works for, or None"""
+    counter = getattr(_bound, 'counter', None)
+    if counter is None and has_request_context():
+        counter = g.get('query_counter')
+    return counter
+
+
+@contextmanager
+def bind_counter(counter):
+    """Count the queries of this thread (a pool worker) into counter"""
+    previous = getattr(_bound, 'counter', None)
+    _bound.counter = counter
+    try:
+        yield
+    finally:
+        _bound.counter = previous
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = current_counter()
+    if counter is not None:
+        counter.add_query()
+        if context is not None:
+            context._query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _time_query(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_query_started', None)
+    counter = current_counter()
+    if started is None or counter is None:
+        return
+    counter.add_time(time.perf_counter() - started, statement)
+
+
+def get_query_count():
+    """Number of SQL statements executed so far in the current request"""
+    counter = current_counter()
+    return counter.count if counter is not None else 0
+
+
+def get_query_time():
+    """Seconds spent executing SQL so far in the current request"""
+    counter = current_counter()
+    return counter.time if counter is not None else 0.0
+
+
+def _reset_query_count():
+    g.query_counter = QueryCounter()
+
+
+def _check_query_budget(response):
+    """Compare the request's query count with the budget declared on its view"""
+    view = current_app.view_functions.get(request.endpoint)
+    budget = getattr(view, 'query_budget', None)
+    if budget is None:
+        return response
+
+    count = get_query_count()
+    if count > budget:
+        message = f'{request.endpoint} issued {count} queries (budget {budget})'
+        if current_app.config.get('QUERY_BUDGET_ENFORCED'):
+            raise QueryBudgetExceeded(message)
+        current_app.logger.warning(message)
+
+    return response
+
+
+def _record_request(response):
+    """Emit Server-Timing and a log line, and add the request to the histogram"""
+    if not current_app.config.get('SQL_INSTRUMENTATION') or request.endpoint in (None, 'static'):
+        return response
+
+    count = get_query_count()
+    db_ms = get_query_time() * 1000
+    counter = current_counter() or QueryCounter()
+    total_ms = (time.perf_counter() - counter.started) * 1000
+    slowest_ms = counter.slowest_time * 1000
+    slowest = counter.slowest
+
+    response.headers.add(
+        'Server-Timing',
+        f'db;dur={db_ms:.1f};desc="{count} queries", total;dur={total_ms:.1f}'
+    )
+
+    stats = {
+        'endpoint': request.endpoint,
+        'method': request.method,
+        'status': response.status_code,
+        'queries': count,
+        'db_ms': round(db_ms, 1),
+        'total_ms': round(total_ms, 1),
+        'slowest_ms': round(slowest_ms, 1),
+    }
+    current_app.logger.info(
+        'sql ' + ' '.join(f'{key}={value}' for key, value in stats.items()),
+        extra={'sql_stats': dict(stats, slowest=slowest)}
+    )
+
+    window = current_app.config.get('SQL_STATS_WINDOW', 200)
+    with _samples_lock:
+        samples = _samples.get(request.endpoint)
+        if samples is None:
+            samples = _samples[request.endpoint] = deque(maxlen=window)
+        samples.append((count, db_ms, total_ms, slowest_ms, slowest))
+
+    return response
+
+
+def _percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def get_endpoint_stats():
+    """
+    Summary of the recent requests of every endpoint, slowest total DB time
+    first. Each entry carries averages, percentiles, the duration histogram
+    (one count per HISTOGRAM_BUCKETS entry plus an overflow bucket) and the
+    slowest statement seen in the window.
+    """
+    with _samples_lock:
+        snapshot = {endpoint: list(samples) for endpoint, samples in _samples.items()}
+
+    summary = []
+    for endpoint, samples in snapshot.items():
+        if not samples:
+            continue
+        requests_count = len(samples)
+        query_counts = [s[0] for s in samples]
+        db_times = [s[1] for s in samples]
+        total_times = sorted(s[2] for s in samples)
+        slowest = max(samples, key=lambda s: s[3])
+
+        histogram = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        for total_ms in total_times:
+            bucket = next(
+                (i for i, bound in enumerate(HISTOGRAM_BUCKETS) if total_ms <= bound),
+                len(HISTOGRAM_BUCKETS)
+            )
+            histogram[bucket] += 1
+
+        summary.append({
+            'endpoint': endpoint,
+            'requests': requests_count,
+            'avg_queries': sum(query_counts) / requests_count,
+            'max_queries': max(query_counts),
+            'avg_db_ms': sum(db_times) / requests_count,
+            'total_db_ms': sum(db_times),
+            'p50_ms': _percentile(total_times, 0.5),
+            'p95_ms': _percentile(total_times, 0.95),
+            'max_ms': total_times[-1],
+            'histogram': histogram,
+            'slowest_ms': slowest[3],
+            'slowest_query': slowest[4],
+        })
+
+    summary.sort(key=lambda s: s['total_db_ms'], reverse=True)
+    return summary
+
+
+def reset_endpoint_stats():
+    """Drop every recorded sample"""
+    with _samples_lock:
+        _samples.clear()
+
+
+def init_app(app):
+    """Register the per-request query counter, budget check and timing hooks"""
+    app.before_request(_reset_query_count)
+    app.after_request(_check_query_budget)
+    app.after_request(_record_request)
@@ -0,0 +1,288 @@
+# app/services/rollups.py
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import Date, and_, case, cast, delete, event, extract, func, insert, inspect, or_, select, text
+from sqlalchemy.orm import Session
+from app import db
+from app.services.date_range import date_range_filter
+from app.models import (
+    Invoice, InvoiceItem, InvoiceStatus, Appointment, Admission, AdmissionStatus, Patient,
+    DailyRevenue, DailyAppointments, DailyActivity, DailyServiceUsage
+)
+
+
+# ============================================================================
+# DAY REFRESH
+# ============================================================================
+#
+# Each fact table is rebuilt for a range of days from the raw tables. Write
+# paths refresh only the days they touched; the backfill command refreshes
+# the whole history in chunks.
+
+def _refresh_revenue(start, end):
+    paid = Invoice.status == InvoiceStatus.paid
+    day = cast(case((paid, Invoice.paid_at), else_=Invoice.created_at), Date)
+    rows = db.session.query(
+        day.label('day'),
+        Invoice.status,
+        func.count(Invoice.id).label('invoice_count'),
+        func.coalesce(func.sum(Invoice.total_amount), 0).label('total_amount')
+    ).filter(or_(
+        and_(paid, date_range_filter(Invoice.paid_at, start, end)),
+        and_(~paid, date_range_filter(Invoice.created_at, start, end))
+    )).group_by(day, Invoice.status).all()
+
+    return DailyRevenue, [row._asdict() for row in rows]
+
+
+def _refresh_appointments(start, end):
+    day = cast(Appointment.date_time, Date)
+    rows = db.session.query(
+        day.label('day'),
+        Appointment.doctor_id,
+        Appointment.status,
+        func.count(Appointment.id).label('count')
+    ).filter(
+        date_range_filter(Appointment.date_time, start, end)
+    ).group_by(day, Appointment.doctor_id, Appointment.status).all()
+
+    return DailyAppointments, [row._asdict() for row in rows]
+
+
+def _refresh_activity(start, end):
+    days = defaultdict(lambda: {
+        'new_patients': 0, 'admissions': 0, 'discharges': 0, 'discharged_stay_days': 0
+    })
+
+    registered = cast(Patient.created_at, Date)
+    for day, count in db.session.query(registered, func.count(Patient.id)).filter(
+        date_range_filter(Patient.created_at, start, end)
+    ).group_by(registered):
+        days[day]['new_patients'] = count
+
+    admitted = cast(Admission.admission_date, Date)
+    for day, count in db.session.query(admitted, func.count(Admission.id)).filter(
+        date_range_filter(Admission.admission_date, start, end)
+    ).group_by(admitted):
+        days[day]['admissions'] = count
+
+    # Whole days stayed, matching timedelta.days of (discharge - admission)
+    stay_days = func.floor(
+        extract('epoch', Admission.discharge_date - Admission.admission_date) / 86400
+    )
+    discharged = cast(Admission.discharge_date, Date)
+    for day, count, total_days in db.session.query(
+        discharged, func.count(Admission.id), func.coalesce(func.sum(stay_days), 0)
+    ).filter(
+        Admission.status == AdmissionStatus.discharged,
+        date_range_filter(Admission.discharge_date, start, end)
+    ).group_by(discharged):
+        days[day]['discharges'] = count
+        days[day]['discharged_stay_days'] = int(total_days)
+
+    return DailyActivity, [dict(values, day=day) for day, values in days.items()]
+
+
+def _refresh_service_usage(start, end):
+    day = cast(Invoice.created_at, Date)
+    rows = db.session.query(
+        day.label('day'),
+        InvoiceItem.service_name,
+        func.count(InvoiceItem.id).label('usage_count'),
+        func.coalesce(func.sum(InvoiceItem.cost * InvoiceItem.quantity), 0).label('revenue')
+    ).join(
+        Invoice, InvoiceItem.invoice_id == Invoice.id
+    ).filter(
+        date_range_filter(Invoice.created_at, start, end)
+    ).group_by(day, InvoiceItem.service_name).all()
+
+    return DailyServiceUsage, [row._asdict() for row in rows]
+
+
+FACTS = {
+    'revenue': _refresh_revenue,
+    'appointments': _refresh_appointments,
+    'activity': _refresh_activity,
+    'services': _refresh_service_usage,
+}
+
+
+def _lock_days(fact, start, end):
+    """Serialize refreshes of the same days across concurrent transactions"""
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return
+    day = start
+    while day <= end:
+        db.session.execute(
+            text('SELECT pg_advisory_xact_lock(hashtext(:fact), :day)'),
+            {'fact': f'rollup:{fact}', 'day': day.toordinal()}
+        )
+        day += timedelta(days=1)
+
+
+def refresh_days(fact, start, end=None):
+    """
+    Rebuild one fact table for the days start..end (inclusive) in the
+    current transaction. Returns the number of rows written.
+    """
+    end = end or start
+    _lock_days(fact, start, end)
+    model, rows = FACTS[fact](start, end)
+    db.session.execute(delete(model).where(model.day.between(start, end)))
+    if rows:
+        db.session.execute(insert(model), rows)
+    return len(rows)
+
+
+def is_empty():
+    """True while no fact table has any row, e.g. right after they were created"""
+    return not any(
+        db.session.scalar(select(select(model.day).limit(1).exists()))
+        for model in (DailyRevenue, DailyAppointments, DailyActivity, DailyServiceUsage)
+    )
+
+
+def data_range():
+    """First and last day with any source data, or (None, None)"""
+    candidates = [
+        db.session.query(func.min(column), func.max(column)).one()
+        for column in (
+            Invoice.created_at, Invoice.paid_at, Appointment.date_time,
+            Patient.created_at, Admission.admission_date, Admission.discharge_date
+        )
+    ]
+    firsts = [first for first, _ in candidates if first is not None]
+    lasts = [last for _, last in candidates if last is not None]
+    if not firsts:
+        return None, None
+    return _as_day(min(firsts)), _as_day(max(lasts))
+
+
+def backfill(start=None, end=None, chunk_days=31, on_chunk=None):
+    """
+    Rebuild every fact table for start..end (defaults to the whole history),
+    committing after each chunk so long backfills do not hold one huge
+    transaction. Returns the number of rows written per fact.
+    """
+    if start is None or end is None:
+        first, last = data_range()
+        start = start or first
+        end = end or last
+    written = {fact: 0 for fact in FACTS}
+    if start is None or end is None:
+        return written
+
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end)
+        for fact in FACTS:
+            written[fact] += refresh_days(fact, chunk_start, chunk_end)
+        db.session.commit()
+        if on_chunk:
+            on_chunk(chunk_start, chunk_end)
+        chunk_start = chunk_end + timedelta(days=1)
+
+    return written
+
+
+# ============================================================================
+# INCREMENTAL REFRESH ON WRITES
+# ============================================================================
+#
+# after_flush records which days each written row touched (old and new
+# values) and which rows need their current day looked up; before_commit
+# refreshes exactly those days inside the same transaction, so the rollups
+# commit (or roll back) together with the change.
+
+# model -> [(fact, attribute whose date is the fact day)]
+_TRACKED = {
+    Invoice: [('revenue', 'paid_at'), ('revenue', 'created_at'), ('services', 'created_at')],
+    Appointment: [('appointments', 'date_time')],
+    Patient: [('activity', 'created_at')],
+    Admission: [('activity', 'admission_date'), ('activity', 'discharge_date')],
+}
+
+# Other attributes whose change alters a fact row; updates touching none of
+# these (or the dates above) leave the rollups alone
+_MEASURES = {
+    Invoice: ('status', 'total_amount'),
+    InvoiceItem: ('invoice_id', 'service_name', 'cost', 'quantity'),
+    Appointment: ('status', 'doctor_id'),
+    Patient: (),
+    Admission: ('status',),
+}
+
+
+def _as_day(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _pending(session):
+    return session.info.setdefault('rollup_pending', {'days': set(), 'ids': defaultdict(set)})
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_touched_days(session, flush_context):
+    pending = None
+    written = [(obj, 'new') for obj in session.new]
+    written += [(obj, 'dirty') for obj in session.dirty]
+    written += [(obj, 'deleted') for obj in session.deleted]
+    for obj, change in written:
+        model = type(obj)
+        if model not in _MEASURES:
+            continue
+        state = inspect(obj)
+        if change == 'dirty' and not any(
+            state.attrs[attribute].history.has_changes()
+            for attribute in (*_MEASURES[model], *(a for _, a in _TRACKED.get(model, ())))
+        ):
+            continue
+        pending = pending or _pending(session)
+
+        if model is InvoiceItem:
+            # Service usage is dated by the invoice; resolve it at commit
+            history = state.attrs.invoice_id.history
+            pending['ids'][Invoice].update(v for v in history.sum() if v is not None)
+            continue
+
+        # Values before and after the change, without loading anything
+        for fact, attribute in _TRACKED[model]:
+            for value in state.attrs[attribute].history.sum():
+                if value is not None:
+                    pending['days'].add((fact, _as_day(value)))
+        if change != 'deleted':
+            pending['ids'][model].add(obj.id)
+
+
+def _resolve_ids(ids):
+    """Current fact days of the written rows"""
+    days = set()
+    for model, model_ids in ids.items():
+        columns = [(fact, getattr(model, attribute)) for fact, attribute in _TRACKED[model]]
+        rows = db.session.execute(
+            select(*[
+                cast(column, Date).label(f'day_{i}') for i, (_, column) in enumerate(columns)
+            ]).where(model.id.in_(model_ids))
+        )
+        for row in rows:
+            days.update((fact, day) for (fact, _), day in zip(columns, row) if day is not None)
+    return days
+
+
+@event.listens_for(Session, 'before_commit')
+def _refresh_touched_days(session):
+    # Flush first so the final batch of changes is collected too
+    session.flush()
+    pending = session.info.pop('rollup_pending', None)
+    if not pending:
+        return
+
+    days = pending['days'] | _resolve_ids(pending['ids'])
+    for fact, day in sorted(days, key=lambda item: (item[0], item[1])):
+        refresh_days(fact, day)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_touched_days(session):
+    session.info.pop('rollup_pending', None)
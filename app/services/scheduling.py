@@ -0,0 +1,545 @@
+# app/services/scheduling.py
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from flask import current_app
+from sqlalchemy import func, literal_column, text
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Appointment, AppointmentStatus, DoctorWorkingHours, User
+
+
+# Appointments that occupy the doctor's time
+OPEN_STATUSES = (AppointmentStatus.pending, AppointmentStatus.confirmed)
+
+
+def default_duration():
+    return current_app.config.get('APPOINTMENT_DEFAULT_MINUTES', 30)
+
+
+def bookable_doctors():
+    """Users appointments can be booked with: active Doctors and Super Admins"""
+    return User.query.join(User.role).filter(
+        db.text("roles.name IN ('Doctor', 'Super Admin')")
+    ).filter(User.is_active == True)
+
+
+def appointment_period():
+    """
+    The tsrange an appointment occupies. Same expression as the
+    ex_appointments_doctor_overlap constraint, so overlap searches use its
+    GiST index.
+    """
+    return func.tsrange(
+        Appointment.date_time,
+        Appointment.date_time + Appointment.duration_minutes * literal_column("interval '1 minute'")
+    )
+
+
+# ============================================================================
+# WORKING HOURS
+# ============================================================================
+
+def _parse_time(value):
+    return value if isinstance(value, time) else time.fromisoformat(value)
+
+
+def default_working_hours():
+    """
+    DEFAULT_WORKING_HOURS as {weekday: [(start, end)]} with time objects,
+    or None when doctors without shifts are not restricted
+    """
+    configured = current_app.config.get('DEFAULT_WORKING_HOURS')
+    if configured is None:
+        return None
+    return {
+        int(weekday): [(_parse_time(start), _parse_time(end)) for start, end in shifts]
+        for weekday, shifts in configured.items()
+    }
+
+
+def working_hours(doctor_id):
+    """
+    A doctor's weekly shifts as {weekday: [(start, end)]}, or None when the
+    doctor has none configured and there is no DEFAULT_WORKING_HOURS
+    (bookings at any time are allowed)
+    """
+    rows = DoctorWorkingHours.query.filter_by(doctor_id=doctor_id).order_by(
+        DoctorWorkingHours.weekday, DoctorWorkingHours.start_time
+    ).all()
+    if not rows:
+        return default_working_hours()
+
+    hours = defaultdict(list)
+    for row in rows:
+        hours[row.weekday].append((row.start_time, row.end_time))
+    return dict(hours)
+
+
+def within_working_hours(doctor_id, start, duration_minutes=None, hours=None):
+    """
+    Whether [start, start + duration) falls inside one of the doctor's
+    shifts; always true for a doctor without working hours. hours (from
+    working_hours) saves the lookup when checking many.
+    """
+    if hours is None:
+        hours = working_hours(doctor_id)
+        if hours is None:
+            return True
+    end = start + timedelta(minutes=duration_minutes or default_duration())
+    if end.date() != start.date() and end.time() != time(0):
+        return False
+    end_time = time.max if end.time() == time(0) else end.time()
+    return any(
+        shift_start <= start.time() and end_time <= shift_end
+        for shift_start, shift_end in hours.get(start.weekday(), [])
+    )
+
+
+# ============================================================================
+# AVAILABILITY
+# ============================================================================
+
+def find_conflict(doctor_id, start, duration_minutes=None, exclude_appointment_id=None):
+    """First open appointment of the doctor overlapping [start, start + duration), or None"""
+    end = start + timedelta(minutes=duration_minutes or default_duration())
+    query = Appointment.query.filter(
+        Appointment.doctor_id == doctor_id,
+        Appointment.status.in_(OPEN_STATUSES),
+        appointment_period().op('&&')(func.tsrange(start, end))
+    )
+
+    # Exclude current appointment if editing
+    if exclude_appointment_id:
+        query = query.filter(Appointment.id != exclude_appointment_id)
+
+    return query.order_by(Appointment.date_time).first()
+
+
+def check_doctor_availability(doctor_id, date_time, duration_minutes=None, exclude_appointment_id=None):
+    """
+    Check if doctor has conflicting appointments
+    Returns (is_available, conflicting_appointment)
+    """
+    conflicting = find_conflict(doctor_id, date_time, duration_minutes, exclude_appointment_id)
+    return (conflicting is None, conflicting)
+
+
+# ============================================================================
+# BOOKING
+# ============================================================================
+#
+# Checking availability and inserting are two statements, so two users
+# booking the same doctor at once could both pass the check. Bookings take
+# a transaction-scoped advisory lock on the doctor first: bookings of one
+# doctor run one after the other, those of different doctors do not wait.
+# The exclusion constraint stays as the last line of defence; its
+# violation is reported as an ordinary overlap.
+
+OVERLAP_CONSTRAINT = 'ex_appointments_doctor_overlap'
+
+# Conflict reasons
+CONFLICT_OVERLAP = 'overlap'
+CONFLICT_OUTSIDE_HOURS = 'outside_hours'
+CONFLICT_SERIES = 'series'  # Free, but its all-or-nothing series was refused
+
+
+class BookingResult:
+    """
+    Outcome of a booking or availability check. The conflicting
+    appointment's id and period are copied on creation, so reading them
+    after the transaction ends costs no query.
+    """
+
+    def __init__(self, appointment=None, reason=None, conflicting=None, suggestions=()):
+        self.appointment = appointment
+        self.appointment_id = None
+        self.reason = reason
+        self.conflicting = conflicting
+        self.conflict_period = None
+        if conflicting is not None:
+            self.conflict_period = (conflicting.id, conflicting.date_time, conflicting.end_time)
+        self.suggestions = list(suggestions)
+
+    @property
+    def ok(self):
+        return self.reason is None
+
+    @property
+    def message(self):
+        """Arabic explanation of the conflict (None when ok)"""
+        if self.reason == CONFLICT_OVERLAP:
+            message = 'الطبيب لديه موعد آخر في هذا الوقت.'
+            if self.conflict_period is not None:
+                _, start, end = self.conflict_period
+                message = (
+                    f'الطبيب لديه موعد آخر من {start.strftime("%Y-%m-%d %H:%M")} '
+                    f'إلى {end.strftime("%H:%M")}.'
+                )
+        elif self.reason == CONFLICT_OUTSIDE_HOURS:
+            message = 'الوقت المختار خارج ساعات عمل الطبيب.'
+        elif self.reason == CONFLICT_SERIES:
+            message = 'لم يتم الحجز بسبب تعارض مواعيد أخرى في السلسلة.'
+        else:
+            return None
+        if self.suggestions:
+            message += f' أقرب وقت متاح: {self.suggestions[0]["start"].strftime("%Y-%m-%d %H:%M")}.'
+        return message
+
+    def to_dict(self):
+        return {
+            'ok': self.ok,
+            'appointment_id': self.appointment_id,
+            'reason': self.reason,
+            'message': self.message,
+            'conflicting': None if self.conflict_period is None else {
+                'id': self.conflict_period[0],
+                'start': self.conflict_period[1].strftime('%Y-%m-%dT%H:%M'),
+                'end': self.conflict_period[2].strftime('%Y-%m-%dT%H:%M'),
+            },
+            'suggestions': [slot['start'].strftime('%Y-%m-%dT%H:%M') for slot in self.suggestions],
+        }
+
+
+def _lock_doctor(doctor_id):
+    """Serialize bookings of one doctor until the transaction ends"""
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return
+    db.session.execute(
+        text('SELECT pg_advisory_xact_lock(hashtext(:scope), :doctor_id)'),
+        {'scope': 'appointments:doctor', 'doctor_id': doctor_id}
+    )
+
+
+def _conflict(doctor_id, date_time, duration_minutes, appointment_type, exclude_appointment_id=None):
+    """(reason, conflicting appointment) refusing the booking, or (None, None)"""
+    conflicting = find_conflict(doctor_id, date_time, duration_minutes, exclude_appointment_id)
+    if conflicting is not None:
+        return CONFLICT_OVERLAP, conflicting
+    # Walk-ins are seen whenever they arrive
+    if appointment_type == 'scheduled' and not within_working_hours(doctor_id, date_time, duration_minutes):
+        return CONFLICT_OUTSIDE_HOURS, None
+    return None, None
+
+
+def _refused(reason, conflicting, doctor_id, date_time, duration_minutes, suggestions):
+    slots = find_free_slots(
+        [doctor_id], duration_minutes, count=suggestions, not_before=date_time
+    ) if suggestions else []
+    return BookingResult(reason=reason, conflicting=conflicting, suggestions=slots)
+
+
+def check_booking(doctor_id, date_time, duration_minutes=None, appointment_type='scheduled', suggestions=1):
+    """
+    Whether the booking would be accepted right now, without locking.
+    Refusals carry the doctor's next free slots after date_time.
+    """
+    reason, conflicting = _conflict(doctor_id, date_time, duration_minutes, appointment_type)
+    if reason is None:
+        return BookingResult()
+    return _refused(reason, conflicting, doctor_id, date_time, duration_minutes, suggestions)
+
+
+def book_appointment(patient_id, doctor_id, date_time, duration_minutes=None, appointment_type='scheduled',
+                     notes=None, status=AppointmentStatus.confirmed, suggestions=1):
+    """
+    Check and insert an appointment in one transaction, holding the
+    doctor's booking lock in between, and commit it (with anything else
+    pending in the session).
+
+    Returns a BookingResult: its appointment when booked, otherwise the
+    reason, the conflicting appointment and up to `suggestions` free slots.
+    A refusal leaves the session's transaction open, with the caller's
+    pending work intact; the doctor's lock is held until the caller ends
+    it (request teardown does), so end it before booking for another doctor.
+    """
+    duration_minutes = duration_minutes or default_duration()
+    _lock_doctor(doctor_id)
+
+    reason, conflicting = _conflict(doctor_id, date_time, duration_minutes, appointment_type)
+    if reason is not None:
+        return _refused(reason, conflicting, doctor_id, date_time, duration_minutes, suggestions)
+
+    appointment = Appointment(
+        patient_id=patient_id,
+        doctor_id=doctor_id,
+        date_time=date_time,
+        duration_minutes=duration_minutes,
+        type=appointment_type,
+        notes=notes,
+        status=status
+    )
+    try:
+        # Savepoint: a failed insert leaves the rest of the transaction usable
+        with db.session.begin_nested():
+            db.session.add(appointment)
+    except IntegrityError as e:
+        # A write that bypassed the lock got there first
+        if getattr(getattr(e.orig, 'diag', None), 'constraint_name', None) != OVERLAP_CONSTRAINT:
+            raise
+        conflicting = find_conflict(doctor_id, date_time, duration_minutes)
+        return _refused(CONFLICT_OVERLAP, conflicting, doctor_id, date_time, duration_minutes, suggestions)
+    appointment_id = appointment.id
+    db.session.commit()
+
+    result = BookingResult(appointment=appointment)
+    result.appointment_id = appointment_id
+    return result
+
+
+# ============================================================================
+# RECURRING SERIES
+# ============================================================================
+
+RECURRENCE_STEPS = {
+    'daily': timedelta(days=1),
+    'weekly': timedelta(weeks=1),
+}
+
+# First open appointment overlapping each occurrence, for all of them at once
+_SERIES_CONFLICTS_SQL = text("""
+    SELECT o.n, a.id AS conflicting_id
+    FROM unnest(CAST(:starts AS timestamp[])) WITH ORDINALITY AS o(slot_start, n)
+    JOIN LATERAL (
+        SELECT a.id
+        FROM appointments a
+        WHERE a.doctor_id = :doctor_id
+          AND a.status IN ('pending', 'confirmed')
+          AND tsrange(a.date_time, a.date_time + a.duration_minutes * interval '1 minute')
+              && tsrange(o.slot_start, o.slot_start + make_interval(mins => :duration))
+        ORDER BY a.date_time
+        LIMIT 1
+    ) a ON true
+""")
+
+
+def expand_recurrence(start, frequency='weekly', interval=1, count=None, until=None):
+    """
+    Start times of a recurring series: every `interval` days or weeks from
+    start, `count` times or up to `until` (inclusive; a date includes that
+    whole day). Raises ValueError for a series that is empty or longer than
+    SERIES_MAX_OCCURRENCES.
+    """
+    if frequency not in RECURRENCE_STEPS:
+        raise ValueError(f'Unknown frequency: {frequency}')
+    if interval < 1:
+        raise ValueError('interval must be at least 1')
+    if count is None and until is None:
+        raise ValueError('count or until is required')
+
+    if until is not None and not isinstance(until, datetime):
+        until = datetime.combine(until, time.max)
+
+    limit = current_app.config.get('SERIES_MAX_OCCURRENCES', 52)
+    if count is not None and count > limit:
+        raise ValueError(f'At most {limit} occurrences')
+    step = RECURRENCE_STEPS[frequency] * interval
+
+    starts = []
+    current = start
+    while (count is None or len(starts) < count) and (until is None or current <= until):
+        if len(starts) == limit:
+            raise ValueError(f'At most {limit} occurrences')
+        starts.append(current)
+        current += step
+    if not starts:
+        raise ValueError('The series has no occurrences')
+    return starts
+
+
+def book_series(patient_id, doctor_id, starts, duration_minutes=None, appointment_type='scheduled',
+                notes=None, status=AppointmentStatus.confirmed, all_or_nothing=False):
+    """
+    Book an appointment at each of the given start times in one
+    transaction, holding the doctor's booking lock, and commit.
+
+    All occurrences are checked against the doctor's appointments with one
+    query, and the accepted ones are inserted in one batched INSERT.
+    Returns a BookingResult per occurrence, in the order given. With
+    all_or_nothing, nothing is booked if any occurrence is refused.
+    """
+    duration_minutes = duration_minutes or default_duration()
+    if not starts:
+        return []
+    _lock_doctor(doctor_id)
+
+    conflict_ids = dict(db.session.execute(_SERIES_CONFLICTS_SQL, {
+        'starts': list(starts),
+        'doctor_id': doctor_id,
+        'duration': duration_minutes,
+    }).all())
+    conflicting = {}
+    if conflict_ids:
+        conflicting = {
+            appointment.id: appointment
+            for appointment in Appointment.query.filter(Appointment.id.in_(set(conflict_ids.values())))
+        }
+    hours = working_hours(doctor_id) if appointment_type == 'scheduled' else None
+
+    results = []
+    accepted = []
+    length = timedelta(minutes=duration_minutes)
+    for n, start in enumerate(starts, start=1):
+        if n in conflict_ids:
+            results.append(BookingResult(reason=CONFLICT_OVERLAP, conflicting=conflicting[conflict_ids[n]]))
+        elif hours is not None and not within_working_hours(doctor_id, start, duration_minutes, hours):
+            results.append(BookingResult(reason=CONFLICT_OUTSIDE_HOURS))
+        elif any(other.date_time < start + length and start < other.end_time for other in accepted):
+            # Occurrences of the series overlapping each other
+            results.append(BookingResult(reason=CONFLICT_OVERLAP))
+        else:
+            appointment = Appointment(
+                patient_id=patient_id,
+                doctor_id=doctor_id,
+                date_time=start,
+                duration_minutes=duration_minutes,
+                type=appointment_type,
+                notes=notes,
+                status=status
+            )
+            accepted.append(appointment)
+            results.append(BookingResult(appointment=appointment))
+
+    if not accepted or (all_or_nothing and len(accepted) < len(starts)):
+        # Nothing was added; as with book_appointment, the caller ends the transaction
+        for result in results:
+            if result.ok:
+                result.appointment = None
+                result.reason = CONFLICT_SERIES
+        return results
+
+    # Added together, the unit of work sends them as one multi-row INSERT
+    # (and the cache and live event listeners still see every row)
+    db.session.add_all(accepted)
+    db.session.flush()
+    for result in results:
+        if result.ok:
+            result.appointment_id = result.appointment.id
+    db.session.commit()
+    return results
+
+
+# ============================================================================
+# FREE SLOT FINDER
+# ============================================================================
+#
+# One statement: expand each doctor's shifts (or the clinic defaults, or
+# SCHEDULE_SEARCH_HOURS every day for unrestricted doctors) over the
+# search horizon, step through every shift in SCHEDULE_SLOT_MINUTES
+# increments and keep the starts whose whole duration overlaps no open
+# appointment. The NOT EXISTS probe uses the exclusion constraint's index.
+
+_FREE_SLOTS_SQL = text("""
+    WITH doctors AS (
+        SELECT unnest(CAST(:doctor_ids AS integer[])) AS doctor_id
+    ),
+    defaults AS (
+        SELECT *
+        FROM unnest(
+            CAST(:default_weekdays AS smallint[]),
+            CAST(:default_starts AS time[]),
+            CAST(:default_ends AS time[])
+        ) AS d(weekday, start_time, end_time)
+    ),
+    hours AS (
+        SELECT h.doctor_id, h.weekday, h.start_time, h.end_time
+        FROM doctor_working_hours h
+        JOIN doctors ON doctors.doctor_id = h.doctor_id
+        UNION ALL
+        SELECT doctors.doctor_id, defaults.weekday, defaults.start_time, defaults.end_time
+        FROM doctors CROSS JOIN defaults
+        WHERE NOT EXISTS (
+            SELECT 1 FROM doctor_working_hours h WHERE h.doctor_id = doctors.doctor_id
+        )
+    ),
+    candidates AS (
+        SELECT hours.doctor_id, slot AS slot_start
+        FROM generate_series(
+            CAST(:first_day AS timestamp), CAST(:last_day AS timestamp), interval '1 day'
+        ) AS day
+        JOIN hours ON hours.weekday = extract(isodow FROM day) - 1
+        CROSS JOIN LATERAL generate_series(
+            day + hours.start_time,
+            day + hours.end_time - make_interval(mins => :duration),
+            make_interval(mins => :step)
+        ) AS slot
+        WHERE slot >= :not_before
+    ),
+    free AS (
+        SELECT c.doctor_id, c.slot_start,
+               row_number() OVER (PARTITION BY c.doctor_id ORDER BY c.slot_start) AS doctor_rank
+        FROM candidates c
+        WHERE NOT EXISTS (
+            SELECT 1 FROM appointments a
+            WHERE a.doctor_id = c.doctor_id
+              AND a.status IN ('pending', 'confirmed')
+              AND tsrange(a.date_time, a.date_time + a.duration_minutes * interval '1 minute')
+                  && tsrange(c.slot_start, c.slot_start + make_interval(mins => :duration))
+        )
+    )
+    SELECT doctor_id, slot_start
+    FROM free
+    WHERE NOT :per_doctor OR doctor_rank <= :count
+    ORDER BY slot_start, doctor_id
+    LIMIT :limit
+""")
+
+
+def find_free_slots(doctor_ids, duration_minutes=None, count=5, not_before=None, days=None, per_doctor=False):
+    """
+    Next open slots of one or more doctors, from a single query.
+
+    Args:
+        doctor_ids (list): Doctors to search
+        duration_minutes (int): Length of the appointment to fit
+        count (int): Slots to return (per doctor with per_doctor=True)
+        not_before (datetime): Earliest start; defaults to now
+        days (int): Search horizon in days (SCHEDULE_SEARCH_DAYS)
+        per_doctor (bool): Return up to count slots for every doctor
+            instead of the earliest count slots overall
+
+    Returns a list of {'doctor_id', 'start', 'end'} ordered by start.
+    """
+    doctor_ids = sorted({int(doctor_id) for doctor_id in doctor_ids})
+    if not doctor_ids or count <= 0:
+        return []
+
+    duration = duration_minutes or default_duration()
+    not_before = not_before or datetime.now()
+    days = days or current_app.config.get('SCHEDULE_SEARCH_DAYS', 14)
+
+    default_hours = default_working_hours()
+    if default_hours is None:
+        search_start, search_end = current_app.config.get('SCHEDULE_SEARCH_HOURS', ('08:00', '16:00'))
+        default_hours = {
+            weekday: [(_parse_time(search_start), _parse_time(search_end))] for weekday in range(7)
+        }
+    defaults = [
+        (weekday, start, end)
+        for weekday, shifts in sorted(default_hours.items())
+        for start, end in shifts
+    ]
+
+    rows = db.session.execute(_FREE_SLOTS_SQL, {
+        'doctor_ids': doctor_ids,
+        'default_weekdays': [weekday for weekday, _, _ in defaults],
+        'default_starts': [start for _, start, _ in defaults],
+        'default_ends': [end for _, _, end in defaults],
+        'first_day': not_before.date(),
+        'last_day': not_before.date() + timedelta(days=days),
+        'duration': duration,
+        'step': current_app.config.get('SCHEDULE_SLOT_MINUTES', 15),
+        'not_before': not_before,
+        'per_doctor': per_doctor,
+        'count': count,
+        'limit': count * len(doctor_ids) if per_doctor else count,
+    })
+
+    return [
+        {
+            'doctor_id': doctor_id,
+            'start': slot_start,
+            'end': slot_start + timedelta(minutes=duration),
+        }
+        for doctor_id, slot_start in rows
+    ]
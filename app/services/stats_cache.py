@@ -1,44 +1,345 @@
-# app/services/stats_cache.py (Optional)
+# app/services/stats_cache.py
 
+import copy
+import enum
+import logging
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
 from functools import wraps
-from datetime import datetime, timedelta
-import json
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
 
-# Simple in-memory cache (for production, use Redis)
-_cache = {}
-_cache_timeout = {}
 
-def cached_stats(timeout_minutes=5):
+logger = logging.getLogger(__name__)
+
+# Cache tags written by each model; statistics declare the tags they read.
+TAGS_BY_TABLE = {
+    'invoices': 'invoices',
+    'invoice_items': 'invoices',
+    'appointments': 'appointments',
+    'medical_visits': 'appointments',
+    'patients': 'patients',
+    'beds': 'beds',
+    'admissions': 'admissions',
+    # Authenticated principals (app.services.principal_cache)
+    'users': 'principals',
+    'roles': 'principals',
+}
+
+
+class SharedTagVersions:
+    """
+    Tag versions kept in the cache_tag_versions table, so a write in one
+    worker process invalidates the entries of every other. The whole (small)
+    table is read in one query and reused for refresh_seconds: that is how
+    long another process may keep serving an invalidated entry. A process
+    sees its own invalidations immediately.
+    """
+
+    _BUMP = text("""
+        INSERT INTO cache_tag_versions (tag, version, updated_at)
+        SELECT tag, 1, now() FROM unnest(CAST(:tags AS varchar[])) AS tag ORDER BY tag
+        ON CONFLICT (tag) DO UPDATE
+            SET version = cache_tag_versions.version + 1, updated_at = EXCLUDED.updated_at
+        RETURNING tag, version
+    """)
+
+    def __init__(self, refresh_seconds=2):
+        self.refresh_seconds = refresh_seconds
+        self._versions = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def get(self, tags):
+        from app import db
+
+        now = time.monotonic()
+        if self._loaded_at is None or now - self._loaded_at >= self.refresh_seconds:
+            try:
+                with db.engine.connect() as connection:
+                    rows = connection.execute(text('SELECT tag, version FROM cache_tag_versions')).all()
+            except SQLAlchemyError:
+                logger.exception('Could not read cache tag versions')
+                rows = None
+            with self._lock:
+                if rows is not None:
+                    self._versions = dict(rows)
+                # Also after a failure, so the read is retried once per window
+                self._loaded_at = now
+        with self._lock:
+            return tuple(self._versions.get(tag, 0) for tag in tags)
+
+    def bump(self, tags):
+        from app import db
+
+        try:
+            with db.engine.begin() as connection:
+                rows = connection.execute(self._BUMP, {'tags': sorted(tags)}).all()
+        except SQLAlchemyError:
+            logger.exception('Could not bump cache tag versions %s', sorted(tags))
+            return
+        with self._lock:
+            for tag, version in rows:
+                self._versions[tag] = max(version, self._versions.get(tag, 0))
+
+
+class MemoryBackend:
+    """
+    Bounded in-process store: least recently used entries are evicted once
+    max_entries is reached, and every entry expires after its TTL.
+
+    Invalidation works through per-tag version counters; an entry remembers
+    the versions of its tags when stored and is discarded on read if any of
+    them has been bumped since. Local counters only cover this process;
+    with shared_versions (SharedTagVersions) writes made by other worker
+    processes invalidate entries too.
+    """
+
+    def __init__(self, max_entries=512, shared_versions=None):
+        self.max_entries = max_entries
+        self.shared_versions = shared_versions
+        self._entries = OrderedDict()  # key -> (expires_at, tag_versions, value)
+        self._tag_versions = {}
+        self._lock = threading.Lock()
+
+    def tag_versions(self, tags):
+        with self._lock:
+            local = tuple(self._tag_versions.get(tag, 0) for tag in tags)
+        if self.shared_versions is None:
+            return local
+        return tuple(zip(self.shared_versions.get(tags), local))
+
+    def get(self, key, tags):
+        now = time.monotonic()
+        current = self.tag_versions(tags)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, versions, value = entry
+            if expires_at <= now or versions != current:
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+        # Callers may mutate the result; never hand out the stored object
+        return True, copy.deepcopy(value)
+
+    def set(self, key, value, ttl, versions):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, versions, copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_tags(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._tag_versions[tag] = self._tag_versions.get(tag, 0) + 1
+        if self.shared_versions is not None:
+            self.shared_versions.bump(tags)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisBackend:
+    """
+    Store shared by every worker process. Requires the optional redis
+    package; values are pickled and expire through Redis TTLs.
+    """
+
+    def __init__(self, url, prefix='stats:'):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError('STATS_CACHE_BACKEND=redis requires the redis package') from e
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _tag_key(self, tag):
+        return f'{self.prefix}tag:{tag}'
+
+    def tag_versions(self, tags):
+        if not tags:
+            return ()
+        values = self._redis.mget([self._tag_key(tag) for tag in tags])
+        return tuple(int(value or 0) for value in values)
+
+    def get(self, key, tags):
+        raw = self._redis.get(self.prefix + key)
+        if raw is None:
+            return False, None
+        versions, value = pickle.loads(raw)
+        if versions != self.tag_versions(tags):
+            return False, None
+        return True, value
+
+    def set(self, key, value, ttl, versions):
+        self._redis.set(self.prefix + key, pickle.dumps((versions, value)), ex=max(1, int(ttl)))
+
+    def invalidate_tags(self, tags):
+        pipeline = self._redis.pipeline()
+        for tag in tags:
+            pipeline.incr(self._tag_key(tag))
+        pipeline.execute()
+
+    def clear(self):
+        for key in self._redis.scan_iter(f'{self.prefix}*'):
+            self._redis.delete(key)
+
+
+_backend = MemoryBackend()
+_enabled = True
+
+
+def init_app(app):
+    """Select the cache backend from STATS_CACHE_* configuration"""
+    global _backend, _enabled
+    _enabled = app.config.get('STATS_CACHE_ENABLED', True)
+    if app.config.get('STATS_CACHE_BACKEND', 'memory') == 'redis':
+        _backend = RedisBackend(app.config['STATS_CACHE_REDIS_URL'])
+    else:
+        _backend = MemoryBackend(
+            app.config.get('STATS_CACHE_MAX_ENTRIES', 512),
+            SharedTagVersions(app.config.get('STATS_CACHE_VERSION_REFRESH_SECONDS', 2))
+        )
+
+
+def get_backend():
+    return _backend
+
+
+def _freeze(value):
+    """Turn an argument into a stable, hashable key component"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = tuple(_freeze(item) for item in value)
+        return tuple(sorted(items, key=repr)) if isinstance(value, (set, frozenset)) else items
+    if isinstance(value, dict):
+        return tuple(sorted((str(k), _freeze(v)) for k, v in value.items()))
+    return value
+
+
+def make_key(name, args, kwargs):
+    """Cache key for a call; dates, Decimals and enums are normalized"""
+    return f'{name}:{_freeze(args)!r}:{_freeze(kwargs)!r}'
+
+
+def cached_stats(timeout_minutes=5, tags=()):
     """
     Decorator to cache statistics results.
-    
+
     Args:
         timeout_minutes (int): Cache timeout in minutes
+        tags (tuple or callable): Data the result depends on (see
+            TAGS_BY_TABLE); the entry is dropped as soon as any of them is
+            written. A callable receives the call's arguments and returns
+            the tags, for per-record tags such as 'doctor:<id>'.
+
+    Today's date is part of the key, because default date ranges are
+    relative to it. A write made by another worker process invalidates the
+    entry within STATS_CACHE_VERSION_REFRESH_SECONDS (memory backend) or
+    immediately (redis).
     """
+    tags_for_call = tags if callable(tags) else (lambda *args, **kwargs: tuple(tags))
+
     def decorator(func):
+        name = f'{func.__module__}.{func.__qualname__}'
+
         @wraps(func)
         def wrapper(*args, **kwargs):
-            cache_key = f"{func.__name__}:{json.dumps(args)}:{json.dumps(kwargs)}"
-            now = datetime.now()
-            
-            # Check if cached and not expired
-            if cache_key in _cache:
-                if cache_key in _cache_timeout:
-                    if now < _cache_timeout[cache_key]:
-                        return _cache[cache_key]
-            
-            # Calculate new result
-            result = func(*args, **kwargs)
-            
-            # Store in cache
-            _cache[cache_key] = result
-            _cache_timeout[cache_key] = now + timedelta(minutes=timeout_minutes)
-            
-            return result
+            if not _enabled:
+                return func(*args, **kwargs)
+
+            backend = _backend
+            tags = tuple(tags_for_call(*args, **kwargs))
+            key = make_key(name, (date.today(), *args), kwargs)
+            found, value = backend.get(key, tags)
+            if found:
+                return value
+
+            # Read the tag versions before computing, so a write that lands
+            # meanwhile makes this entry stale instead of hiding behind it
+            versions = backend.tag_versions(tags)
+            value = func(*args, **kwargs)
+            backend.set(key, value, timeout_minutes * 60, versions)
+            return value
         return wrapper
     return decorator
 
-# Usage example:
-# @cached_stats(timeout_minutes=10)
-# def get_expensive_stats():
-#     return StatsService.get_dashboard_stats()
\ No newline at end of file
+
+def tag_versions(*tags):
+    """
+    Current versions of the given tags; any write to their data changes
+    them, so they can back ETags. With shared versions each one pairs the
+    shared and local counter: the local one still moves if the shared bump
+    failed (e.g. cache_tag_versions is missing).
+    """
+    return _backend.tag_versions(tags)
+
+
+def invalidate(*tags):
+    """Drop every cached result depending on any of the given tags"""
+    if tags:
+        _backend.invalidate_tags(tags)
+
+
+def clear():
+    """Drop every cached result"""
+    _backend.clear()
+
+
+def invalidate_on_commit(session, *tags):
+    """Invalidate the given tags once the session's transaction commits"""
+    if tags:
+        session.info.setdefault('stats_cache_tags', set()).update(tags)
+
+
+# ============================================================================
+# INVALIDATION ON WRITES
+# ============================================================================
+
+def _tags_for(objects):
+    tags = set()
+    for obj in objects:
+        table = getattr(obj, '__tablename__', None)
+        if table in TAGS_BY_TABLE:
+            tags.add(TAGS_BY_TABLE[table])
+    return tags
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_written_tags(session, flush_context):
+    invalidate_on_commit(session, *_tags_for((*session.new, *session.dirty, *session.deleted)))
+
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def _collect_bulk_tags(context):
+    table = context.mapper.local_table.name
+    if table in TAGS_BY_TABLE:
+        invalidate_on_commit(context.session, TAGS_BY_TABLE[table])
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_tags(session):
+    # Invalidate only once the data is visible to other sessions
+    tags = session.info.pop('stats_cache_tags', None)
+    if tags:
+        invalidate(*tags)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_tags(session):
+    session.info.pop('stats_cache_tags', None)
@@ -3,21 +3,96 @@
 from datetime import datetime, timedelta, date
 from sqlalchemy import func, extract, and_, or_, Date, cast, case
 from app import db
+from app.services.date_range import date_range_filter, on_date_filter
+from app.services.parallel import run_parallel
+from app.services.stats_cache import cached_stats
 from app.models import (
     Invoice, InvoiceStatus, Patient, Appointment, AppointmentStatus,
-    Bed, BedStatus, Admission, AdmissionStatus, Service, User, MedicalVisit
+    Bed, BedStatus, Admission, AdmissionStatus, Service, User, MedicalVisit,
+    DailyRevenue, DailyAppointments, DailyActivity, DailyServiceUsage
 )
 from decimal import Decimal
 
 
+# Length-of-stay distribution buckets: (label, min days, max days or None)
+STAY_BUCKETS = [
+    ('0-1', 0, 1),
+    ('2-3', 2, 3),
+    ('4-7', 4, 7),
+    ('8-14', 8, 14),
+    ('15+', 15, None),
+]
+
+MONTH_NAMES_AR = [
+    'يناير', 'فبراير', 'مارس', 'إبريل', 'مايو', 'يونيو',
+    'يوليو', 'أغسطس', 'سبتمبر', 'أكتوبر', 'نوفمبر', 'ديسمبر'
+]
+
+
 class StatsService:
-    """Enhanced service class with date range filtering support"""
+    """
+    Enhanced service class with date range filtering support.
+
+    Date-filtered figures are summed from the daily rollup tables kept by
+    app.services.rollups; real-time figures read the live tables.
+    """
+
+    # ========================================================================
+    # MONTHLY TREND ENGINE
+    # ========================================================================
+
+    @staticmethod
+    def get_monthly_trend(date_column, aggregates, filters=(), months=12):
+        """
+        Compute an N-month series ending with the current month in one query.
+
+        Args:
+            date_column: Date or timestamp column used to bucket rows by month
+            aggregates (dict): Output key -> SQL aggregate expression
+            filters: Extra filter criteria applied before grouping
+            months (int): Number of months in the series
+
+        Months without rows are filled with 0 for every aggregate.
+        """
+        now = datetime.now()
+        last_index = now.year * 12 + now.month - 1
+        month_starts = [
+            date(index // 12, index % 12 + 1, 1)
+            for index in range(last_index - months + 1, last_index + 1)
+        ]
+        range_end = date((last_index + 1) // 12, (last_index + 1) % 12 + 1, 1)
+
+        bucket = func.date_trunc('month', date_column).label('bucket')
+        rows = db.session.query(
+            bucket,
+            *[expression.label(name) for name, expression in aggregates.items()]
+        ).filter(
+            *filters,
+            date_column >= month_starts[0],
+            date_column < range_end
+        ).group_by(bucket).all()
+
+        by_month = {(row.bucket.year, row.bucket.month): row for row in rows}
+
+        results = []
+        for month_start in month_starts:
+            row = by_month.get((month_start.year, month_start.month))
+            item = {
+                'month': f'{month_start.year}-{month_start.month:02d}',
+                'month_name': f'{MONTH_NAMES_AR[month_start.month - 1]} {month_start.year}'
+            }
+            for name in aggregates:
+                item[name] = getattr(row, name) if row is not None else 0
+            results.append(item)
+
+        return results
 
     # ========================================================================
     # REVENUE STATISTICS (with date filtering)
     # ========================================================================
 
     @staticmethod
+    @cached_stats(tags=('invoices',))
     def get_revenue_stats(start_date=None, end_date=None):
         """
         Get revenue statistics for a date range.
@@ -36,34 +111,24 @@ class StatsService:
         prev_end = start_date - timedelta(days=1)
         prev_start = prev_end - timedelta(days=period_days - 1)
 
-        # Query for paid invoices in current period
-        current_revenue = db.session.query(
-            func.coalesce(func.sum(Invoice.total_amount), 0)
+        # Paid invoices in the current and previous periods, in one pass
+        in_current = DailyRevenue.day.between(start_date, end_date)
+        totals = db.session.query(
+            func.coalesce(func.sum(case((in_current, DailyRevenue.total_amount), else_=0)), 0),
+            func.coalesce(func.sum(case((in_current, 0), else_=DailyRevenue.total_amount)), 0),
+            func.coalesce(func.sum(case((in_current, DailyRevenue.invoice_count), else_=0)), 0)
         ).filter(
-            Invoice.status == InvoiceStatus.paid,
-            func.cast(Invoice.paid_at, Date) >= start_date,
-            func.cast(Invoice.paid_at, Date) <= end_date
-        ).scalar() or Decimal('0')
+            DailyRevenue.status == InvoiceStatus.paid,
+            DailyRevenue.day.between(prev_start, end_date)
+        ).one()
 
-        # Query for previous period
-        previous_revenue = db.session.query(
-            func.coalesce(func.sum(Invoice.total_amount), 0)
-        ).filter(
-            Invoice.status == InvoiceStatus.paid,
-            func.cast(Invoice.paid_at, Date) >= prev_start,
-            func.cast(Invoice.paid_at, Date) <= prev_end
-        ).scalar() or Decimal('0')
+        current_revenue = totals[0] or Decimal('0')
+        previous_revenue = totals[1] or Decimal('0')
+        invoice_count = int(totals[2])
 
         # Calculate growth
         growth = StatsService._calculate_growth(current_revenue, previous_revenue)
 
-        # Get invoice count
-        invoice_count = Invoice.query.filter(
-            Invoice.status == InvoiceStatus.paid,
-            func.cast(Invoice.paid_at, Date) >= start_date,
-            func.cast(Invoice.paid_at, Date) <= end_date
-        ).count()
-
         return {
             'total': float(current_revenue),
             'previous_period': float(previous_revenue),
@@ -73,53 +138,31 @@ class StatsService:
         }
 
     @staticmethod
+    @cached_stats(tags=('invoices',))
     def get_revenue_by_month(months=12):
         """Get revenue for the last N months (always 12 months trend)"""
-        now = datetime.now()
-        results = []
-
-        for i in range(months - 1, -1, -1):
-            target_month = now.month - i
-            target_year = now.year
-
-            while target_month <= 0:
-                target_month += 12
-                target_year -= 1
-
-            month_start = date(target_year, target_month, 1)
-            if target_month == 12:
-                next_month = date(target_year + 1, 1, 1)
-            else:
-                next_month = date(target_year, target_month + 1, 1)
-
-            month_data = db.session.query(
-                func.coalesce(func.sum(Invoice.total_amount), 0).label('revenue'),
-                func.count(Invoice.id).label('count')
-            ).filter(
-                Invoice.status == InvoiceStatus.paid,
-                func.cast(Invoice.paid_at, Date) >= month_start,
-                func.cast(Invoice.paid_at, Date) < next_month
-            ).first()
-
-            month_names_ar = [
-                'يناير', 'فبراير', 'مارس', 'إبريل', 'مايو', 'يونيو',
-                'يوليو', 'أغسطس', 'سبتمبر', 'أكتوبر', 'نوفمبر', 'ديسمبر'
-            ]
-
-            results.append({
-                'month': f'{target_year}-{target_month:02d}',
-                'month_name': f'{month_names_ar[target_month - 1]} {target_year}',
-                'revenue': float(month_data.revenue),
-                'invoice_count': month_data.count
-            })
-
-        return results
+        trend = StatsService.get_monthly_trend(
+            DailyRevenue.day,
+            {
+                'revenue': func.coalesce(func.sum(DailyRevenue.total_amount), 0),
+                'invoice_count': func.coalesce(func.sum(DailyRevenue.invoice_count), 0)
+            },
+            filters=[DailyRevenue.status == InvoiceStatus.paid],
+            months=months
+        )
+
+        for item in trend:
+            item['revenue'] = float(item['revenue'])
+            item['invoice_count'] = int(item['invoice_count'])
+
+        return trend
 
     # ========================================================================
     # PATIENT STATISTICS (with date filtering)
     # ========================================================================
 
     @staticmethod
+    @cached_stats(tags=('patients',))
     def get_patient_stats(start_date=None, end_date=None):
         """Get patient statistics for date range"""
         now = datetime.now()
@@ -133,10 +176,11 @@ class StatsService:
         total = Patient.query.count()
 
         # New patients in period
-        new_in_period = Patient.query.filter(
-            func.cast(Patient.created_at, Date) >= start_date,
-            func.cast(Patient.created_at, Date) <= end_date
-        ).count()
+        new_in_period = db.session.query(
+            func.coalesce(func.sum(DailyActivity.new_patients), 0)
+        ).filter(
+            DailyActivity.day.between(start_date, end_date)
+        ).scalar()
 
         # Gender distribution (all time)
         gender_stats = db.session.query(
@@ -155,47 +199,31 @@ class StatsService:
 
         return {
             'total': total,
-            'new_in_period': new_in_period,
+            'new_in_period': int(new_in_period),
             'by_gender': by_gender
         }
 
     @staticmethod
+    @cached_stats(tags=('patients',))
     def get_patients_by_month(months=12):
         """Get patient registrations by month (last 12 months)"""
-        now = datetime.now()
-        results = []
-
-        for i in range(months - 1, -1, -1):
-            target_month = now.month - i
-            target_year = now.year
-
-            while target_month <= 0:
-                target_month += 12
-                target_year -= 1
+        trend = StatsService.get_monthly_trend(
+            DailyActivity.day,
+            {'count': func.coalesce(func.sum(DailyActivity.new_patients), 0)},
+            months=months
+        )
 
-            count = db.session.query(func.count(Patient.id)).filter(
-                extract('year', Patient.created_at) == target_year,
-                extract('month', Patient.created_at) == target_month
-            ).scalar()
+        for item in trend:
+            item['count'] = int(item['count'])
 
-            month_names_ar = [
-                'يناير', 'فبراير', 'مارس', 'إبريل', 'مايو', 'يونيو',
-                'يوليو', 'أغسطس', 'سبتمبر', 'أكتوبر', 'نوفمبر', 'ديسمبر'
-            ]
-
-            results.append({
-                'month': f'{target_year}-{target_month:02d}',
-                'month_name': f'{month_names_ar[target_month - 1]} {target_year}',
-                'count': count
-            })
-
-        return results
+        return trend
 
     # ========================================================================
     # APPOINTMENT STATISTICS (with date filtering)
     # ========================================================================
 
     @staticmethod
+    @cached_stats(tags=('appointments',))
     def get_appointment_stats(start_date=None, end_date=None):
         """Get appointment statistics for date range"""
         now = datetime.now()
@@ -207,12 +235,11 @@ class StatsService:
 
         # Count by status in period
         status_counts = db.session.query(
-            Appointment.status,
-            func.count(Appointment.id)
+            DailyAppointments.status,
+            func.sum(DailyAppointments.count)
         ).filter(
-            func.cast(Appointment.date_time, Date) >= start_date,
-            func.cast(Appointment.date_time, Date) <= end_date
-        ).group_by(Appointment.status).all()
+            DailyAppointments.day.between(start_date, end_date)
+        ).group_by(DailyAppointments.status).all()
 
         by_status = {
             'pending': 0,
@@ -224,8 +251,8 @@ class StatsService:
 
         total = 0
         for status, count in status_counts:
-            by_status[status.value] = count
-            total += count
+            by_status[status.value] = int(count)
+            total += int(count)
 
         # Completion rate
         completed = by_status['completed']
@@ -239,6 +266,7 @@ class StatsService:
         }
 
     @staticmethod
+    @cached_stats(tags=('appointments',))
     def get_appointments_by_doctor(start_date=None, end_date=None):
         """Get appointment counts by doctor for date range"""
         now = datetime.now()
@@ -248,36 +276,37 @@ class StatsService:
         if not end_date:
             end_date = now.date()
 
+        total = func.sum(DailyAppointments.count)
         results = db.session.query(
             User.id,
             User.full_name_ar,
-            func.count(Appointment.id).label('total'),
+            total.label('total'),
             func.sum(
-                case((Appointment.status == AppointmentStatus.completed, 1), else_=0)
+                case((DailyAppointments.status == AppointmentStatus.completed, DailyAppointments.count), else_=0)
             ).label('completed'),
             func.sum(
                 case(
-                    (Appointment.status.in_([AppointmentStatus.pending, AppointmentStatus.confirmed]), 1),
+                    (DailyAppointments.status.in_([AppointmentStatus.pending, AppointmentStatus.confirmed]),
+                     DailyAppointments.count),
                     else_=0
                 )
             ).label('pending')
         ).join(
-            Appointment, User.id == Appointment.doctor_id
+            DailyAppointments, User.id == DailyAppointments.doctor_id
         ).filter(
-            func.cast(Appointment.date_time, Date) >= start_date,
-            func.cast(Appointment.date_time, Date) <= end_date
+            DailyAppointments.day.between(start_date, end_date)
         ).group_by(
             User.id, User.full_name_ar
         ).order_by(
-            func.count(Appointment.id).desc()
+            total.desc()
         ).all()
 
         return [{
             'doctor_id': r.id,
             'doctor_name': r.full_name_ar,
-            'total': r.total,
-            'completed': r.completed or 0,
-            'pending': r.pending or 0
+            'total': int(r.total),
+            'completed': int(r.completed or 0),
+            'pending': int(r.pending or 0)
         } for r in results]
 
     # ========================================================================
@@ -285,6 +314,7 @@ class StatsService:
     # ========================================================================
 
     @staticmethod
+    @cached_stats(tags=('beds',))
     def get_bed_occupancy():
         """Get current bed occupancy (real-time, not date filtered)"""
         status_counts = db.session.query(
@@ -314,6 +344,7 @@ class StatsService:
         return stats
 
     @staticmethod
+    @cached_stats(tags=('admissions',))
     def get_admission_stats(start_date=None, end_date=None):
         """Get admission statistics for date range"""
         now = datetime.now()
@@ -326,33 +357,93 @@ class StatsService:
         # Active admissions (current)
         active = Admission.query.filter_by(status=AdmissionStatus.active).count()
 
-        # Admissions in period
-        admissions_in_period = Admission.query.filter(
-            func.cast(Admission.admission_date, Date) >= start_date,
-            func.cast(Admission.admission_date, Date) <= end_date
-        ).count()
+        # Admissions, discharges and days stayed (discharged in period)
+        admissions_in_period, discharges, total_days = db.session.query(
+            func.coalesce(func.sum(DailyActivity.admissions), 0),
+            func.coalesce(func.sum(DailyActivity.discharges), 0),
+            func.coalesce(func.sum(DailyActivity.discharged_stay_days), 0)
+        ).filter(
+            DailyActivity.day.between(start_date, end_date)
+        ).one()
+
+        # Average stay duration
+        avg_stay = int(total_days) / int(discharges) if discharges else 0
 
-        # Average stay duration (discharged in period)
-        discharged = Admission.query.filter(
+        return {
+            'active_admissions': active,
+            'total_in_period': int(admissions_in_period),
+            'avg_stay_duration': round(avg_stay, 1)
+        }
+
+    @staticmethod
+    @cached_stats(tags=('admissions',))
+    def get_length_of_stay_stats(start_date=None, end_date=None):
+        """
+        Length of stay of admissions discharged in the date range: mean,
+        median, p90 and bucket counts, overall and per room, computed in a
+        single aggregate query (GROUP BY ROLLUP gives the overall row).
+        """
+        now = datetime.now()
+
+        if not start_date:
+            start_date = date(now.year, now.month, 1)
+        if not end_date:
+            end_date = now.date()
+
+        # Whole days stayed, as in avg_stay_duration
+        stay = func.floor(
+            extract('epoch', Admission.discharge_date - Admission.admission_date) / 86400
+        )
+        bucket_counts = [
+            func.count(Admission.id).filter(
+                and_(stay >= low, stay <= high) if high is not None else stay >= low
+            ).label(f'bucket_{i}')
+            for i, (_, low, high) in enumerate(STAY_BUCKETS)
+        ]
+
+        rows = db.session.query(
+            Bed.room_number,
+            func.grouping(Bed.room_number).label('is_total'),
+            func.count(Admission.id).label('discharges'),
+            func.avg(stay).label('mean'),
+            func.percentile_cont(0.5).within_group(stay).label('median'),
+            func.percentile_cont(0.9).within_group(stay).label('p90'),
+            func.max(stay).label('longest'),
+            *bucket_counts
+        ).join(
+            Bed, Admission.bed_id == Bed.id
+        ).filter(
             Admission.status == AdmissionStatus.discharged,
-            func.cast(Admission.discharge_date, Date) >= start_date,
-            func.cast(Admission.discharge_date, Date) <= end_date,
-            Admission.discharge_date.isnot(None)
+            date_range_filter(Admission.discharge_date, start_date, end_date)
+        ).group_by(
+            func.rollup(Bed.room_number)
         ).all()
 
-        if discharged:
-            total_days = sum([
-                (adm.discharge_date - adm.admission_date).days
-                for adm in discharged
-            ])
-            avg_stay = total_days / len(discharged)
-        else:
-            avg_stay = 0
+        def summarize(row):
+            if row is None or not row.discharges:
+                return {
+                    'discharges': 0, 'mean': 0, 'median': 0, 'p90': 0, 'longest': 0,
+                    'buckets': {label: 0 for label, _, _ in STAY_BUCKETS}
+                }
+            return {
+                'discharges': row.discharges,
+                'mean': round(float(row.mean), 1),
+                'median': round(float(row.median), 1),
+                'p90': round(float(row.p90), 1),
+                'longest': int(row.longest),
+                'buckets': {
+                    label: getattr(row, f'bucket_{i}')
+                    for i, (label, _, _) in enumerate(STAY_BUCKETS)
+                }
+            }
+
+        overall = next((row for row in rows if row.is_total), None)
+        by_room = sorted((row for row in rows if not row.is_total), key=lambda row: row.room_number)
 
         return {
-            'active_admissions': active,
-            'total_in_period': admissions_in_period,
-            'avg_stay_duration': round(avg_stay, 1)
+            'overall': summarize(overall),
+            'by_room': [dict(summarize(row), room=row.room_number) for row in by_room],
+            'bucket_labels': [label for label, _, _ in STAY_BUCKETS]
         }
 
     # ========================================================================
@@ -360,10 +451,9 @@ class StatsService:
     # ========================================================================
 
     @staticmethod
+    @cached_stats(tags=('invoices',))
     def get_top_services(limit=10, start_date=None, end_date=None):
         """Get most used services for date range"""
-        from app.models import InvoiceItem
-
         now = datetime.now()
 
         if not start_date:
@@ -371,50 +461,104 @@ class StatsService:
         if not end_date:
             end_date = now.date()
 
+        usage_count = func.sum(DailyServiceUsage.usage_count)
         results = db.session.query(
-            InvoiceItem.service_name,
-            func.count(InvoiceItem.id).label('usage_count'),
-            func.sum(InvoiceItem.cost * InvoiceItem.quantity).label('revenue')
-        ).join(
-            Invoice, InvoiceItem.invoice_id == Invoice.id
+            DailyServiceUsage.service_name,
+            usage_count.label('usage_count'),
+            func.sum(DailyServiceUsage.revenue).label('revenue')
         ).filter(
-            func.cast(Invoice.created_at, Date) >= start_date,
-            func.cast(Invoice.created_at, Date) <= end_date
+            DailyServiceUsage.day.between(start_date, end_date)
         ).group_by(
-            InvoiceItem.service_name
+            DailyServiceUsage.service_name
         ).order_by(
-            func.count(InvoiceItem.id).desc()
+            usage_count.desc()
         ).limit(limit).all()
 
         return [{
             'service_name': r.service_name,
-            'usage_count': r.usage_count,
+            'usage_count': int(r.usage_count),
             'total_revenue': float(r.revenue)
         } for r in results]
 
+    # ========================================================================
+    # INVOICE LIST SUMMARY
+    # ========================================================================
+
+    @staticmethod
+    @cached_stats(timeout_minutes=1, tags=('invoices',))
+    def get_invoice_summary():
+        """
+        Number and total amount of invoices per status, from one GROUP BY
+        pass. Committed invoice writes (create, pay, cancel) invalidate it
+        at once in this process, other processes within a minute.
+        Returns {status value: {'count': int, 'amount': Decimal}}.
+        """
+        rows = db.session.query(
+            Invoice.status,
+            func.count(Invoice.id),
+            func.coalesce(func.sum(Invoice.total_amount), 0)
+        ).group_by(Invoice.status).all()
+
+        summary = {status.value: {'count': 0, 'amount': Decimal('0')} for status in InvoiceStatus}
+        for status, count, amount in rows:
+            summary[status.value] = {'count': count, 'amount': amount}
+        return summary
+
+    # ========================================================================
+    # MAIN DASHBOARD COUNTERS
+    # ========================================================================
+
+    @staticmethod
+    @cached_stats(timeout_minutes=1, tags=('patients', 'appointments'))
+    def get_home_counters():
+        """
+        Counters of the main dashboard in one round trip (each count is an
+        index-backed scalar subquery). Cached briefly: writes in this
+        process invalidate it at once, other processes within a minute.
+        """
+        today = date.today()
+        total_patients = db.session.query(func.count(Patient.id)).scalar_subquery()
+        today_appointments = db.session.query(func.count(Appointment.id)).filter(
+            on_date_filter(Appointment.date_time, today)
+        ).scalar_subquery()
+        pending_appointments = db.session.query(func.count(Appointment.id)).filter(
+            Appointment.status == AppointmentStatus.pending
+        ).scalar_subquery()
+
+        row = db.session.query(
+            total_patients.label('total_patients'),
+            today_appointments.label('today_appointments'),
+            pending_appointments.label('pending_appointments')
+        ).one()
+        return row._asdict()
+
     # ========================================================================
     # COMPREHENSIVE DASHBOARD DATA
     # ========================================================================
 
     @staticmethod
     def get_dashboard_stats(start_date=None, end_date=None):
-        """Get comprehensive statistics for dashboard with date filtering"""
-        return {
+        """
+        Get comprehensive statistics for dashboard with date filtering.
+        The sections are independent and run concurrently (STATS_MAX_WORKERS).
+        """
+        return run_parallel({
             # Filtered by date range
-            'revenue': StatsService.get_revenue_stats(start_date, end_date),
-            'patients': StatsService.get_patient_stats(start_date, end_date),
-            'appointments': StatsService.get_appointment_stats(start_date, end_date),
-            'appointments_by_doctor': StatsService.get_appointments_by_doctor(start_date, end_date),
-            'admissions': StatsService.get_admission_stats(start_date, end_date),
-            'top_services': StatsService.get_top_services(10, start_date, end_date),
+            'revenue': (StatsService.get_revenue_stats, (start_date, end_date)),
+            'patients': (StatsService.get_patient_stats, (start_date, end_date)),
+            'appointments': (StatsService.get_appointment_stats, (start_date, end_date)),
+            'appointments_by_doctor': (StatsService.get_appointments_by_doctor, (start_date, end_date)),
+            'admissions': (StatsService.get_admission_stats, (start_date, end_date)),
+            'length_of_stay': (StatsService.get_length_of_stay_stats, (start_date, end_date)),
+            'top_services': (StatsService.get_top_services, (10, start_date, end_date)),
 
             # Always 12-month trends (not filtered)
-            'revenue_by_month': StatsService.get_revenue_by_month(12),
-            'patients_by_month': StatsService.get_patients_by_month(12),
+            'revenue_by_month': (StatsService.get_revenue_by_month, (12,)),
+            'patients_by_month': (StatsService.get_patients_by_month, (12,)),
 
             # Real-time status (not filtered)
-            'bed_occupancy': StatsService.get_bed_occupancy(),
-        }
+            'bed_occupancy': (StatsService.get_bed_occupancy, ()),
+        })
 
     # ========================================================================
     # HELPER METHODS
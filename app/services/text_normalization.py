@@ -0,0 +1,30 @@
+# app/services/text_normalization.py
+
+import re
+
+# Harakat (fathatan .. sukun), superscript alef and tatweel
+_ARABIC_DIACRITICS = re.compile('[\u064B-\u0652\u0670\u0640]')
+
+_ARABIC_LETTER_MAP = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',  # Alef variants
+    'ى': 'ي', 'ی': 'ي', 'ئ': 'ي',            # Yaa variants
+    'ؤ': 'و',                                # Waw with hamza
+    'ة': 'ه',                                # Taa marbuta
+})
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_arabic(text):
+    """
+    Normalize Arabic text for searching.
+
+    Strips diacritics and tatweel, folds alef/yaa/taa-marbuta variants to a
+    single form, lowercases Latin characters and collapses whitespace, so
+    'فاطمة' and 'فَاطِمه' normalize to the same string.
+    """
+    if not text:
+        return ''
+    text = _ARABIC_DIACRITICS.sub('', text)
+    text = text.translate(_ARABIC_LETTER_MAP)
+    return _WHITESPACE.sub(' ', text).strip().lower()
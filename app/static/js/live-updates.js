@@ -0,0 +1,93 @@
+// Live dashboard updates from the /events server-sent events stream.
+// Every event carries a row's state before ('old') and after ('new') a change,
+// so a counter defined by a predicate moves by match(new) - match(old).
+function initLiveUpdates(options) {
+    if (options.enabled === false || !window.EventSource) {
+        return null;
+    }
+
+    const counters = options.counters || {};
+    const handlers = options.handlers || {};
+    const types = new Set(Object.keys(handlers));
+    Object.values(counters).forEach(function(counter) {
+        types.add(counter.type);
+    });
+
+    function counts(counter, state) {
+        return state && counter.match(state) ? 1 : 0;
+    }
+
+    function applyCounters(change) {
+        let changed = false;
+        Object.keys(counters).forEach(function(name) {
+            const counter = counters[name];
+            if (counter.type !== change.type) {
+                return;
+            }
+            const delta = counts(counter, change.new) - counts(counter, change.old);
+            if (!delta) {
+                return;
+            }
+            document.querySelectorAll('[data-live-counter="' + name + '"]').forEach(function(el) {
+                el.textContent = parseInt(el.textContent, 10) + delta;
+            });
+            changed = true;
+        });
+        if (changed && options.onCountersChanged) {
+            options.onCountersChanged();
+        }
+    }
+
+    let url = options.url;
+    if (options.since) {
+        url += (url.indexOf('?') === -1 ? '?' : '&') + 'since=' + encodeURIComponent(options.since);
+    }
+    const source = new EventSource(url);
+
+    types.forEach(function(type) {
+        source.addEventListener(type, function(e) {
+            const change = JSON.parse(e.data);
+            applyCounters(change);
+            if (handlers[type]) {
+                handlers[type](change);
+            }
+        });
+    });
+
+    // Changes were missed (buffer overrun, or a cursor this server process
+    // cannot place); only a reload is accurate
+    source.addEventListener('resync', function() {
+        source.close();
+        location.reload();
+    });
+
+    return source;
+}
+
+// Replace a badge's colour class and text
+function setLiveBadge(el, badgeClass, text) {
+    if (!el) {
+        return;
+    }
+    el.className = el.className.replace(/\bbg-\S+/g, '').trim() + ' ' + badgeClass;
+    el.textContent = text;
+}
+
+// Show (once) a notice that the page has changes it cannot apply in place
+function showLiveReloadNotice(message) {
+    if (document.getElementById('liveReloadNotice')) {
+        return;
+    }
+    const notice = document.createElement('div');
+    notice.id = 'liveReloadNotice';
+    notice.className = 'alert alert-info d-flex justify-content-between align-items-center';
+    notice.innerHTML = '<span><i class="bi bi-arrow-repeat"></i> </span>' +
+        '<a href="#" class="btn btn-sm btn-primary">تحديث</a>';
+    notice.querySelector('span').append(message || 'توجد تحديثات جديدة.');
+    notice.querySelector('a').addEventListener('click', function(e) {
+        e.preventDefault();
+        location.reload();
+    });
+    const main = document.querySelector('main') || document.body;
+    main.insertBefore(notice, main.firstChild);
+}
@@ -0,0 +1,46 @@
+// Select2 patient picker backed by the paginated /patients/api/search endpoint.
+// The <select> only carries the selected patient; results are fetched as the user types.
+function initPatientLookup(selector, options) {
+    const $select = $(selector);
+    if (!$select.is('select')) {
+        return $select;
+    }
+
+    return $select.select2(Object.assign({
+        theme: 'bootstrap-5',
+        dir: 'rtl',
+        placeholder: 'ابحث عن المريض...',
+        allowClear: true,
+        width: '100%',
+        ajax: {
+            url: $select.data('lookup-url'),
+            dataType: 'json',
+            delay: 250,
+            data: function(params) {
+                return {
+                    q: params.term || '',
+                    page: params.page || 1
+                };
+            },
+            processResults: function(data) {
+                return {
+                    results: data.results.map(function(patient) {
+                        return { id: patient.id, text: patient.label };
+                    }),
+                    pagination: { more: data.more }
+                };
+            }
+        },
+        language: {
+            noResults: function() {
+                return 'لا توجد نتائج';
+            },
+            searching: function() {
+                return 'جاري البحث...';
+            },
+            loadingMore: function() {
+                return 'جاري تحميل المزيد...';
+            }
+        }
+    }, options || {}));
+}
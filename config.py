@@ -59,6 +59,77 @@ class Config:
     REMEMBER_COOKIE_HTTPONLY = True
     REMEMBER_COOKIE_SECURE = False
 
+    # Fail requests whose views exceed their @query_budget (enabled for tests)
+    QUERY_BUDGET_ENFORCED = False
+
+    # Seconds to keep authenticated principals in the process-local cache (0 disables)
+    PRINCIPAL_CACHE_TTL = int(os.environ.get('PRINCIPAL_CACHE_TTL', 0))
+
+    # Per-request SQL count/timing: Server-Timing header, log line and the
+    # admin histogram (rolling window of SQL_STATS_WINDOW requests per endpoint)
+    SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION', '1') == '1'
+    SQL_STATS_WINDOW = int(os.environ.get('SQL_STATS_WINDOW', 200))
+
+    # Statistics cache: 'memory' (per process, LRU bounded) or 'redis' (shared)
+    STATS_CACHE_ENABLED = True
+    STATS_CACHE_BACKEND = os.environ.get('STATS_CACHE_BACKEND', 'memory')
+    STATS_CACHE_MAX_ENTRIES = int(os.environ.get('STATS_CACHE_MAX_ENTRIES', 512))
+    # The memory backend keeps tag versions in the cache_tag_versions table
+    # so writes invalidate every worker process; each process rereads them
+    # at most this often, which bounds how long it may serve stale results
+    STATS_CACHE_VERSION_REFRESH_SECONDS = float(os.environ.get('STATS_CACHE_VERSION_REFRESH_SECONDS', 2))
+    STATS_CACHE_REDIS_URL = os.environ.get('STATS_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+    # Dashboard statistics computed concurrently, each on its own pooled
+    # connection; keep well below the engine pool size (1 runs them in series)
+    STATS_MAX_WORKERS = int(os.environ.get('STATS_MAX_WORKERS', 4))
+
+    # Live dashboard updates (server-sent events at /events). On PostgreSQL
+    # changes travel through LISTEN/NOTIFY on this channel to every process.
+    # Off by default: every open dashboard tab keeps a stream (and, with
+    # sync workers, a whole worker) busy. Enable it only when serving with
+    # gevent/eventlet workers (gunicorn -k gevent) or from a separate
+    # process for /events.
+    LIVE_EVENTS_ENABLED = os.environ.get('LIVE_EVENTS_ENABLED', '0') == '1'
+    LIVE_EVENTS_CHANNEL = 'hospital_events'
+    LIVE_EVENTS_BUFFER = 256  # Recent events kept for reconnecting streams
+    LIVE_EVENTS_HEARTBEAT = 15  # Seconds between keepalive comments
+    # Each stream is closed after this long and the browser reconnects,
+    # so a stream never ties up a server worker indefinitely
+    LIVE_EVENTS_STREAM_SECONDS = 300
+
+    # Background report jobs (run by `flask --app run worker` or `python run.py worker`)
+    JOB_RESULTS_FOLDER = os.path.join(basedir, 'job_results')
+    JOB_RESULT_MAX_AGE = 600  # Seconds a finished result is reused for identical requests
+    JOB_RESULT_RETENTION_DAYS = 7
+    JOB_HEARTBEAT_SECONDS = 60  # How often a running job records that its worker is alive
+    JOB_STALE_AFTER = 600  # Seconds without a heartbeat before a running job is assumed abandoned
+    JOB_MAX_ATTEMPTS = 3
+    # Report dashboard ranges longer than this many days are computed by the
+    # worker. 0 (default) computes every range in the request; only enable
+    # this when a worker process runs next to the web server
+    REPORT_ASYNC_DAYS = int(os.environ.get('REPORT_ASYNC_DAYS', 0))
+
+    # List pages show planner estimates of their row count (keyset pagination
+    # needs no COUNT(*)); below this many rows the exact count is shown
+    PAGINATION_EXACT_COUNT_BELOW = 1000
+
+    # Seconds browsers may reuse conditional JSON responses without revalidating
+    JSON_CACHE_MAX_AGE = int(os.environ.get('JSON_CACHE_MAX_AGE', 0))
+
+    # Appointment scheduling
+    APPOINTMENT_DEFAULT_MINUTES = 30
+    SCHEDULE_SLOT_MINUTES = 15  # Step between candidate start times
+    SCHEDULE_SEARCH_DAYS = 14  # How far ahead free slots are searched
+    SERIES_MAX_OCCURRENCES = 52  # Appointments per recurring series
+    # Shifts enforced for doctors with no doctor_working_hours rows, by
+    # weekday (0 = Monday ... 6 = Sunday), e.g. Sunday to Thursday 08:00-16:00:
+    # {weekday: [('08:00', '16:00')] for weekday in (6, 0, 1, 2, 3)}.
+    # None: their bookings are not checked against working hours.
+    DEFAULT_WORKING_HOURS = None
+    # Daily window searched for free slots of doctors without working hours
+    SCHEDULE_SEARCH_HOURS = ('08:00', '16:00')
+
     @staticmethod
     def init_app(app):
         """Initialize application configuration"""
@@ -68,7 +139,7 @@ class Config:
 class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
-    SQLALCHEMY_ECHO = True
+    SQLALCHEMY_ECHO = os.environ.get('SQLALCHEMY_ECHO') == '1'
     TESTING = False
 
 
@@ -117,6 +188,7 @@ class TestingConfig(Config):
 
     SQLALCHEMY_DATABASE_URI = get_test_database_uri.__func__()
     WTF_CSRF_ENABLED = False
+    QUERY_BUDGET_ENFORCED = True
 
 
 # Configuration dictionary
@@ -9,6 +9,8 @@ app = create_app()
 with app.app_context():
     # Create all tables using SQLAlchemy
     print('Creating tables via SQLAlchemy...')
+    from app.services.indexes import ensure_extensions
+    ensure_extensions()
     db.create_all()
 
     # ========================================================================
@@ -23,9 +25,13 @@ with app.app_context():
             name VARCHAR(50) UNIQUE NOT NULL,
             description VARCHAR(255),
             is_system_role BOOLEAN DEFAULT FALSE,
+            permissions_version INTEGER DEFAULT 0 NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     """))
+    db.session.execute(text(
+        "ALTER TABLE roles ADD COLUMN IF NOT EXISTS permissions_version INTEGER DEFAULT 0 NOT NULL"
+    ))
 
     # 2. Permissions table
     print('Creating permissions table...')
@@ -75,6 +81,7 @@ with app.app_context():
             id SERIAL PRIMARY KEY,
             file_number VARCHAR(20) UNIQUE NOT NULL,
             full_name VARCHAR(200) NOT NULL,
+            search_name VARCHAR(200),
             phone VARCHAR(20),
             gender VARCHAR(1),
             dob DATE,
@@ -84,6 +91,12 @@ with app.app_context():
         )
     """))
     db.session.execute(text("CREATE INDEX IF NOT EXISTS idx_patients_file_number ON patients(file_number)"))
+    db.session.execute(text("ALTER TABLE patients ADD COLUMN IF NOT EXISTS search_name VARCHAR(200)"))
+    # Patients written before the column existed are only found by name once filled
+    from app.services.patient_search import rebuild_search_names
+    backfilled = rebuild_search_names(missing_only=True)
+    if backfilled:
+        print(f'✓ Filled search names of {backfilled} patients')
 
     # 6. Appointments table
     print('Creating appointments table...')
@@ -96,10 +109,33 @@ with app.app_context():
             status VARCHAR(20) DEFAULT 'pending' NOT NULL,
             type VARCHAR(20) DEFAULT 'scheduled',
             notes TEXT,
+            duration_minutes INTEGER DEFAULT 30 NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     """))
     db.session.execute(text("CREATE INDEX IF NOT EXISTS idx_appointments_date_time ON appointments(date_time)"))
+    db.session.execute(text(
+        "ALTER TABLE appointments ADD COLUMN IF NOT EXISTS duration_minutes INTEGER DEFAULT 30 NOT NULL"
+    ))
+    # No two open appointments of a doctor may overlap (needs btree_gist).
+    # Existing overlapping bookings must be resolved before it can be added.
+    db.session.execute(text("""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_constraint WHERE conname = 'ex_appointments_doctor_overlap'
+            ) THEN
+                ALTER TABLE appointments ADD CONSTRAINT ex_appointments_doctor_overlap
+                    EXCLUDE USING gist (
+                        doctor_id WITH =,
+                        tsrange(date_time, date_time + duration_minutes * interval '1 minute') WITH &&
+                    ) WHERE (status IN ('pending', 'confirmed'));
+            END IF;
+        EXCEPTION WHEN exclusion_violation THEN
+            RAISE WARNING 'ex_appointments_doctor_overlap not added: overlapping open appointments exist';
+        END
+        $$
+    """))
 
     # 7. Medical Visits table
     print('Creating medical_visits table...')
@@ -178,10 +214,120 @@ with app.app_context():
         )
     """))
 
+    # 13. Daily report rollups (maintained by app.services.rollups)
+    print('Creating daily rollup tables...')
+    db.session.execute(text("""
+        CREATE TABLE IF NOT EXISTS daily_revenue (
+            day DATE NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            invoice_count INTEGER DEFAULT 0 NOT NULL,
+            total_amount NUMERIC(14, 2) DEFAULT 0 NOT NULL,
+            PRIMARY KEY (day, status)
+        )
+    """))
+    db.session.execute(text("""
+        CREATE TABLE IF NOT EXISTS daily_appointments (
+            day DATE NOT NULL,
+            doctor_id INTEGER REFERENCES users(id) NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            count INTEGER DEFAULT 0 NOT NULL,
+            PRIMARY KEY (day, doctor_id, status)
+        )
+    """))
+    db.session.execute(text("""
+        CREATE TABLE IF NOT EXISTS daily_activity (
+            day DATE PRIMARY KEY,
+            new_patients INTEGER DEFAULT 0 NOT NULL,
+            admissions INTEGER DEFAULT 0 NOT NULL,
+            discharges INTEGER DEFAULT 0 NOT NULL,
+            discharged_stay_days INTEGER DEFAULT 0 NOT NULL
+        )
+    """))
+    db.session.execute(text("""
+        CREATE TABLE IF NOT EXISTS daily_service_usage (
+            day DATE NOT NULL,
+            service_name VARCHAR(200) NOT NULL,
+            usage_count INTEGER DEFAULT 0 NOT NULL,
+            revenue NUMERIC(14, 2) DEFAULT 0 NOT NULL,
+            PRIMARY KEY (day, service_name)
+        )
+    """))
+    # New (empty) rollups would show zeros for all existing history
+    from app.services import rollups
+    if rollups.is_empty():
+        written = rollups.backfill()
+        if any(written.values()):
+            print('✓ Backfilled rollups: ' + ', '.join(f'{fact} {rows} rows' for fact, rows in written.items()))
+
+    # 14. Background report jobs
+    print('Creating report_jobs table...')
+    db.session.execute(text("""
+        CREATE TABLE IF NOT EXISTS report_jobs (
+            id SERIAL PRIMARY KEY,
+            kind VARCHAR(50) NOT NULL,
+            params JSON NOT NULL,
+            params_key VARCHAR(500) NOT NULL,
+            status VARCHAR(20) DEFAULT 'queued' NOT NULL,
+            requested_by INTEGER REFERENCES users(id) NOT NULL,
+            attempts INTEGER DEFAULT 0 NOT NULL,
+            error TEXT,
+            result_path VARCHAR(500),
+            result_filename VARCHAR(200),
+            result_mimetype VARCHAR(100),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
+            started_at TIMESTAMP,
+            heartbeat_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    """))
+    db.session.execute(text("ALTER TABLE report_jobs ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP"))
+    # Older databases may hold duplicate open jobs, which would block the
+    # unique index on open (kind, params_key); keep the oldest of each
+    db.session.execute(text("""
+        UPDATE report_jobs SET status = 'failed', error = 'Duplicate of an open job',
+            finished_at = CURRENT_TIMESTAMP
+        WHERE status IN ('queued', 'running')
+          AND id NOT IN (
+              SELECT min(id) FROM report_jobs
+              WHERE status IN ('queued', 'running')
+              GROUP BY kind, params_key
+          )
+    """))
+
+    # 15. Doctor working hours
+    print('Creating doctor_working_hours table...')
+    db.session.execute(text("""
+        CREATE TABLE IF NOT EXISTS doctor_working_hours (
+            id SERIAL PRIMARY KEY,
+            doctor_id INTEGER REFERENCES users(id) ON DELETE CASCADE NOT NULL,
+            weekday SMALLINT NOT NULL,
+            start_time TIME NOT NULL,
+            end_time TIME NOT NULL,
+            CONSTRAINT ck_working_hours_weekday CHECK (weekday BETWEEN 0 AND 6),
+            CONSTRAINT ck_working_hours_order CHECK (start_time < end_time)
+        )
+    """))
+
+    # 16. Statistics cache tag versions
+    print('Creating cache_tag_versions table...')
+    db.session.execute(text("""
+        CREATE TABLE IF NOT EXISTS cache_tag_versions (
+            tag VARCHAR(100) PRIMARY KEY,
+            version BIGINT DEFAULT 0 NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL
+        )
+    """))
+
     # Commit structure changes
     db.session.commit()
     print('✓ All tables created successfully')
 
+    # Composite and partial indexes declared on the models
+    print('Creating indexes...')
+    from app.services.indexes import ensure_indexes
+    ensure_indexes()
+    print('✓ Indexes created')
+
     # ========================================================================
     # SEED DATA
     # ========================================================================
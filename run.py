@@ -1,4 +1,6 @@
 import os
+import sys
+import click
 from app import create_app, db
 from app.models import User, Role, Patient, Appointment, Service, Bed, Invoice
 
@@ -27,5 +29,19 @@ def test():
     tests = unittest.TestLoader().discover('tests')
     unittest.TextTestRunner(verbosity=2).run(tests)
 
+@app.cli.command()
+@click.option('--poll-interval', default=2.0, help='Seconds to wait when the queue is empty')
+@click.option('--once', is_flag=True, help='Exit when the queue is empty')
+def worker(poll_interval, once):
+    """Run the background report job worker"""
+    from app.services.jobs import run_worker
+    click.echo('⚙️  Report job worker started')
+    run_worker(poll_interval=poll_interval, once=once, log=click.echo)
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
+    if sys.argv[1:2] == ['worker']:
+        from app.services.jobs import run_worker
+        with app.app_context():
+            run_worker()
+    else:
+        app.run(host='0.0.0.0', port=5000)
@@ -483,7 +483,7 @@ def assign_role_permissions():
             continue
 
         # Clear existing permissions
-        role.permissions = []
+        role.set_permissions([])
 
         assigned_count = 0
         missing_perms = []